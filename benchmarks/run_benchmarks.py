@@ -0,0 +1,320 @@
+#!/bin/env python
+
+"""Benchmarks of the hot paths on synthetic routes and weather
+
+Usage:
+
+    python benchmarks/run_benchmarks.py [--scales small medium]
+        [--output results.json] [--check] [--update-baselines]
+
+The results (best time in seconds over the repeats) are written as
+json, together with the time of a fixed reference workload measured
+in the same run (see reference).
+
+The baselines (benchmarks/baselines.json) store the benchmark times
+relative to the reference time, so they can be compared across
+machines. With --check the relative times are compared with the
+baselines and the exit code is non-zero in case a benchmark is slower
+than the baseline by more than the threshold. Baselines made with
+another backend of the plan integration (numba or numpy) are not
+compared.
+
+The baselines are regenerated after an intended change of the
+performance by:
+
+    python benchmarks/run_benchmarks.py --scales small medium --update-baselines
+
+"""
+
+import os, sys, json, time, argparse, tempfile, platform, shutil, datetime
+import math, sqlite3
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import generate_gpx, generate_weather_db, Synthetic_Provider
+
+from route import Route
+from historical_weather import Historical_Weather
+from weather_provider import Recording_Provider, Replay_Provider
+from iterators import Iter_Historical_Weather
+from physical_models import Plan_With_Constant_Power
+import integrator
+from trip_characteristics import Trip_Characteristics
+from weather_archive import Weather_Archive
+from monte_carlo import Monte_Carlo_Trip_Time
+
+# route length (m), point spacing (m), number of days
+SCALES = {'small':  {'length': 20000,  'spacing': 200, 'days': 5},
+          'medium': {'length': 100000, 'spacing': 100, 'days': 20},
+          'large':  {'length': 200000, 'spacing': 100, 'days': 50}}
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+
+def timeit(func, setup=None, repeat=3):
+    """Get the best time of running a function
+
+    :func: function to time, receives the result of setup
+
+    :setup: function preparing the argument of func (not timed)
+
+    :repeat: number of repeats
+
+    """
+    res = []
+    for i in range(repeat):
+        x = setup() if setup is not None else None
+        t = time.perf_counter()
+        func(x)
+        res += [time.perf_counter() - t]
+
+    return min(res)
+
+
+def reference(repeat=5):
+    """Get the time of the reference workload
+
+    The workload mixes the kinds of work of the benchmarks: a python
+    loop, numpy arithmetic and sqlite insertions and queries.
+
+    :repeat: number of repeats
+
+    """
+    x = np.random.RandomState(0).uniform(size=200000)
+
+    def workload(_):
+        s = 0.0
+        for v in x[:50000]:
+            s += math.sqrt(v)
+
+        np.cumsum(np.sin(np.sort(x)))
+
+        connection = sqlite3.connect(":memory:")
+        connection.execute("CREATE TABLE reference (value REAL)")
+        connection.executemany("INSERT INTO reference VALUES (?)",
+                               ((float(v),) for v in x[:50000]))
+        connection.execute("SELECT count(*), avg(value) FROM reference "
+                           "WHERE value < 0.5").fetchone()
+        connection.close()
+
+    return timeit(workload, repeat=repeat)
+
+
+def relative_times(results):
+    """Get benchmark times relative to the reference time
+
+    :results: results (see main)
+
+    returns dictionary with relative times by scale
+
+    """
+    return {scale: {name: t/results['reference'] for name, t in x.items()}
+            for scale, x in results['scales'].items()}
+
+
+def fetch_weather(filename, coordinates, days, provider):
+    """Query historical weather using a weather provider
+
+    :filename: path of the sqlite database (removed in case it exists)
+
+    :coordinates: pandas DataFrame with latitude and longitude columns
+
+    :days: number of days to query
+
+    :provider: weather provider
+
+    """
+    # the database and its write-ahead log
+    for x in [filename, filename + "-wal", filename + "-shm"]:
+        if os.path.exists(x):
+            os.remove(x)
+
+    hw = Historical_Weather(coordinates=coordinates,
+                            darksky_apikey=None,
+                            filename=filename,
+                            sample_size=days,
+                            sample_current_date=datetime.datetime(2019, 6, 1, 12),
+                            sample_seed=0,
+                            darkskyapi_calls_limit=float('inf'),
+                            weather_provider=provider)
+    hw.query_darksky_weather()
+
+    return hw
+
+
+def run_scale(directory, length, spacing, days, repeat=3):
+    """Run all benchmarks at a given scale
+
+    :directory: directory for the generated files
+
+    :length: route length (m)
+
+    :spacing: distance between route points (m)
+
+    :days: number of days in the weather database
+
+    returns dictionary with benchmark times
+
+    """
+    gpx = generate_gpx(os.path.join(directory, "route.gpx"),
+                       length=length, spacing=spacing)
+
+    def parsed_route():
+        x = Route(gpx)
+        x.get_coordinates()
+        return x
+
+    res = {}
+    res['parse_gpx'] = timeit(lambda x: x._parse_gpx(),
+                              setup=lambda: Route(gpx), repeat=repeat)
+    res['cluster_distance'] = timeit(lambda x: x.get_short_coordinates(),
+                                     setup=parsed_route, repeat=repeat)
+    res['cluster_grid'] = timeit(lambda x: x.get_short_coordinates(grid_resolution=0.05),
+                                 setup=parsed_route, repeat=repeat)
+
+    route = parsed_route()
+
+    # record synthetic weather and time storing of the replayed queries
+    recordings = os.path.join(directory, "recordings")
+    fetch_weather(os.path.join(directory, "fetch.db"), route.get_short_coordinates(),
+                  days, Recording_Provider(recordings, Synthetic_Provider()))
+    res['fetch_replay'] = timeit(
+        lambda x: fetch_weather(os.path.join(directory, "fetch.db"),
+                                route.get_short_coordinates(), days,
+                                Replay_Provider(recordings)),
+        repeat=1)
+
+    hw = generate_weather_db(os.path.join(directory, "route_weather.db"),
+                             route.get_short_coordinates(), n_days=days)
+
+    ihw = Iter_Historical_Weather(hw)
+    date = ihw.get_dates()[0]
+    weather = ihw.query_date(date)
+
+    plan = Plan_With_Constant_Power(7, route, hw, None)
+
+    res['query_complete_days'] = timeit(lambda x: hw.complete_days(), repeat=repeat)
+    res['query_weather_day'] = timeit(lambda x: ihw.query_date(date), repeat=repeat)
+    res['query_weather_all'] = timeit(lambda x: hw.query_local_weather(), repeat=repeat)
+    archive = os.path.join(directory, "archive")
+    res['archive_write'] = timeit(lambda x: Weather_Archive(archive).write(hw), repeat=repeat)
+    res['archive_open'] = timeit(lambda x: Weather_Archive(archive).open(), repeat=repeat)
+    res['archive_weather_day'] = timeit(lambda x: x.get_weather(0),
+                                        setup=lambda: Weather_Archive(archive).open(),
+                                        repeat=repeat)
+
+    res['compute_plan'] = timeit(lambda x: plan._compute_plan(weather), repeat=repeat)
+    res['monte_carlo_1000'] = timeit(
+        lambda x: Monte_Carlo_Trip_Time(plan, Weather_Archive(archive).open(), seed=0)\
+            .simulate(1000),
+        repeat=repeat)
+    res['compute_historical'] = timeit(
+        lambda x: Trip_Characteristics().compute_historical(plan, use_cache=False),
+        repeat=repeat)
+
+    return res
+
+
+def compare(results, baselines, threshold):
+    """Compare results with baselines
+
+    The times relative to the reference time are compared.
+
+    :results: results (see main)
+
+    :baselines: baselines, with times relative to the reference time
+
+    :threshold: maximal allowed ratio to the baseline
+
+    returns list of regressions (scale, benchmark, ratio)
+
+    """
+    relative = relative_times(results)
+
+    res = []
+    for scale, x in results['scales'].items():
+        for name, t in x.items():
+            b = baselines.get('scales', {}).get(scale, {}).get(name)
+            if b is None:
+                continue
+
+            ratio = relative[scale][name]/b
+            print("%-8s %-22s %10.4f s  %6.2fx baseline" % (scale, name, t, ratio),
+                  file=sys.stderr)
+            if ratio > threshold:
+                res += [(scale, name, ratio)]
+
+    return res
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="run biketour benchmarks")
+    parser.add_argument("--scales", nargs="+", default=["small","medium"],
+                        choices=list(SCALES.keys()))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=None,
+                        help="file to write the results to (default: stdout)")
+    parser.add_argument("--baselines", default=BASELINES)
+    parser.add_argument("--threshold", type=float, default=1.5,
+                        help="maximal allowed ratio to the baseline")
+    parser.add_argument("--check", action="store_true",
+                        help="compare with the baselines, the exit code is "
+                        "non-zero in case of regressions")
+    parser.add_argument("--update-baselines", action="store_true")
+    args = parser.parse_args(argv)
+
+    results = {'python': platform.python_version(),
+               'machine': platform.machine(),
+               'numba': integrator.is_available(),
+               'reference': reference(),
+               'scales': {}}
+
+    directory = tempfile.mkdtemp(prefix="biketour_bench_")
+    try:
+        for scale in args.scales:
+            print("Running benchmarks, scale: " + scale, file=sys.stderr)
+            results['scales'][scale] = run_scale(directory, repeat=args.repeat,
+                                                 **SCALES[scale])
+    finally:
+        shutil.rmtree(directory)
+
+    if args.output is None:
+        print(json.dumps(results, indent=2))
+    else:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baselines:
+        baselines = {}
+        if os.path.exists(args.baselines):
+            with open(args.baselines) as f:
+                baselines = json.load(f)
+        baselines.update({k: v for k, v in results.items() if k != 'scales'})
+        baselines.setdefault('scales', {}).update(relative_times(results))
+        with open(args.baselines, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        return 0
+
+    if not args.check or not os.path.exists(args.baselines):
+        return 0
+
+    with open(args.baselines) as f:
+        baselines = json.load(f)
+
+    if baselines.get('numba') != results['numba']:
+        print("Baselines are made with another backend, not compared",
+              file=sys.stderr)
+        return 0
+
+    regressions = compare(results, baselines, args.threshold)
+
+    for x in regressions:
+        print("Regression: %s %s is %.2fx slower than baseline" % x, file=sys.stderr)
+
+    return 1 if len(regressions) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
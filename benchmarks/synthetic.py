@@ -0,0 +1,176 @@
+#!/bin/env python
+
+"""Generators of synthetic routes and weather databases
+
+The generated data is deterministic for a given seed, so that
+benchmarks can be repeated offline without a darksky API key.
+
+"""
+
+import os, sys, math, datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "biketour"))
+
+from historical_weather import Historical_Weather
+from weather_provider import Recorded_Response
+
+import numpy as np
+import pandas as pd
+
+
+def generate_gpx(filename, length=100000, spacing=100,
+                 start=(50.77, 6.08), seed=0):
+    """Generate a gpx file with a meandering route
+
+    :filename: path of the gpx file
+
+    :length: length of the route (in meters)
+
+    :spacing: distance between consecutive points (in meters)
+
+    :start: starting coordinate (latitude, longitude)
+
+    :seed: random seed
+
+    """
+    rng = np.random.RandomState(seed)
+    n = int(length // spacing) + 1
+
+    # slowly changing bearing and elevation
+    bearing = 260 + np.cumsum(rng.normal(0, 3, n))
+    elevation = 100 + np.cumsum(rng.normal(0, 0.5, n))
+
+    dlat = spacing*np.cos(np.radians(bearing))/111320
+    lat = start[0] + np.concatenate([[0], np.cumsum(dlat[1:])])
+    dlon = spacing*np.sin(np.radians(bearing))/(111320*np.cos(np.radians(lat)))
+    lon = start[1] + np.concatenate([[0], np.cumsum(dlon[1:])])
+
+    with open(filename, "w") as f:
+        f.write('<?xml version="1.0"?>\n'
+                '<gpx xmlns="http://www.topografix.com/GPX/1/1"><rte>\n')
+        for x in zip(lat, lon, elevation):
+            f.write('<rtept lat="%.6f" lon="%.6f"><ele>%.1f</ele></rtept>\n' % x)
+        f.write('</rte></gpx>\n')
+
+    return filename
+
+
+def _weather_at_day(coord, time, rng):
+    """Generate hourly weather during the day of the given time
+
+    :coord: coordinate (latitude, longitude)
+
+    :time: time (seconds since epoch) within the day
+
+    :rng: random generator
+
+    returns list of dictionaries with darksky-like hourly data
+
+    """
+    midnight = datetime.datetime.combine(
+        datetime.datetime.fromtimestamp(time).date(), datetime.time())
+    midnight = int(midnight.timestamp())
+
+    wind_speed = rng.uniform(1, 8)
+    wind_bearing = rng.uniform(0, 360)
+    temperature = rng.uniform(0, 25)
+
+    res = []
+    for hour in range(24):
+        rain = rng.uniform() < 0.2
+        res += [{'time': midnight + hour*3600,
+                 'summary': "Rain" if rain else "Clear",
+                 'icon': "rain" if rain else "clear-day",
+                 'precipIntensity': rng.uniform(0, 2) if rain else 0,
+                 'precipProbability': rng.uniform(0.3, 1) if rain else 0,
+                 'precipType': "rain" if rain else None,
+                 'temperature': temperature + 5*math.sin(math.pi*(hour - 9)/12),
+                 'apparentTemperature': temperature - 1,
+                 'dewPoint': temperature - 5,
+                 'humidity': rng.uniform(0.4, 0.95),
+                 'pressure': rng.uniform(990, 1030),
+                 'windSpeed': max(0, wind_speed + rng.normal(0, 1)),
+                 'windGust': wind_speed + 3,
+                 'windBearing': (wind_bearing + rng.normal(0, 20)) % 360,
+                 'cloudCover': rng.uniform(),
+                 'uvIndex': rng.randint(0, 8),
+                 'visibility': rng.uniform(5, 16),
+                 'ozone': rng.uniform(250, 350)}]
+
+    return res
+
+
+class Synthetic_Provider(object):
+    """Weather provider generating synthetic weather
+
+    See weather_provider for the provider interface.
+
+    """
+
+    def __init__(self, seed=0):
+        """Initialise class
+
+        :seed: random seed
+
+        """
+        self._rng = np.random.RandomState(seed)
+
+    def forecast(self, key, latitude, longitude, time=None, units="si"):
+        if time is None:
+            time = datetime.datetime.now().timestamp()
+
+        return Recorded_Response(
+            {'hourly': {'data': _weather_at_day((latitude, longitude), int(time), self._rng)},
+             'daily': {'data': []}},
+            {})
+
+
+def generate_weather_db(filename, coordinates, n_days=50, seed=0):
+    """Generate a populated historical weather database
+
+    The database is created with Historical_Weather (so it has the
+    same schema and sample of days) and every sampled day is filled
+    with synthetic hourly weather at all coordinates.
+
+    :filename: path of the sqlite database
+
+    :coordinates: pandas DataFrame with latitude and longitude columns
+
+    :n_days: number of sampled days
+
+    :seed: random seed
+
+    returns Historical_Weather object
+
+    """
+    # the database and its write-ahead log
+    for x in [filename, filename + "-wal", filename + "-shm"]:
+        if os.path.exists(x):
+            os.remove(x)
+
+    hw = Historical_Weather(coordinates=coordinates,
+                            darksky_apikey=None,
+                            filename=filename,
+                            sample_size=n_days,
+                            sample_current_date=datetime.datetime(2019, 6, 1, 12),
+                            sample_seed=seed)
+
+    rng = np.random.RandomState(seed)
+    columns = hw._get_db_columns()[1:]
+
+    rows = []
+    for time, lat, lon, _ in hw._read_query_dates_from_db():
+        for item in _weather_at_day((lat, lon), time, rng):
+            rows += [[lat, lon] + [item.get(x) for x in columns[2:]]]
+
+    hw._dbconn.executemany('''
+    INSERT OR REPLACE INTO weather
+    (''' + ", ".join(columns) + ''')
+    VALUES
+    (''' + ",".join("?"*len(columns)) + ''')
+    ''', rows)
+    hw._dbconn.execute('''UPDATE query_dates SET if_queried = 1''')
+    hw._update_time_keys(hw._dbconn.cursor())
+    hw._dbconn.commit()
+
+    return hw
@@ -0,0 +1,10 @@
+#!/bin/env python
+
+import os, sys
+
+# modules of biketour import each other by their plain names
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cli import main
+
+main()
@@ -0,0 +1,167 @@
+#!/bin/env python
+
+from iterators import Iter_Historical_Weather
+from trip_characteristics import Trip_Characteristics
+
+from scipy.stats import norm
+
+import numpy as np
+import pandas as pd
+import logging
+
+class Adaptive_Historical_Sampling(object):
+    """Query historical weather in batches of days until the trip time
+    distribution is stable
+
+    After each batch of days the trip time quantiles are recomputed
+    together with their confidence intervals. The sampling stops once
+    all confidence intervals are narrower than a given tolerance.
+
+    """
+
+    def __init__(self, plan,
+                 batch_size=25,
+                 quantiles=(0.1,0.5,0.9),
+                 tolerance=15*60,
+                 confidence=0.95,
+                 min_days=20):
+        """Initialise the class
+
+        :plan: plan object (e.g. Plan_With_Constant_Power). The order
+        in which days are queried is reproducible with the sample_seed
+        of the plan historical weather.
+
+        :batch_size: number of days to query in one batch
+
+        :quantiles: quantiles of the trip time to monitor
+
+        :tolerance: maximal width (in seconds) of the quantile
+        confidence intervals
+
+        :confidence: confidence level of the intervals
+
+        :min_days: minimal number of days before the stopping rule
+        is checked
+
+        """
+        self.plan = plan
+        self._batch_size = batch_size
+        self._quantiles = np.array(quantiles)
+        self._tolerance = tolerance
+        self._confidence = confidence
+        self._min_days = min_days
+
+        self._tc = Trip_Characteristics()
+
+        # trip times of the already computed days
+        self._times = {}
+
+    def _quantile_intervals(self, x):
+        """Compute quantiles and their distribution-free confidence
+        intervals
+
+        The intervals are given by order statistics, whose indices are
+        computed using the normal approximation of the binomial
+        distribution.
+
+        :x: array of trip times
+
+        returns pandas DataFrame with quantile, estimate, lower and
+        upper columns
+
+        """
+        x = np.sort(np.array(x, dtype=float))
+        n = len(x)
+        q = self._quantiles
+
+        if 0 == n:
+            return pd.DataFrame({'quantile': q,
+                                 'estimate': np.nan,
+                                 'lower': np.nan,
+                                 'upper': np.nan})
+
+        z = norm.ppf(0.5 + self._confidence/2)
+        h = z*np.sqrt(n*q*(1-q))
+
+        lower = np.clip(np.floor(n*q - h).astype(int), 0, n-1)
+        upper = np.clip(np.ceil(n*q + h).astype(int), 0, n-1)
+
+        return pd.DataFrame({'quantile': q,
+                             'estimate': np.quantile(x, q),
+                             'lower': x[lower],
+                             'upper': x[upper]})
+
+    def _update_times(self):
+        """Compute trip times for the new complete days
+
+        returns number of newly computed days
+
+        """
+        ihw = Iter_Historical_Weather(self.plan.hw)
+
+        n = 0
+        for date in ihw.get_dates():
+            if date in self._times:
+                continue
+
+            try:
+                plan = self.plan._compute_plan(ihw.query_date(date))
+            except TypeError as e:
+                logging.warning("Skipping a day with incomplete weather: " + str(e))
+                continue
+
+            self._times[date] = self._tc._compute_journey_time(plan)
+            n += 1
+
+        return n
+
+    def is_converged(self):
+        """Check whether the quantile confidence intervals are within
+        the tolerance
+
+        """
+        if len(self._times) < max(self._min_days,1):
+            return False
+
+        x = self._quantile_intervals(list(self._times.values()))
+
+        return bool(((x['upper'] - x['lower']) < self._tolerance).all())
+
+    def run(self):
+        """Query batches of days until the trip time quantiles converge
+
+        The sampling also stops once all sampled days are queried, or
+        in case the API limit is reached.
+
+        returns pandas DataFrame with the quantile estimates and
+        confidence intervals
+
+        """
+        self._update_times()
+
+        while not self.is_converged():
+            logging.info("Adaptive sampling, days computed: " + str(len(self._times)))
+
+            if not self.plan.hw.query_darksky_weather(max_days=self._batch_size):
+                self._update_times()
+                break
+
+            if 0 == self._update_times():
+                break
+
+        return self.get_quantiles()
+
+    def get_quantiles(self):
+        """Get the current trip time quantiles
+
+        """
+        return self._quantile_intervals(list(self._times.values()))
+
+    def get_times(self):
+        """Get trip times of the computed days
+
+        returns pandas DataFrame with date and time columns
+
+        """
+        return pd.DataFrame([("%04d-%02d-%02d" % x, t) for x, t in self._times.items()],
+                            columns=['date','time'])
@@ -0,0 +1,421 @@
+#!/bin/env python
+
+import logging, json, hashlib, os
+
+class Characteristics_Cache(object):
+    """Persistent cache of computed historical plan characteristics
+
+    The characteristics of every day are stored together with a
+    fingerprint of the weather used to compute them. A cached day is
+    valid as long as its weather fingerprint does not change.
+
+    The cache entries are keyed by the route, the physical parameters
+    of the plan, the departure hour and the model version.
+
+    For every key the numeric characteristics can be stored as a
+    sorted rank index (see build_rank_index), which allows to compute
+    the percentile rank of a new value with a single indexed query.
+
+    """
+
+    def __init__(self, store):
+        """Initialise class
+
+        :store: Weather_Store object (typically the store of the
+        historical weather). The cache is written by its writer
+        connection and read by its pool of read connections.
+
+        """
+        self._store = store
+        self.filename = store.filename
+
+        # database connection is opened on first use
+        self._connection = None
+
+    @property
+    def _dbconn(self):
+        """Database connection for writing
+
+        The database is initialised on first use.
+
+        """
+        if self._connection is None:
+            with self._store.write_lock:
+                if self._connection is None:
+                    # initialise database
+                    self._init_database()
+
+                    self._connection = self._store.connection
+
+        return self._connection
+
+    @property
+    def store(self):
+        """Weather store with the initialised database
+
+        """
+        self._dbconn
+
+        return self._store
+
+    def _init_database(self):
+        """Initialise the table with plan characteristics
+
+        """
+        connection = self._store.connection
+
+        try:
+            c = connection.execute('''BEGIN EXCLUSIVE''')
+
+            c.execute('''
+            CREATE TABLE IF NOT EXISTS plan_characteristics
+            (
+            id                  INTEGER PRIMARY KEY AUTOINCREMENT,
+            key                 VARCHAR(64) NOT NULL,
+            date                VARCHAR(32) NOT NULL,
+            fingerprint         VARCHAR(125) NOT NULL,
+            characteristics     TEXT NOT NULL,
+            CONSTRAINT uc_key_date UNIQUE (key, date)
+            )''')
+
+            c.execute('''
+            CREATE TABLE IF NOT EXISTS plan_aliases
+            (
+            alias               VARCHAR(64) PRIMARY KEY,
+            key                 VARCHAR(64) NOT NULL
+            )''')
+
+            c.execute('''
+            CREATE TABLE IF NOT EXISTS plan_rank_index
+            (
+            key                 VARCHAR(64) NOT NULL,
+            name                VARCHAR(64) NOT NULL,
+            value               REAL NOT NULL
+            )''')
+
+            c.execute('''
+            CREATE INDEX IF NOT EXISTS idx_plan_rank_index
+            ON plan_rank_index (key, name, value)
+            ''')
+
+            c.execute('''
+            CREATE TABLE IF NOT EXISTS plan_rank_index_state
+            (
+            key                 VARCHAR(64) PRIMARY KEY,
+            fingerprint         VARCHAR(125) NOT NULL
+            )''')
+
+            connection.commit()
+        except Exception as e:
+            logging.error("Error creating table (plan_characteristics): " + str(e))
+            connection.rollback()
+            raise e
+
+    def get_key(self, plan):
+        """Compute cache key of a plan
+
+        The key is registered under the plan alias (see get_alias),
+        so that cached characteristics can be found without parsing
+        the route.
+
+        :plan: plan object (e.g. Plan_With_Constant_Power)
+
+        """
+        x = json.dumps({'route': plan.route.get_hash(),
+                        'parameters': plan.get_parameters(),
+                        'departure_hour': plan.departure_hour,
+                        'model': type(plan).__name__,
+                        'model_version': plan.MODEL_VERSION},
+                       sort_keys=True)
+
+        key = hashlib.sha1(x.encode()).hexdigest()
+
+        alias = self.get_alias(plan.route.filename, plan.get_parameters(),
+                               plan.departure_hour, type(plan).__name__,
+                               plan.route.direction)
+
+        # the alias is written only in case it is new or refers to
+        # another key (e.g. after the model version changed)
+        if key != self.get_key_by_alias(alias):
+            self._save_alias(alias, key)
+
+        return key
+
+    def get_alias(self, route_file, parameters, departure_hour, model,
+                  direction="forward"):
+        """Compute plan alias
+
+        The alias identifies a plan by the route file (its path, size
+        and modification time) instead of the route content. It
+        refers to the key of the last computed plan characteristics.
+
+        :route_file: path to the gpx file
+
+        :parameters: dictionary with physical parameters of the plan
+
+        :departure_hour: departure hour
+
+        :model: name of the plan class
+
+        :direction: direction of riding the route (see Route.get_view)
+
+        """
+        x = os.stat(route_file)
+        x = {'route': os.path.abspath(route_file),
+             'route_size': x.st_size,
+             'route_mtime': x.st_mtime,
+             'parameters': {k: float(v) for k, v in parameters.items()},
+             'departure_hour': float(departure_hour),
+             'model': model}
+
+        # aliases of the forward plans are kept as they were
+        if "forward" != direction:
+            x['direction'] = direction
+
+        x = json.dumps(x, sort_keys=True)
+
+        return hashlib.sha1(x.encode()).hexdigest()
+
+    def _save_alias(self, alias, key):
+        """Save alias of the key
+
+        """
+
+        with self._store.write_lock:
+            # get cursor
+            c = self._dbconn.cursor()
+
+            # insert values to the database
+            try:
+                c.execute('''
+                INSERT OR REPLACE INTO plan_aliases
+                (alias, key)
+                VALUES (?,?)
+                ''', (alias, key))
+
+            except Exception as e:
+                logging.error("Error with db insertion into plan_aliases table: " + str(e))
+                self._dbconn.rollback()
+                raise e
+
+            # commit changes
+            self._dbconn.commit()
+
+    def get_key_by_alias(self, alias):
+        """Get key of the plan alias
+
+        :alias: plan alias (see get_alias)
+
+        returns key or None in case the alias is unknown
+
+        """
+
+        query_res = self.store.fetch('''
+        SELECT key
+        FROM plan_aliases
+        WHERE alias = ?
+        ''', (alias,))
+
+        return query_res[0][0] if len(query_res) else None
+
+    def _format_date(self, date):
+        """Format date as a string
+
+        :date: a tuple (year, month, day) or a string
+
+        """
+        if isinstance(date, str):
+            return date
+
+        return "%04d-%02d-%02d" % tuple(date)
+
+    def get(self, key, date, fingerprint):
+        """Get cached characteristics
+
+        :key: cache key (see get_key)
+
+        :date: date of the plan (tuple (year, month, day))
+
+        :fingerprint: fingerprint of the weather at that date
+
+        returns dictionary with characteristics, or None in case the
+        entry is missing or outdated
+
+        """
+
+        query_res = self.store.fetch('''
+        SELECT characteristics
+        FROM plan_characteristics
+        WHERE key = ? AND date = ? AND fingerprint = ?
+        ''', (key, self._format_date(date), str(fingerprint)))
+
+        if 0 == len(query_res):
+            return None
+
+        return json.loads(query_res[0][0])
+
+    def get_all(self, key):
+        """Get all cached characteristics of a plan
+
+        :key: cache key (see get_key)
+
+        returns list of dictionaries with characteristics
+
+        """
+
+        query_res = self.store.fetch('''
+        SELECT characteristics
+        FROM plan_characteristics
+        WHERE key = ?
+        ORDER BY date
+        ''', (key,))
+
+        return [json.loads(x[0]) for x in query_res]
+
+    def put(self, key, date, fingerprint, characteristics):
+        """Store characteristics in the cache
+
+        :key: cache key (see get_key)
+
+        :date: date of the plan (tuple (year, month, day))
+
+        :fingerprint: fingerprint of the weather at that date
+
+        :characteristics: dictionary with characteristics
+
+        """
+        x = json.dumps(characteristics, default=lambda x: x.item())
+
+        with self._store.write_lock:
+            # get cursor
+            c = self._dbconn.cursor()
+
+            # insert values to the database
+            try:
+                c.execute('''
+                INSERT OR REPLACE INTO plan_characteristics
+                (key, date, fingerprint, characteristics)
+                VALUES (?,?,?,?)
+                ''', (key, self._format_date(date), str(fingerprint), x))
+
+            except Exception as e:
+                logging.error("Error with db insertion into plan_characteristics table: " + str(e))
+                self._dbconn.rollback()
+                raise e
+
+            # commit changes
+            self._dbconn.commit()
+
+    def _characteristics_fingerprint(self, key):
+        """Get fingerprint of all cached characteristics of a plan
+
+        The fingerprint changes whenever a day is added or updated.
+
+        :key: cache key (see get_key)
+
+        """
+
+        query_res = self.store.fetch('''
+        SELECT count(*), max(id)
+        FROM plan_characteristics
+        WHERE key = ?
+        ''', (key,))[0]
+
+        return str(query_res[0]) + ":" + str(query_res[1])
+
+    def is_rank_index_valid(self, key):
+        """Check whether the rank index is up to date
+
+        :key: cache key (see get_key)
+
+        returns False in case the index is missing or the cached
+        characteristics changed after it was built
+
+        """
+
+        query_res = self.store.fetch('''
+        SELECT fingerprint
+        FROM plan_rank_index_state
+        WHERE key = ?
+        ''', (key,))
+
+        return 0 < len(query_res) and \
+            query_res[0][0] == self._characteristics_fingerprint(key)
+
+    def build_rank_index(self, key):
+        """Build the rank index from the cached characteristics
+
+        Every numeric characteristic of every cached day is stored as
+        a row of the index, which is sorted by (key, name, value).
+
+        :key: cache key (see get_key)
+
+        """
+        fingerprint = self._characteristics_fingerprint(key)
+
+        rows = []
+        for x in self.get_all(key):
+            for name, value in x.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                if value != value:
+                    continue
+                rows += [(key, name, float(value))]
+
+        with self._store.write_lock:
+            # get cursor
+            c = self._dbconn.cursor()
+
+            # replace the index in a single transaction
+            try:
+                c.execute('''
+                DELETE FROM plan_rank_index
+                WHERE key = ?
+                ''', (key,))
+
+                c.executemany('''
+                INSERT INTO plan_rank_index
+                (key, name, value)
+                VALUES (?,?,?)
+                ''', sorted(rows))
+
+                c.execute('''
+                INSERT OR REPLACE INTO plan_rank_index_state
+                (key, fingerprint)
+                VALUES (?,?)
+                ''', (key, fingerprint))
+
+            except Exception as e:
+                logging.error("Error with db insertion into plan_rank_index table: " + str(e))
+                self._dbconn.rollback()
+                raise e
+
+            # commit changes
+            self._dbconn.commit()
+
+    def percentile_rank(self, key, name, value):
+        """Get percentile rank of a value within the historical values
+
+        :key: cache key (see get_key)
+
+        :name: name of the characteristic (e.g. 'time')
+
+        :value: value to rank
+
+        returns percentage of historical days with a smaller value,
+        or None in case there are no indexed values
+
+        """
+
+        query_res = self.store.fetch('''
+        SELECT
+        (SELECT count(*) FROM plan_rank_index
+         WHERE key = ? AND name = ? AND value < ?),
+        (SELECT count(*) FROM plan_rank_index
+         WHERE key = ? AND name = ?)
+        ''', (key, name, float(value), key, name))[0]
+
+        if 0 == query_res[1]:
+            return None
+
+        return 100*query_res[0]/query_res[1]
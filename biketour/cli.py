@@ -0,0 +1,398 @@
+#!/bin/env python
+
+"""Command-line interface of biketour
+
+Heavy modules (pandas, scipy, darksky, the weather databases) are
+imported only by the subcommands that need them, so that showing help
+or looking up cached results starts fast.
+
+"""
+
+import argparse, logging, os, sys
+
+from quota_ledger import DAILY_LIMIT
+
+
+def _add_route_arguments(parser):
+    """Add arguments describing the route and the weather
+
+    """
+    parser.add_argument("route", help="path to a gpx file with the route")
+    _add_weather_arguments(parser)
+
+
+def _add_weather_arguments(parser):
+    """Add arguments describing the weather
+
+    """
+    parser.add_argument("--apikey", default=os.environ.get("DARKSKY_APIKEY"),
+                        help="darksky api key (default: $DARKSKY_APIKEY)")
+    parser.add_argument("--grid-resolution", type=float, default=None,
+                        help="resolution of the weather grid in degrees, "
+                        "clusters the route by weather grid cells")
+    parser.add_argument("--timezone", default=None,
+                        help="timezone of the route, e.g. Europe/Berlin "
+                        "(default: local time of the system)")
+    parser.add_argument("--daily-limit", type=int, default=DAILY_LIMIT,
+                        help="maximum number of darksky api calls per day "
+                        "(default: %(default)s)")
+    parser.add_argument("--quota-db", default=None, metavar="FILE",
+                        help="database counting the api calls, shared "
+                        "by several routes (default: weather database)")
+    parser.add_argument("--record", default=None, metavar="DIRECTORY",
+                        help="record weather queries to a directory")
+    parser.add_argument("--replay", default=None, metavar="DIRECTORY",
+                        help="replay recorded weather queries instead "
+                        "of querying darksky")
+    parser.add_argument("--replay-latency", type=float, default=0,
+                        help="injected latency of replayed queries in seconds")
+    parser.add_argument("--replay-error-rate", type=float, default=0,
+                        help="probability of a replayed query to fail")
+
+
+def _add_plan_arguments(parser):
+    """Add arguments describing the plan
+
+    """
+    parser.add_argument("--departure-hour", type=float, default=7,
+                        help="departure hour (default: %(default)s)")
+    parser.add_argument("--direction", default="forward",
+                        choices=["forward","reversed","out_and_back"],
+                        help="direction of riding the route, planned with "
+                        "the weather of the route (default: %(default)s)")
+    _add_physical_arguments(parser)
+
+
+def _add_physical_arguments(parser):
+    """Add arguments with physical parameters of the plan
+
+    """
+    parser.add_argument("--total-mass", type=float, default=100,
+                        help="total mass in kg (default: %(default)s)")
+    parser.add_argument("--P-rider", type=float, default=150,
+                        help="rider power in W (default: %(default)s)")
+    parser.add_argument("--drivetrain-efficiency", type=float, default=0.95,
+                        help="drivetrain efficiency (default: %(default)s)")
+    parser.add_argument("--C-D", type=float, default=0.7,
+                        help="drag coefficient (default: %(default)s)")
+    parser.add_argument("--C-rr", type=float, default=0.005,
+                        help="rolling resistance coefficient (default: %(default)s)")
+
+
+def _get_parameters(args):
+    """Get physical parameters of the plan from the arguments
+
+    """
+    return {'total_mass': args.total_mass,
+            'P_rider': args.P_rider,
+            'drivetrain_efficiency': args.drivetrain_efficiency,
+            'C_D': args.C_D,
+            'C_rr': args.C_rr}
+
+
+def _get_historical_weather_filename(route_file):
+    """Get filename of the historical weather database
+
+    Same as Planner._get_historical_weather_filename
+
+    """
+    return os.path.splitext(route_file)[0] + "_weather.db"
+
+
+def _get_weather_provider(args):
+    """Initialise weather provider
+
+    """
+    if args.replay is None and args.record is None:
+        return None
+
+    from weather_provider import Recording_Provider, Replay_Provider
+
+    if args.replay is not None:
+        return Replay_Provider(args.replay,
+                               latency=args.replay_latency,
+                               error_rate=args.replay_error_rate)
+
+    return Recording_Provider(args.record)
+
+
+def _get_quota_ledger(args):
+    """Initialise the API calls ledger given by --quota-db
+
+    """
+    if args.quota_db is None:
+        return None
+
+    from quota_ledger import Quota_Ledger
+    from weather_store import Weather_Store
+
+    return Quota_Ledger(Weather_Store(args.quota_db), args.apikey,
+                        daily_limit=args.daily_limit)
+
+
+def _get_planner(args, **kwargs):
+    """Initialise planner
+
+    """
+    from planner import Planner
+
+    return Planner(args.route, args.apikey,
+                   grid_resolution=args.grid_resolution,
+                   weather_provider=_get_weather_provider(args),
+                   timezone=args.timezone,
+                   quota_ledger=_get_quota_ledger(args),
+                   daily_limit=args.daily_limit, **kwargs)
+
+
+def _get_plan(args):
+    """Initialise plan with constant power
+
+    """
+    return _get_planner(args).get_plan("with_constant_power",
+                                       starting_time=args.departure_hour,
+                                       direction=args.direction,
+                                       **_get_parameters(args))
+
+
+def fetch(args):
+    """Query historical weather along the route
+
+    """
+    planner = _get_planner(args,
+                           sample_size=args.sample_size,
+                           sample_years=args.sample_years,
+                           sample_around_interval=args.sample_around_interval,
+                           sample_seed=args.sample_seed)
+
+    planner.historical_weather.query_darksky_weather(max_days=args.max_days)
+
+    print("Complete days: " + str(len(planner.historical_weather.complete_days())))
+
+
+def plan(args):
+    """Compute plan with the weather forecast
+
+    """
+    from trip_characteristics import Trip_Characteristics
+
+    x = Trip_Characteristics()._get_all(_get_plan(args).plan(args.forecast_day))
+
+    for k, v in x.items():
+        print(k + "\t" + str(v))
+
+
+def _print_cached(args):
+    """Print cached historical characteristics
+
+    Only the cache database is read, the route is not parsed.
+
+    returns False in case there are no cached characteristics
+
+    """
+    from characteristics_cache import Characteristics_Cache
+    from weather_store import Weather_Store
+
+    filename = _get_historical_weather_filename(args.route)
+    if not os.path.exists(filename):
+        return False
+
+    cache = Characteristics_Cache(Weather_Store(filename))
+    key = cache.get_key_by_alias(
+        cache.get_alias(args.route, _get_parameters(args),
+                        args.departure_hour, "Plan_With_Constant_Power",
+                        args.direction))
+    if key is None:
+        return False
+
+    res = cache.get_all(key)
+    if 0 == len(res):
+        return False
+
+    columns = list(res[0].keys())
+    print("\t".join(columns))
+    for x in res:
+        print("\t".join(str(x.get(k)) for k in columns))
+
+    return True
+
+
+def historical(args):
+    """Compute historical plan characteristics
+
+    """
+    if args.cached:
+        if not _print_cached(args):
+            sys.exit("No cached characteristics, run without --cached first")
+        return
+
+    from trip_characteristics import Trip_Characteristics
+
+    x = Trip_Characteristics().compute_historical(_get_plan(args),
+                                                  use_cache=not args.no_cache,
+                                                  output=args.output)
+
+    print(x.to_string())
+
+
+def forecast_rank(args):
+    """Rank plans of the forecast days against the historical plans
+
+    """
+    from trip_characteristics import Trip_Characteristics
+
+    plan = _get_plan(args)
+
+    x = Trip_Characteristics().rank_forecast(plan,
+                                             [plan.plan(day) for day in range(1, args.days + 1)])
+
+    for y in x.itertuples():
+        print(y.date + "\t" + str(y.time) + "\t" + str(y.time_rank))
+
+
+def compare(args):
+    """Compare routes and departure hours
+
+    """
+    from route_library import Route_Library
+
+    library = Route_Library(args.routes, args.apikey,
+                            filename=args.weather_db,
+                            grid_resolution=args.grid_resolution,
+                            weather_provider=_get_weather_provider(args),
+                            timezone=args.timezone,
+                            quota_ledger=_get_quota_ledger(args),
+                            daily_limit=args.daily_limit)
+
+    if args.fetch:
+        library.historical_weather.query_darksky_weather(max_days=args.max_days)
+
+    x = library.compare(args.departure_hours, forecast_days=args.forecast_days,
+                        workers=args.workers, **_get_parameters(args))
+
+    print(x.to_string())
+
+
+def serve(args):
+    """Run the local planning service
+
+    """
+    from service import Planning_Service, serve
+
+    service = Planning_Service(args.apikey,
+                               grid_resolution=args.grid_resolution,
+                               weather_provider=_get_weather_provider(args),
+                               refresh_interval=args.refresh_interval,
+                               timezone=args.timezone,
+                               quota_db=args.quota_db,
+                               daily_limit=args.daily_limit,
+                               backfill=args.backfill,
+                               workers=args.workers)
+
+    serve(service, host=args.host, port=args.port, routes=args.routes)
+
+
+def get_parser():
+    """Create the argument parser
+
+    """
+    parser = argparse.ArgumentParser(prog="biketour",
+                                     description="plan your bike trip")
+    parser.add_argument("--verbose", action="store_true",
+                        help="show progress messages")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    x = subparsers.add_parser("fetch", help="query historical weather")
+    _add_route_arguments(x)
+    x.add_argument("--max-days", type=int, default=None,
+                   help="maximum number of days to query")
+    x.add_argument("--sample-size", type=int, default=500,
+                   help="number of days to sample (default: %(default)s)")
+    x.add_argument("--sample-years", type=int, default=20,
+                   help="number of years to sample from (default: %(default)s)")
+    x.add_argument("--sample-around-interval", type=int, default=None,
+                   help="sample only days around the current date")
+    x.add_argument("--sample-seed", type=int, default=None,
+                   help="seed of the sample")
+    x.set_defaults(func=fetch)
+
+    x = subparsers.add_parser("plan", help="compute plan with the forecast")
+    _add_route_arguments(x)
+    _add_plan_arguments(x)
+    x.add_argument("--forecast-day", type=int, default=1,
+                   help="forecast day, 1 means tomorrow (default: %(default)s)")
+    x.set_defaults(func=plan)
+
+    x = subparsers.add_parser("historical",
+                              help="compute historical plan characteristics")
+    _add_route_arguments(x)
+    _add_plan_arguments(x)
+    x.add_argument("--cached", action="store_true",
+                   help="only print cached characteristics")
+    x.add_argument("--no-cache", action="store_true",
+                   help="do not use cached characteristics")
+    x.add_argument("--output", default=None,
+                   help="directory to write characteristics to")
+    x.set_defaults(func=historical)
+
+    x = subparsers.add_parser("forecast-rank",
+                              help="rank forecast days against history")
+    _add_route_arguments(x)
+    _add_plan_arguments(x)
+    x.add_argument("--days", type=int, default=3,
+                   help="number of forecast days (default: %(default)s)")
+    x.set_defaults(func=forecast_rank)
+
+    x = subparsers.add_parser("compare",
+                              help="compare routes and departure hours")
+    x.add_argument("routes", nargs="+", help="gpx files with the routes")
+    _add_weather_arguments(x)
+    _add_physical_arguments(x)
+    x.add_argument("--departure-hours", type=float, nargs="+", default=[7],
+                   help="departure hours (default: %(default)s)")
+    x.add_argument("--forecast-days", type=int, nargs="*", default=[],
+                   help="forecast days to plan with, 1 means tomorrow")
+    x.add_argument("--weather-db", default="route_library_weather.db",
+                   help="historical weather database shared by the routes "
+                   "(default: %(default)s)")
+    x.add_argument("--fetch", action="store_true",
+                   help="query historical weather before comparing")
+    x.add_argument("--max-days", type=int, default=None,
+                   help="maximum number of days to query with --fetch")
+    x.add_argument("--workers", type=int, default=None,
+                   help="number of worker processes (default: number of processors)")
+    x.set_defaults(func=compare)
+
+    x = subparsers.add_parser("serve", help="run local planning service")
+    x.add_argument("routes", nargs="*", help="gpx files loaded on start")
+    _add_weather_arguments(x)
+    x.add_argument("--host", default="127.0.0.1",
+                   help="address to listen on (default: %(default)s)")
+    x.add_argument("--port", type=int, default=8642,
+                   help="port to listen on (default: %(default)s)")
+    x.add_argument("--refresh-interval", type=float, default=3600,
+                   help="interval of forecast refreshes in seconds "
+                   "(default: %(default)s)")
+    x.add_argument("--backfill", action="store_true",
+                   help="query historical weather with the api calls "
+                   "left after the forecast refreshes")
+    x.add_argument("--workers", type=int, default=4,
+                   help="number of threads computing the requests "
+                   "(default: %(default)s)")
+    x.set_defaults(func=serve)
+
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+
+    # progress is logged by the modules (see logging.info)
+    logging.basicConfig(format="%(levelname)s: %(message)s",
+                        level=logging.INFO if args.verbose else logging.WARNING)
+
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,16 @@
 #!/bin/env python
 
-from darksky import forecast
-
 import numpy as np
 import pandas as pd
 
-import datetime
+import datetime, math, threading
+
+import logging
 
-import sqlite3, logging
+from weather_provider import Darksky_Provider
+from local_time import Local_Time, init_time_keys, update_time_keys
+from weather_store import Weather_Store
+from quota_ledger import Quota_Ledger, DAILY_LIMIT
 
 class Forecast_Weather(object):
     """The class queries weather forecast at a list of coordinates
@@ -16,10 +19,14 @@ class Forecast_Weather(object):
 
     def __init__(self, coordinates, darksky_apikey,
                  filename="weather_forecast.db",
-                 darkskyapi_calls_limit = 900,
+                 darkskyapi_calls_limit = DAILY_LIMIT,
                  darksky_units = "si",
+                 weather_provider = None,
                  forecast_expire_age = 12,
-                 forecast_purge_age = 240):
+                 forecast_purge_age = 240,
+                 timezone = None,
+                 store = None,
+                 quota_ledger = None):
         """Initialise class
 
         :coordinates: a pandas dataframe with latitude and longitude columns
@@ -27,121 +34,142 @@ class Forecast_Weather(object):
         :darksky_apikey: api key for darksky queries
 
         :filename: filename of the sqlite database to use that stores
-        the current weather forecasts
+        the current weather forecasts (ignored in case store is given)
 
         :darkskyapi_calls_limit: maximum number of api calls allowed
-        to make per day
+        to make per day (ignored in case quota_ledger is given)
 
         :darkskyapi_units: units to query darksky data (see more in darksky)
 
+        :weather_provider: provider of the weather data (see
+        weather_provider). In case None the darksky API is queried.
+
         :forecast_expire_age: time in hours after which forecast is
         considered to be old and new forecast is fetched
 
         :forecast_purge_age: time in hours after which the old
         forecasts are deleted from database
+
+        :timezone: timezone of the route, forecast days are the days
+        of its local time (see Local_Time). In case None the local
+        time of the system is used.
+
+        :store: Weather_Store object, which can be shared with the
+        historical weather. In case None the store of filename is
+        opened.
+
+        :quota_ledger: Quota_Ledger object counting the API calls,
+        which can be shared with the historical weather and other
+        processes. In case None the calls are counted in the weather
+        database.
         """
         self.coordinates = np.squeeze(np.array(coordinates[['latitude','longitude']]))
         self.apikey = darksky_apikey
 
-        self._darkskyapi_calls_limit = darkskyapi_calls_limit
-        self._darkskyapi_current_usage = None
         self._darkskyapi_timestamp = None
 
         self._darkskyapi_units = darksky_units
-        self.filename = filename
+
+        if weather_provider is None:
+            weather_provider = Darksky_Provider()
+        self._weather_provider = weather_provider
+
+        if store is None:
+            store = Weather_Store(filename)
+        self._store = store
+        self.filename = store.filename
+
+        if quota_ledger is None:
+            quota_ledger = Quota_Ledger(store, darksky_apikey,
+                                        daily_limit=darkskyapi_calls_limit)
+        self.quota_ledger = quota_ledger
 
         self._forecast_expire_age = forecast_expire_age
         self._forecast_purge_age = forecast_purge_age
 
-        # initialise database connection
-        self._dbconn=sqlite3.connect(self.filename, timeout = 15,
-                                     isolation_level="EXCLUSIVE")
+        self.local_time = Local_Time(timezone)
 
-        # initialise database
-        self._init_database()
+        # database connection is opened on first use
+        self._connection = None
+
+        # expired forecasts are queried by one thread at a time
+        self._query_lock = threading.RLock()
+
+    @property
+    def _dbconn(self):
+        """Database connection
+
+        The database is opened and initialised on first use.
+
+        """
+        if self._connection is None:
+            with self._store.write_lock:
+                if self._connection is None:
+                    # initialise database
+                    self._init_database()
+
+                    self._connection = self._store.connection
+
+        return self._connection
 
     def _get_current_time(self):
-        """Get current time in unixtime in utc
+        """Get current time in unixtime
 
         """
-        return int(datetime.datetime.utcnow().timestamp())
+        return self.local_time.now()
 
     def _get_db_columns(self):
         return list(self._get_db_schema().keys())
 
     def _get_db_schema(self):
-        return {'id':                         'INTEGER PRIMARY KEY AUTOINCREMENT',
-                'forecast_type':              'VARCHAR(255)',
-                'forecast_time':              'INTEGER NOT NULL',
-                'latitude':                   'REAL NOT NULL',
-                'longitude':                  'REAL NOT NULL',
-                'time':                       'INTEGER NOT NULL',
-                'summary':                    'VARCHAR(255)',
-                'icon':                       'VARCHAR(255)',
-                'sunriseTime':                'INTEGER',
-                'sunsetTime':                 'INTEGER',
-                'moonPhase':                  'REAL',
-                'precipIntensity':            'REAL',
-                'precipIntensityMax':         'REAL',
-                'precipIntensityTime':        'INTEGER',
-                'precipProbability':          'REAL',
-                'precipType':                 'VARCHAR(255)',
-                'temperature':                'REAL',
-                'temperatureHigh':            'REAL',
-                'temperatureHighTime':        'INTEGER',
-                'temperatureLow':             'REAL',
-                'temperatureLowTime':         'INTEGER',
-                'apparentTemperature':        'REAL',
-                'apparentTemperatureHigh':    'REAL',
-                'apparentTemperatureHighTime':'INTEGER',
-                'apparentTemperatureLow':     'REAL',
-                'apparentTemperatureLowTime': 'INTEGER',
-                'dewPoint':                   'REAL',
-                'humidity':                   'REAL',
-                'pressure':                   'REAL',
-                'windSpeed':                  'REAL',
-                'windGust':                   'REAL',
-                'windGustTime':               'INTEGER',
-                'windBearing':                'REAL',
-                'cloudCover':                 'REAL',
-                'uvIndex':                    'REAL',
-                'uvIndexTime':                'INTEGER',
-                'visibility':                 'REAL',
-                'ozone':                      'REAL'
-                }
+        return self._store.get_schema("weather_forecast")
 
     def _init_database(self):
         """Initialise the database with weather forecasts
 
         """
+        connection = self._store.connection
+
         try:
-            c = self._dbconn.execute('''BEGIN EXCLUSIVE''')
+            c = connection.execute('''BEGIN EXCLUSIVE''')
 
-            c.execute('''
-            CREATE TABLE IF NOT EXISTS weather_forecast
-            (
-            ''' + ", ".join(x[0] + " " + x[1] for x in self._get_db_schema().items()) +  ''',
-            CONSTRAINT uc_time_latitude_longitude_ftype_ftime UNIQUE (time, latitude, longitude, forecast_type, forecast_time)
-            )''')
+            self._store.create_table(c, "weather_forecast")
 
-            self._dbconn.commit()
+            # local day and hour keys of the forecasts
+            init_time_keys(c, "weather_forecast", self.local_time)
+
+            connection.commit()
         except Exception as e:
-            logging.error("Error creating table (weather_forecast)",e)
-            self._dbconn.rollback()
+            logging.error("Error creating table (weather_forecast): " + str(e))
+            connection.rollback()
             raise e
 
     def _isallowed_darksky(self):
         """Check if the query is allowed
 
-        This operation uses locally known variables to decide wether
-        we can make another query
+        The call is reserved in the quota ledger, which is shared with
+        the historical weather and other processes (see Quota_Ledger).
+        """
+        return self.quota_ledger.reserve("forecast")
+
+    def daily_calls(self):
+        """Number of API calls per day needed to keep the forecasts
+        fresh
+
+        The forecast at every coordinate is queried again once it is
+        older than forecast_expire_age.
+
         """
-        # TODO: to do not yet completely implemented
+        return len(self.coordinates)*int(math.ceil(24/self._forecast_expire_age))
 
-        if self._darkskyapi_current_usage is not None and self._darkskyapi_current_usage >= self._darkskyapi_calls_limit:
-            return False
+    def remove_coordinates(self, coordinates):
+        """Stop querying forecasts at the given coordinates
 
-        return True
+        :coordinates: list of coordinates (latitude, longitude)
+
+        """
+        keep = [not any(np.allclose(x, y) for y in coordinates) for x in self.coordinates]
+        self.coordinates = self.coordinates[keep]
 
     def _is_recent_forecast_present(self):
         """Check if recent forecast is present in the database
@@ -151,28 +179,13 @@ class Forecast_Weather(object):
         # get current time
         current_time = self._get_current_time()
 
-        # get cursor
-        c = self._dbconn.cursor()
-
-        # check forecast timestamps age
-
-        # NOTE: forecast can be incomplete. Here one need to verify
-        # that forecast for all coordinates is present
-        try:
-            c.execute('''
-            SELECT count(*)
-            FROM weather_forecast
-            WHERE abs(forecast_time -
-            ''' + str(current_time) + ''') <
-            ''' + str(self._forecast_expire_age*60*60))
-
-            query_res = c.fetchone()[0]
-        except Exception as e:
-            logging.error("Error quering data from weather_forecast",e)
-            self._dbconn.rollback()
-            raise e
-
-        self._dbconn.commit()
+        # number of coordinates with a recent forecast
+        query_res = self.store.fetch('''
+        SELECT count(*)
+        FROM (SELECT DISTINCT latitude, longitude
+              FROM weather_forecast
+              WHERE abs(forecast_time - ?) < ?)
+        ''', (current_time, self._forecast_expire_age*60*60))[0][0]
 
         return query_res >= len(self.coordinates)
 
@@ -191,24 +204,21 @@ class Forecast_Weather(object):
 
             logging.info("Quering coordinate = " + str(coord))
 
-            query_res = forecast(key=self.apikey,
-                                 latitude=coord[0],longitude=coord[1],
-                                 units=self._darkskyapi_units)
+            query_res = self._weather_provider.forecast(
+                key=self.apikey,
+                latitude=coord[0],longitude=coord[1],
+                units=self._darkskyapi_units)
 
-            # update the API usage counters
+            # record the API usage reported by the service
             try:
-                self._darkskyapi_current_usage = int(query_res.response_headers['X-Forecast-API-Calls'])
+                self.quota_ledger.report(int(query_res.response_headers['X-Forecast-API-Calls']))
             except Exception as e:
                 logging.warning("X-Forecast-API-Calls is missing! Using only local information.")
-                if self._darkskyapi_current_usage is None:
-                    self._darkskyapi_current_usage = 1
-                else:
-                    self._darkskyapi_current_usage += 1
 
             self._darkskyapi_timestamp = datetime.datetime.now()
 
         except Exception as e:
-            logging.error("Error making query to darksky: ",e)
+            logging.error("Error making query to darksky: " + str(e))
             raise e
 
         # get current time
@@ -246,131 +256,129 @@ class Forecast_Weather(object):
             new_data += [x]
 
 
-        # get cursor
-        c = self._dbconn.cursor()
+        with self._store.write_lock:
+            # get cursor
+            c = self._dbconn.cursor()
 
-        # insert values to the database
-        try:
-            # insert new weather data
-            c.executemany('''
-            INSERT OR REPLACE INTO weather_forecast
-            (''' + ", ".join(self._get_db_columns()[1:]) + ''')
-            VALUES
-            ('''+ ",".join("?"*len(self._get_db_columns()[1:])) + ''')
-            ''', new_data)
+            # insert values to the database
+            try:
+                # insert new weather data
+                c.executemany('''
+                INSERT OR REPLACE INTO weather_forecast
+                (''' + ", ".join(self._get_db_columns()[1:]) + ''')
+                VALUES
+                ('''+ ",".join("?"*len(self._get_db_columns()[1:])) + ''')
+                ''', new_data)
 
-        except Exception as e:
-            logging.error("Error with db insertion into weather_forecast table",e)
-            self._dbconn.rollback()
-            raise e
+                # local day and hour keys of the new forecasts
+                update_time_keys(c, "weather_forecast", self.local_time)
 
-        # commit changes
-        self._dbconn.commit()
+            except Exception as e:
+                logging.error("Error with db insertion into weather_forecast table",e)
+                self._dbconn.rollback()
+                raise e
+
+            # commit changes
+            self._dbconn.commit()
 
     def query_darksky_weather(self):
         """Query current weather forecast from darksky API
 
         """
-        X = np.array(self.coordinates)
-        N = len(X)
+        with self._query_lock:
+            X = np.array(self.coordinates)
+            N = len(X)
 
-        for x in X:
-            print("Requests to make: " + str(N))
-            N -= 1
-            try:
-                self._query_coordinate((x[0],x[1]))
-            except Exception as e:
-                logging.warning("Error during queries",e)
-                break
+            for x in X:
+                logging.info("Requests to make: " + str(N))
+                N -= 1
+                try:
+                    self._query_coordinate((x[0],x[1]))
+                except Exception as e:
+                    logging.warning("Error during queries: " + str(e))
+                    break
 
-    def query_local_weather(self, columns='*',where=None):
-        """Query weather data from local database
-
-        :columns: columns to query (can be list or string in sql format).
+            self._cleanup_old_forecasts()
 
-        :where: where condition in terms of database column names and
-        sql language
+    @property
+    def store(self):
+        """Weather store with the initialised database
 
         """
-        # get column in a proper format
-        columns = ",".join(columns)
+        self._dbconn
 
-        # get cursor
-        c = self._dbconn.cursor()
+        return self._store
 
-        # query data from the database
-        try:
-            if where is None:
-                c.execute('''
-                SELECT
-                ''' + columns + '''
-                FROM weather_forecast
-                ''')
-            else:
-                c.execute('''
-                SELECT
-                ''' + columns + '''
-                FROM weather_forecast
-                WHERE ''' + where)
+    def query_local_weather(self, columns='*', where=None, parameters=()):
+        """Query weather data from local database
 
-            query_res = c.fetchall()
+        :columns: columns to query (can be list or string in sql format).
 
-        except Exception as e:
-            logging.error("Error quering data from weather_forecast",e)
-            self._dbconn.rollback()
-            raise e
+        :where: where condition in terms of database column names and
+        sql language
 
-        # column names
-        if '*' == columns:
-            columns = self._get_db_columns()
-        else:
-            columns = columns.split(",")
+        :parameters: values of the placeholders in the where condition
 
-        # convert to pandas
-        return pd.DataFrame(np.array(query_res),columns=columns)
+        """
+        return self.store.query("weather_forecast", columns, where, parameters)
 
     def _cleanup_old_forecasts(self):
         """Cleanup old forecast entries in the database
 
+        The forecasts made more than forecast_purge_age ago are
+        deleted.
+
         """
 
         # get current time
         current_time = self._get_current_time()
 
-        # get cursor
-        c = self._dbconn.cursor()
+        with self._store.write_lock:
+            # get cursor
+            c = self._dbconn.cursor()
 
-        # delete entries from the database
-        try:
-            c.execute('''
-            DELETE
-            FROM weather_forecast
-            WHERE abs(forecast_time -
-            ''' + str(current_time) + ''') >
-            ''' + str(self._forecast_expire_age*60*60))
+            # delete entries from the database
+            try:
+                c.execute('''
+                DELETE
+                FROM weather_forecast
+                WHERE forecast_time < ?
+                ''', (current_time - self._forecast_purge_age*60*60,))
 
-            self._dbconn.commit()
-        except Exception as e:
-            logging.error("Error purging entries (weather_forecast)",e)
-            self._dbconn.rollback()
-            raise e
+                self._dbconn.commit()
+            except Exception as e:
+                logging.error("Error purging entries (weather_forecast)",e)
+                self._dbconn.rollback()
+                raise e
 
     def _clean_forecast(self, data):
         """Clean forecast pandas dataframe.
 
         By cleaning we mean choosing preferrably hourly data, and in
-        case hourly data is missing use daily data.
+        case hourly data is missing use daily data. Of every place and
+        time only the latest forecast is kept.
 
         In case no forecast data is available throw an exception.
 
         Resulting pandas dataframe contains hourly data, with the same
-        (or larger) set of columns as historical weather data frame.
+        (or larger) set of columns as historical weather data frame,
+        sorted by time and coordinates.
 
         :data: dataframe returned by query_local_weather
 
         """
+        if 0 == len(data):
+            raise RuntimeError("No forecast available")
 
-        return data
+        # coordinates with hourly data
+        coordinates = pd.MultiIndex.from_frame(data[['latitude','longitude']])
+        hourly = ('hourly' == data['forecast_type']).values
+        data = data[hourly | ~coordinates.isin(coordinates[hourly])]
+
+        return data.sort_values('forecast_time', kind='stable')\
+                   .drop_duplicates(subset=['latitude','longitude','time'], keep='last')\
+                   .sort_values(['time','latitude','longitude'])\
+                   .reset_index(drop=True)
 
     def forecast(self, forecast_day = 1):
         """Get forecast at the coordinates for every hour of the day
@@ -380,24 +388,15 @@ class Forecast_Weather(object):
 
         """
         # if data is not fresh, query new forecasts
-        if not self._is_recent_forecast_present():
-            self.query_darksky_weather()
-
-        current_time = self._get_current_time()
-
-        # evaluate forecast interval
-        forecast_begin = (datetime.datetime.fromtimestamp(current_time).date() +
-                          datetime.timedelta(days=forecast_day))
-        forecast_begin = datetime.datetime.combine(forecast_begin,
-                                                   datetime.datetime.min.time())
-        forecast_end = forecast_begin + datetime.timedelta(days=1)
+        with self._query_lock:
+            if not self._is_recent_forecast_present():
+                self.query_darksky_weather()
 
-        forecast_begin = int(forecast_begin.timestamp())
-        forecast_end = int(forecast_end.timestamp())
+        # day key of the forecast day
+        day = self.local_time.today() + forecast_day
 
         # get weather forecast
-        res = self.query_local_weather(where='time >= ' + str(forecast_begin) +
-                                       ' AND time < ' + str(forecast_end))
+        res = self.query_local_weather(where="day = ?", parameters=(day,))
 
         return self._clean_forecast(res)
 
@@ -111,3 +111,45 @@ def rhumb_distance(coord1,coord2):
             delta_lambda = 2*math.pi + delta_lambda
 
     return earth_radius() * (delta_phi**2 + (q*delta_lambda)**2)**(1/2)
+
+
+def geodesic_distance_array(lat1, lon1, lat2, lon2):
+    """Compute geodesic distances between arrays of coordinates
+
+    Vectorised version of geodesic_distance
+
+    :lat1, lon1: latitudes and longitudes of the first coordinates
+
+    :lat2, lon2: latitudes and longitudes of the second coordinates
+
+    """
+    s_lat = np.pi * np.asarray(lat1, dtype=float) / 180
+    s_lon = np.pi * np.asarray(lon1, dtype=float) / 180
+    f_lat = np.pi * np.asarray(lat2, dtype=float) / 180
+    f_lon = np.pi * np.asarray(lon2, dtype=float) / 180
+
+    t = np.cos(f_lat) * np.cos(s_lat) * np.sin((f_lon - s_lon)/2)**2 \
+        + np.sin((f_lat - s_lat)/2)**2
+
+    return earth_radius() * 2 * np.arctan2(t**(1/2),(1-t)**(1/2))
+
+
+def bearing_array(lat1, lon1, lat2, lon2):
+    """Compute forward azimuths between arrays of coordinates
+
+    Vectorised version of bearing
+
+    :lat1, lon1: latitudes and longitudes of the starting coordinates
+
+    :lat2, lon2: latitudes and longitudes of the finish coordinates
+
+    """
+    s_lat = np.pi * np.asarray(lat1, dtype=float) / 180
+    s_lon = np.pi * np.asarray(lon1, dtype=float) / 180
+    f_lat = np.pi * np.asarray(lat2, dtype=float) / 180
+    f_lon = np.pi * np.asarray(lon2, dtype=float) / 180
+
+    y = np.sin(f_lon - s_lon) * np.cos(f_lat)
+    x = np.cos(s_lat)*np.sin(f_lat) - np.sin(s_lat)*np.cos(f_lat)*np.cos(f_lon - s_lon)
+
+    return np.arctan2(y,x)/np.pi * 180 % 360
@@ -1,13 +1,16 @@
 #!/bin/env python
 
-import sqlite3, logging, random
+import logging, random
 
 import pandas as pd, numpy as np
 
-from darksky import forecast
-
 from datetime import datetime, timedelta
 
+from weather_provider import Darksky_Provider
+from local_time import Local_Time, init_time_keys, update_time_keys
+from weather_store import Weather_Store
+from quota_ledger import Quota_Ledger, Backfill_Scheduler, DAILY_LIMIT
+
 
 class Historical_Weather(object):
     """The class queries historical weather at a list of coordinates
@@ -20,8 +23,13 @@ class Historical_Weather(object):
                  sample_years=20,
                  sample_around_interval=None,
                  sample_current_date=None,
-                 darkskyapi_calls_limit=600,
-                 darksky_units = "si"):
+                 sample_seed=None,
+                 darkskyapi_calls_limit=DAILY_LIMIT,
+                 darksky_units = "si",
+                 weather_provider = None,
+                 timezone = None,
+                 store = None,
+                 quota_ledger = None):
         """Initialise class
 
         :coordinates: a pandas dataframe with latitude and longitude columns
@@ -29,7 +37,7 @@ class Historical_Weather(object):
         :darksky_apikey: api key for darksky queries
 
         :filename: filename of the sqlite database to use that stores
-        the historical weather
+        the historical weather (ignored in case store is given)
 
         :sample_size: number of days to query in the last sample_years
 
@@ -41,13 +49,31 @@ class Historical_Weather(object):
         year is sampled.
 
         :sample_current_date: current date around which the
-        sample_around_interval is computed
+        sample_around_interval is computed. In case None noon of the
+        current day is used.
+
+        :sample_seed: seed for sampling the days and the order in which
+        they are queried. In case None the sample is not reproducible.
 
         :darkskyapi_calls_limit: maximum number of api calls allowed
-        to make per day
+        to make per day (ignored in case quota_ledger is given)
 
         :darkskyapi_units: units to query darksky data (see more in darksky)
 
+        :weather_provider: provider of the weather data (see
+        weather_provider). In case None the darksky API is queried.
+
+        :timezone: timezone of the route, the weather is grouped by
+        the days and hours of its local time (see Local_Time). In case
+        None the local time of the system is used.
+
+        :store: Weather_Store object, which can be shared with the
+        forecasts. In case None the store of filename is opened.
+
+        :quota_ledger: Quota_Ledger object counting the API calls,
+        which can be shared with the forecasts and other processes. In
+        case None the calls are counted in the weather database.
+
         """
         self.coordinates = np.squeeze(np.array(coordinates[['latitude','longitude']]))
         self.apikey=darksky_apikey
@@ -56,68 +82,71 @@ class Historical_Weather(object):
         self._sample_years=sample_years
         self._sample_around_interval=sample_around_interval
         self._sample_current_date=sample_current_date
+        self._sample_seed=sample_seed
 
-        self._darkskyapi_calls_limit = darkskyapi_calls_limit
-        self._darkskyapi_current_usage = None
         self._darkskyapi_timestamp = None
 
         self._darkskyapi_units = darksky_units
 
-        self.filename=filename
+        if weather_provider is None:
+            weather_provider = Darksky_Provider()
+        self._weather_provider = weather_provider
+
+        self.local_time = Local_Time(timezone)
+
+        if store is None:
+            store = Weather_Store(filename)
+        self._store = store
+        self.filename = store.filename
+
+        if quota_ledger is None:
+            quota_ledger = Quota_Ledger(store, darksky_apikey,
+                                        daily_limit=darkskyapi_calls_limit)
+        self.quota_ledger = quota_ledger
 
-        # initialise database connection
-        self._dbconn=sqlite3.connect(self.filename, timeout = 15,
-                                       isolation_level="EXCLUSIVE")
+        # database connection is opened on first use
+        self._connection = None
 
-        # initialise database
-        self._init_database()
+    @property
+    def _dbconn(self):
+        """Database connection
 
-        # check that query dates exists
-        if 0 == self._count_query_dates_from_db():
-            days = self._sample_days_to_query()
-            self._save_query_dates_to_db(days)
+        The database is opened and initialised (including the sample of
+        days to query) on first use.
+
+        """
+        if self._connection is None:
+            with self._store.write_lock:
+                if self._connection is None:
+                    # initialise database
+                    self._init_database()
+
+                    # check that query dates exists, the store is read
+                    # directly as the database is not published yet
+                    if 0 == self._store.fetch('''SELECT count(*) FROM query_dates''')[0][0]:
+                        days = self._sample_days_to_query()
+                        self._save_query_dates_to_db(days)
+
+                    self._connection = self._store.connection
+
+        return self._connection
 
     def _get_db_columns(self):
         return list(self._get_db_schema().keys())
 
     def _get_db_schema(self):
-        return {
-            'id':                  'INTEGER PRIMARY KEY AUTOINCREMENT',
-            'latitude':            'REAL NOT NULL',
-            'longitude':           'REAL NOT NULL',
-            'time':                'INTEGER NOT NULL',
-            'summary':             'VARCHAR(125)',
-            'icon':                'VARCHAR(125)',
-            'precipIntensity':     'REAL',
-            'precipProbability':   'REAL',
-            'precipType':          'VARCHAR(125)',
-            'temperature':         'REAL',
-            'apparentTemperature': 'REAL',
-            'dewPoint':            'REAL',
-            'humidity':            'REAL',
-            'pressure':            'REAL',
-            'windSpeed':           'REAL',
-            'windGust':            'REAL',
-            'windBearing':         'REAL',
-            'cloudCover':          'REAL',
-            'uvIndex':             'REAL',
-            'visibility':          'REAL',
-            'ozone':               'REAL',
-        }
+        return self._store.get_schema("weather")
 
     def _init_database(self):
         """This function initialised the database with weather data
 
         """
+        connection = self._store.connection
+
         try:
-            c = self._dbconn.execute('''BEGIN EXCLUSIVE''')
+            c = connection.execute('''BEGIN EXCLUSIVE''')
 
-            c.execute('''
-            CREATE TABLE IF NOT EXISTS weather
-            (
-            ''' + ", ".join(x[0] + " " + x[1] for x in self._get_db_schema().items()) +  ''',
-            CONSTRAINT uc_time_latitude_longitude UNIQUE (time, latitude, longitude)
-            )''')
+            self._store.create_table(c, "weather")
 
             c.execute('''
             CREATE TABLE IF NOT EXISTS query_dates
@@ -130,10 +159,23 @@ class Historical_Weather(object):
             CONSTRAINT uc_time_latitude_longitude UNIQUE(time, latitude, longitude)
             )''')
 
-            self._dbconn.commit()
+            c.execute('''
+            CREATE TABLE IF NOT EXISTS merged_coordinates
+            (
+            latitude            REAL NOT NULL,
+            longitude           REAL NOT NULL,
+            target_latitude     REAL NOT NULL,
+            target_longitude    REAL NOT NULL,
+            CONSTRAINT uc_latitude_longitude UNIQUE(latitude, longitude)
+            )''')
+
+            # local day and hour keys of the weather
+            init_time_keys(c, "weather", self.local_time)
+
+            connection.commit()
         except Exception as e:
-            logging.error("Error creating table (weather)",e)
-            self._dbconn.rollback()
+            logging.error("Error creating table (weather): " + str(e))
+            connection.rollback()
             raise e
 
 
@@ -155,17 +197,22 @@ class Historical_Weather(object):
         for k in range(0,self._sample_years):
             days_ago=days_ago.union(range(365*(k+1)-delta,365*(k+1)+delta))
         # remove last 2 weeks from the forecast
-        days_ago = days_ago.difference(range(0,14))
+        days_ago = sorted(days_ago.difference(range(0,14)))
 
         # sample from days_ago
-        days_ago = random.sample(days_ago, self._sample_size)
+        days_ago = random.Random(self._sample_seed)\
+                         .sample(days_ago, min(self._sample_size, len(days_ago)))
 
         # evaluate date times
+        # (noon of the current day, so that a seeded sample does not
+        # depend on the time of the run)
         if self._sample_current_date is None:
-            self._sample_current_date=datetime.now()
+            today = self.local_time.date(self.local_time.today())
+            self._sample_current_date=datetime(*today) + timedelta(hours=12)
 
         # computed required timestamps
-        days=[(self._sample_current_date - timedelta(days=x)).strftime("%s") for x in days_ago]
+        days=[self.local_time.timestamp(self._sample_current_date - timedelta(days=x))
+              for x in days_ago]
 
         # get a cross-product with coordinates
         return [(x[0],x[1],y,False) for x in np.array(self.coordinates) for y in days]
@@ -177,24 +224,26 @@ class Historical_Weather(object):
         :days: sample of days
         """
 
-        # get cursor
-        c = self._dbconn.cursor()
+        with self._store.write_lock:
+            # get cursor
+            connection = self._store.connection
+            c = connection.cursor()
 
-        # insert values to the database
-        try:
-            c.executemany('''
-            INSERT OR IGNORE INTO query_dates
-            (latitude, longitude, time, if_queried)
-            VALUES (?,?,?,?)
-            ''', days)
+            # insert values to the database
+            try:
+                c.executemany('''
+                INSERT OR IGNORE INTO query_dates
+                (latitude, longitude, time, if_queried)
+                VALUES (?,?,?,?)
+                ''', days)
 
-        except Exception as e:
-            logging.error("Error with db insertion into query_dates table",e)
-            self._dbconn.rollback()
-            raise e
+            except Exception as e:
+                logging.error("Error with db insertion into query_dates table: " + str(e))
+                connection.rollback()
+                raise e
 
-        # commit changes
-        self._dbconn.commit()
+            # commit changes
+            connection.commit()
 
 
     def _read_query_dates_from_db(self, if_queried=None):
@@ -207,32 +256,17 @@ class Historical_Weather(object):
 
         """
 
-        # get cursor
-        c = self._dbconn.cursor()
+        if if_queried is None:
+            return self.store.fetch('''
+            SELECT time, latitude, longitude, if_queried
+            FROM query_dates
+            ''')
 
-        # query data from the database
-        try:
-            if if_queried is None:
-                c.execute('''
-                SELECT time, latitude, longitude, if_queried
-                FROM query_dates
-                ''')
-            else:
-                c.execute('''
-                SELECT time, latitude, longitude, if_queried
-                FROM query_dates
-                WHERE if_queried = ?
-                ''', (bool(if_queried),))
-
-            query_res = c.fetchall()
-        except Exception as e:
-            logging.error("Error quering data from query_dates",e)
-            self._dbconn.rollback()
-            raise e
-
-        self._dbconn.commit()
-
-        return query_res
+        return self.store.fetch('''
+        SELECT time, latitude, longitude, if_queried
+        FROM query_dates
+        WHERE if_queried = ?
+        ''', (bool(if_queried),))
 
 
     def _count_query_dates_from_db(self, if_queried=None):
@@ -244,46 +278,215 @@ class Historical_Weather(object):
         that are not yet queried.
         """
 
-        # get cursor
-        c = self._dbconn.cursor()
+        if if_queried is None:
+            return self.store.fetch('''
+            SELECT count(*)
+            FROM query_dates
+            ''')[0][0]
 
-        # query data from the database
-        try:
-            if if_queried is None:
-                c.execute('''
-                SELECT count(*)
-                FROM query_dates
-                ''')
-            else:
-                c.execute('''
-                SELECT count(*)
-                FROM query_dates
-                WHERE if_queried = ?
-                ''', (bool(if_queried),))
-
-            query_res = c.fetchone()[0]
-        except Exception as e:
-            logging.error("Error quering data from query_dates",e)
-            self._dbconn.rollback()
-            raise e
+        return self.store.fetch('''
+        SELECT count(*)
+        FROM query_dates
+        WHERE if_queried = ?
+        ''', (bool(if_queried),))[0][0]
 
-        self._dbconn.commit()
 
-        return query_res
+    def _read_query_days_from_db(self):
+        """Read per-day completeness of the query_dates table
 
+        Every sampled day is stored in query_dates once per
+        coordinate with the same time value. The day is complete once
+        all of its coordinates are queried.
 
-    def _isallowed_darksky(self):
-        """Check if the query is allowed
+        returns list of tuples (time, number of queried coordinates,
+        total number of coordinates)
 
-        This operation uses locally known variables to decide wether
-        we can make another query
         """
-        # TODO: to do not yet completely implemented
 
-        if self._darkskyapi_current_usage is not None and self._darkskyapi_current_usage >= self._darkskyapi_calls_limit:
-            return False
+        return self.store.fetch('''
+        SELECT time, sum(if_queried), count(*)
+        FROM query_dates
+        GROUP BY time
+        ORDER BY time
+        ''')
+
+
+    def _read_query_day_from_db(self, time, if_queried=None):
+        """Read coordinates of a single sampled day
+
+        :time: time of the sampled day (as stored in query_dates)
+
+        :if_queried: see _read_query_dates_from_db
+
+        """
+
+        if if_queried is None:
+            return self.store.fetch('''
+            SELECT time, latitude, longitude, if_queried
+            FROM query_dates
+            WHERE time = ?
+            ''', (time,))
+
+        return self.store.fetch('''
+        SELECT time, latitude, longitude, if_queried
+        FROM query_dates
+        WHERE time = ? AND if_queried = ?
+        ''', (time, bool(if_queried)))
+
+
+    def complete_days(self):
+        """Get sampled days for which all coordinates are queried
+
+        returns list of times (as stored in query_dates)
+
+        """
+        return [x[0] for x in self._read_query_days_from_db() if x[1] == x[2]]
+
+
+    def _schedule_query_days(self):
+        """Order the incomplete sampled days for querying
+
+        Days that are partially queried go first (the most complete
+        first), so that every new query contributes to a day that
+        becomes usable as soon as possible. The remaining days are
+        shuffled (using sample_seed), so that any prefix of the
+        schedule is a random sample of the sampled days.
+
+        returns list of times (as stored in query_dates)
+
+        """
+        days = [x for x in self._read_query_days_from_db() if x[1] < x[2]]
+
+        partial = [x[0] for x in sorted(days, key=lambda x: (x[2] - x[1], x[0]))
+                   if x[1] > 0]
+        untouched = [x[0] for x in days if 0 == x[1]]
+        random.Random(self._sample_seed).shuffle(untouched)
+
+        return partial + untouched
+
+
+    def find_identical_coordinates(self, min_days=5):
+        """Find coordinates that have identical weather
+
+        Neighbouring coordinates often lie within the same cell of the
+        weather model, hence the weather service returns identical
+        data for them. Coordinates are compared at complete days only.
+
+        :min_days: minimal number of complete days needed to decide
+        that weather is identical
+
+        returns list of groups (lists of coordinates (latitude,
+        longitude)) with at least two coordinates
+
+        """
+        days = self.complete_days()
+        if len(days) < min_days:
+            return []
+
+        # restrict comparison to the weather of the complete days
+        days = np.unique(self.local_time.day_keys(days))
+        weather = self.query_local_weather(
+            where="day IN (" + ",".join(str(x) for x in days) + ")")
+        weather = weather.drop(columns=['id']).drop_duplicates()
+
+        columns = [x for x in weather.columns if x not in ('latitude','longitude')]
+
+        # fingerprint weather of every coordinate
+        fingerprints = {}
+        for coord, x in weather.groupby(['latitude','longitude']):
+            x = x[columns].sort_values('time')
+            fingerprints.setdefault(
+                pd.util.hash_pandas_object(x, index=False).sum(), []).append(coord)
+
+        return [sorted(x) for x in fingerprints.values() if len(x) > 1]
+
 
-        return True
+    def save_merged_coordinates(self, groups):
+        """Save groups of coordinates merged into their first coordinate
+
+        The merges are applied again when the route is loaded (see
+        Planner.merge_identical_weather).
+
+        :groups: list of lists of coordinates (latitude, longitude)
+
+        """
+        rows = [(x[0],x[1],group[0][0],group[0][1]) for group in groups for x in group[1:]]
+
+        with self._store.write_lock:
+            # get cursor
+            c = self._dbconn.cursor()
+
+            try:
+                c.executemany('''
+                INSERT OR REPLACE INTO merged_coordinates
+                (latitude, longitude, target_latitude, target_longitude)
+                VALUES (?,?,?,?)
+                ''', rows)
+
+            except Exception as e:
+                logging.error("Error with db insertion into merged_coordinates table",e)
+                self._dbconn.rollback()
+                raise e
+
+            self._dbconn.commit()
+
+
+    def read_merged_coordinates(self):
+        """Read groups of merged coordinates (see save_merged_coordinates)
+
+        returns list of lists of coordinates (latitude, longitude), the
+        first coordinate of a group is the one the others are merged
+        into
+
+        """
+        groups = {}
+        for x in self.store.fetch('''
+        SELECT target_latitude, target_longitude, latitude, longitude
+        FROM merged_coordinates
+        ORDER BY rowid
+        '''):
+            groups.setdefault(x[:2], [x[:2]]).append(x[2:])
+
+        return list(groups.values())
+
+
+    def remove_coordinates(self, coordinates):
+        """Stop querying weather at the given coordinates
+
+        Already queried weather is kept, but not yet queried sampled
+        days are removed for those coordinates.
+
+        :coordinates: list of coordinates (latitude, longitude)
+
+        """
+        with self._store.write_lock:
+            # get cursor
+            c = self._dbconn.cursor()
+
+            try:
+                c.executemany('''
+                DELETE FROM query_dates
+                WHERE latitude = ? AND longitude = ? AND if_queried = ?
+                ''', [(x[0],x[1],False) for x in coordinates])
+
+            except Exception as e:
+                logging.error("Error deleting from query_dates table",e)
+                self._dbconn.rollback()
+                raise e
+
+            self._dbconn.commit()
+
+        keep = [not any(np.allclose(x, y) for y in coordinates) for x in self.coordinates]
+        self.coordinates = self.coordinates[keep]
+
+
+    def _isallowed_darksky(self):
+        """Check if the query is allowed
+
+        The call is reserved in the quota ledger, which is shared with
+        the forecasts and other processes (see Quota_Ledger).
+        """
+        return self.quota_ledger.reserve("historical")
 
 
     def _query_coordinate_time(self, coord, time):
@@ -304,26 +507,23 @@ class Historical_Weather(object):
 
             logging.info("Quering time = " + str(time) + " coordinate = " + str(coord))
 
-            query_res = forecast(key=self.apikey,
-                                 latitude=coord[0],longitude=coord[1],
-                                 time=time, units=self._darkskyapi_units)
+            query_res = self._weather_provider.forecast(
+                key=self.apikey,
+                latitude=coord[0],longitude=coord[1],
+                time=time, units=self._darkskyapi_units)
 
             # TODO: verify here that result is not error
 
-            # update the API usage counters
+            # record the API usage reported by the service
             try:
-                self._darkskyapi_current_usage = int(query_res.response_headers['X-Forecast-API-Calls'])
+                self.quota_ledger.report(int(query_res.response_headers['X-Forecast-API-Calls']))
             except Exception as e:
                 logging.warning("X-Forecast-API-Calls is missing! Using only local information.")
-                if self._darkskyapi_current_usage is None:
-                    self._darkskyapi_current_usage = 1
-                else:
-                    self._darkskyapi_current_usage += 1
 
             self._darkskyapi_timestamp = datetime.now()
 
         except Exception as e:
-            logging.error("Error making query to darksky: ",e)
+            logging.error("Error making query to darksky: " + str(e))
             raise e
 
         # lsit with new data
@@ -342,92 +542,131 @@ class Historical_Weather(object):
 
             new_data += [x]
 
-        # get cursor
-        c = self._dbconn.cursor()
+        with self._store.write_lock:
+            # get cursor
+            c = self._dbconn.cursor()
 
-        # insert values to the database
-        try:
-            # insert new weather data
-            c.executemany('''
-            INSERT OR REPLACE INTO weather
-            (''' + ", ".join(self._get_db_columns()[1:]) + ''')
-            VALUES
-            ('''+ ",".join("?"*len(self._get_db_columns()[1:])) + ''')
-            ''', new_data)
-
-            # update the query_dates table
-            c.executemany('''
-            INSERT OR REPLACE INTO query_dates
-            (latitude, longitude, time, if_queried)
-            VALUES (?,?,?,?)
-            ''', [(coord[0],coord[1],time,True)])
+            # insert values to the database
+            try:
+                # insert new weather data
+                c.executemany('''
+                INSERT OR REPLACE INTO weather
+                (''' + ", ".join(self._get_db_columns()[1:]) + ''')
+                VALUES
+                ('''+ ",".join("?"*len(self._get_db_columns()[1:])) + ''')
+                ''', new_data)
+
+                # update the query_dates table
+                c.executemany('''
+                INSERT OR REPLACE INTO query_dates
+                (latitude, longitude, time, if_queried)
+                VALUES (?,?,?,?)
+                ''', [(coord[0],coord[1],time,True)])
+
+                # local day and hour keys of the new weather
+                self._update_time_keys(c)
 
-        except Exception as e:
-            logging.error("Error with db insertion into weather table",e)
-            self._dbconn.rollback()
-            raise e
+            except Exception as e:
+                logging.error("Error with db insertion into weather table",e)
+                self._dbconn.rollback()
+                raise e
 
-        # commit changes
-        self._dbconn.commit()
+            # commit changes
+            self._dbconn.commit()
+
+    def _update_time_keys(self, c):
+        """Fill day and hour keys of the inserted weather
+
+        :c: database cursor
+
+        """
+        update_time_keys(c, "weather", self.local_time)
 
-    def query_darksky_weather(self):
+    def query_darksky_weather(self, max_days=None):
         """Query historical weather from darksky API at required time points
 
+        The days are queried one by one: all coordinates of a day are
+        queried before starting the next day. Hence, in case the API
+        limit is reached, all but the last queried days are complete
+        and can be used for the computation of plans.
+
+        Only the days that fit into the daily allowance left for the
+        historical weather are queried (see Backfill_Scheduler), the
+        other days are left for the next days.
+
+        :max_days: maximum number of days to query. In case None
+        (default) all sampled days are queried.
+
+        returns False in case querying stopped on an error or some
+        days are left for the next days (the API limit is reached),
+        True otherwise
+
         """
-        # read dates and coordinates to query
-        query_dates = self._read_query_dates_from_db(False)
+        days = self._schedule_query_days()[:max_days]
 
-        for q in query_dates:
-            print("Requests to make: " + str(self._count_query_dates_from_db(False)))
-            try:
-                self._query_coordinate_time((q[1],q[2]), q[0])
-            except Exception as e:
-                logging.warning("Error during queries",e)
-                break
+        # number of calls needed to complete every day
+        calls = {x[0]: x[2] - x[1] for x in self._read_query_days_from_db()}
 
-    def query_local_weather(self,columns='*',where=None):
-        """Query weather data from local database
+        scheduler = Backfill_Scheduler(self.quota_ledger)
+        scheduled = scheduler.schedule([(x, calls[x]) for x in days])
 
-        :columns: columns to query (can be list or string in sql format).
+        if len(scheduled) < len(days):
+            left = [x for x in days if x not in set(scheduled)]
+            logging.info("Daily API allowance reached, days left: " + str(len(left)) +
+                         ", days needed to query them: " +
+                         str(scheduler.days_to_complete(sum(calls[x] for x in left))))
+
+        for day in scheduled:
+            # read coordinates to query at that day
+            query_dates = self._read_query_day_from_db(day, False)
+
+            for q in query_dates:
+                logging.info("Requests to make: " + str(self._count_query_dates_from_db(False)))
+                try:
+                    self._query_coordinate_time((q[1],q[2]), q[0])
+                except Exception as e:
+                    logging.warning("Error during queries: " + str(e))
+                    return False
+
+        return len(scheduled) == len(days)
+
+    @property
+    def store(self):
+        """Weather store with the initialised database
+
+        """
+        self._dbconn
+
+        return self._store
+
+    def weather_fingerprint(self, where=None, parameters=()):
+        """Compute fingerprint of the weather data in local database
+
+        The fingerprint changes whenever weather rows are added or
+        replaced.
 
         :where: where condition in terms of database column names and
         sql language
 
+        :parameters: values of the placeholders in the where condition
+
         """
-        # get column in a proper format
-        columns = ",".join(columns)
+        x = self.store.fetch('''
+        SELECT count(*), max(id)
+        FROM weather
+        ''' + ("" if where is None else "WHERE " + where), parameters)[0]
 
-        # get cursor
-        c = self._dbconn.cursor()
+        return str(x[0]) + ":" + str(x[1])
 
-        # query data from the database
-        try:
-            if where is None:
-                c.execute('''
-                SELECT
-                ''' + columns + '''
-                FROM weather
-                ''')
-            else:
-                c.execute('''
-                SELECT
-                ''' + columns + '''
-                FROM weather
-                WHERE ''' + where)
-
-            query_res = c.fetchall()
+    def query_local_weather(self, columns='*', where=None, parameters=()):
+        """Query weather data from local database
 
-        except Exception as e:
-            logging.error("Error quering data from query_dates",e)
-            self._dbconn.rollback()
-            raise e
+        :columns: columns to query (can be list or string in sql format).
 
-        # column names
-        if '*' == columns:
-            columns = self._get_db_columns()
-        else:
-            columns = columns.split(",")
+        :where: where condition in terms of database column names and
+        sql language
 
-        # convert to pandas
-        return pd.DataFrame(np.array(query_res),columns=columns)
+        :parameters: values of the placeholders in the where condition
 
+        """
+        return self.store.query("weather", columns, where, parameters)
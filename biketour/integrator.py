@@ -0,0 +1,309 @@
+#!/bin/env python
+
+"""Compiled integration of a journey plan
+
+The time stepping of Plan_With_Constant_Power._compute_plan (speed
+solve, time advance and weather lookup) written as a single loop over
+scalars. In case numba is installed the loop is compiled, otherwise
+is_available returns False and the plan is computed by NumPy.
+
+The functions repeat the arithmetic of helping_functions and
+physical_models operation by operation, so that both backends give the
+same plans (up to the last bit of the elementary functions, the
+vectorised ones of numpy may round differently). Keep them in sync
+when the model changes.
+
+"""
+
+import math
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def is_available():
+    """Check whether the compiled backend can be used
+
+    """
+    return numba is not None
+
+
+def _geodesic_distance(lat1, lon1, lat2, lon2):
+    """See helping_functions.geodesic_distance
+
+    """
+    s_lat = math.pi*lat1/180
+    s_lon = math.pi*lon1/180
+    f_lat = math.pi*lat2/180
+    f_lon = math.pi*lon2/180
+
+    t = math.cos(f_lat)*math.cos(s_lat)*math.sin((f_lon - s_lon)/2)**2 \
+        + math.sin((f_lat - s_lat)/2)**2
+
+    return 6371000*2*math.atan2(math.sqrt(t), math.sqrt(1 - t))
+
+
+def _bearing(lat1, lon1, lat2, lon2):
+    """See helping_functions.bearing
+
+    """
+    s_lat = math.pi*lat1/180
+    s_lon = math.pi*lon1/180
+    f_lat = math.pi*lat2/180
+    f_lon = math.pi*lon2/180
+
+    y = math.sin(f_lon - s_lon)*math.cos(f_lat)
+    x = math.cos(s_lat)*math.sin(f_lat) - math.sin(s_lat)*math.cos(f_lat)*math.cos(f_lon - s_lon)
+
+    return math.atan2(y, x)/math.pi*180 % 360
+
+
+def _solve_cubic(K_1, K_2, v_head, P):
+    """See Plan_With_Constant_Power._solve_cubic_batch
+
+    """
+    a = 2*v_head
+    b = v_head*v_head + K_2/K_1
+    c = -P/K_1
+
+    p = b - a*a/3
+    q = 2*a*a*a/27 - a*b/3 + c
+    D = (q/2)**2 + (p/3)**3
+
+    v = np.inf
+    if D > 0:
+        x = math.sqrt(D)
+        root = np.cbrt(-q/2 + x) + np.cbrt(-q/2 - x) - a/3
+        if root > 0:
+            v = root
+    else:
+        r = 2*math.sqrt(-p/3)
+        y = 3*q/(p*r)
+        if y < -1:
+            y = -1.0
+        elif y > 1:
+            y = 1.0
+        phi = math.acos(y)/3
+        for k in range(3):
+            root = r*math.cos(phi - 2*math.pi*k/3) - a/3
+            if root > 0 and root < v:
+                v = root
+
+    for i in range(2):
+        f = ((v + a)*v + b)*v + c
+        df = (3*v + 2*a)*v + b
+        if df != 0:
+            v = v - f/df
+
+    return v
+
+
+def _compute_drag(v_bike, air_density, v_head, v_cross, C_D_values, C_D_slopes):
+    """See Plan_With_Constant_Power._compute_drag
+
+    """
+    v_air = v_bike + v_head
+    v_cross = abs(v_cross)
+    v_apparent = math.sqrt(v_air*v_air + v_cross*v_cross)
+    yaw = math.atan2(v_cross, v_air)*(180/math.pi)
+
+    # drag coefficient from the lookup table
+    i = 0
+    if yaw >= 1:
+        i = min(int(yaw), 180)
+    C_D = C_D_values[i] + C_D_slopes[i]*(yaw - i)
+    dC_D = C_D_slopes[i]
+
+    x = v_apparent if v_apparent > 0 else 1.0
+    dyaw = (-v_cross/(x*x))*(180/math.pi)
+    dv_apparent = v_air/x
+
+    force = air_density/2*C_D*v_apparent*v_air
+    derivative = air_density/2*(dC_D*dyaw*v_apparent*v_air +
+                                C_D*(dv_apparent*v_air + v_apparent))
+
+    return force, derivative
+
+
+def _solve_speed(air_density, K_2, v_head, v_cross, P, v_start,
+                 C_D_values, C_D_slopes, max_iterations):
+    """See Plan_With_Constant_Power._solve_speed_batch
+
+    :P: power at the wheel
+
+    :v_start: starting speed, in case NaN the solution without cross
+    wind is used
+
+    """
+    if math.isnan(v_start):
+        v = _solve_cubic(air_density*C_D_values[0]/2, K_2, v_head, P)
+    else:
+        v = v_start
+
+    lo = 0.0
+    hi = np.inf
+    for i in range(max_iterations):
+        drag, derivative = _compute_drag(v, air_density, v_head, v_cross,
+                                         C_D_values, C_D_slopes)
+        f = v*(K_2 + drag) - P
+
+        if f < 0:
+            lo = v
+        if f > 0:
+            hi = v
+
+        x = v - f/(K_2 + drag + v*derivative)
+        if not (x >= lo and x <= hi):
+            if math.isfinite(hi):
+                x = (lo + hi)/2
+            else:
+                x = 2*v
+
+        converged = abs(x - v) <= 1e-10*(1 + v)
+        v = x
+
+        if converged:
+            break
+
+    return v
+
+
+def _closest_weather(w_time, w_latitude, w_longitude, latitude, longitude, time):
+    """See Plan_With_Constant_Power._get_weather_at_location_and_time
+
+    """
+    x_min = np.inf
+    for j in range(len(w_time)):
+        x = abs(w_time[j] - time)
+        if x < x_min:
+            x_min = x
+
+    res = -1
+    d_min = np.inf
+    for j in range(len(w_time)):
+        if abs(abs(w_time[j] - time) - x_min) < 1:
+            d = _geodesic_distance(latitude, longitude, w_latitude[j], w_longitude[j])
+            if res < 0 or d < d_min:
+                res = j
+                d_min = d
+
+    return res
+
+
+def _lookup_time_table(time_step, time_factors, rest_times, riding):
+    """See Plan_With_Constant_Power._lookup_time_table
+
+    """
+    x = riding/time_step
+    i = int(x)
+    j = min(i, len(rest_times) - 1)
+    i = min(max(i, 0), len(time_factors) - 2)
+
+    return time_factors[i] + (time_factors[i+1] - time_factors[i])*(x - i), rest_times[j]
+
+
+def integrate_plan(latitude, longitude, elevation, time,
+                   w_time, w_latitude, w_longitude, w_windSpeed, w_windBearing,
+                   w_air_density, P_rider, terrain, time_step, time_factors,
+                   rest_times, drivetrain_efficiency, total_mass, C_rr,
+                   C_D_values, C_D_slopes, times, speeds, weather_index, riding,
+                   start=1, g_constant=9.8, max_iterations=20):
+    """Integrate the journey along the route points
+
+    The power of the rider is P_rider*terrain*time factor at every
+    segment, the rest stops are added to the arrival times.
+
+    :latitude, longitude, elevation: arrays with the route points
+
+    :time: departure time
+
+    :w_time, w_latitude, w_longitude: arrays with the time and the
+    location of the weather rows
+
+    :w_windSpeed, w_windBearing, w_air_density: arrays with the
+    weather (see Plan_With_Constant_Power._compute_air_density)
+
+    :P_rider: power of the rider
+
+    :terrain: array with power factors of the segments
+
+    :time_step, time_factors, rest_times: time table of the power
+    profile (see Power_Profile.get_time_table)
+
+    :drivetrain_efficiency, total_mass, C_rr: physical parameters of
+    the plan
+
+    :C_D_values, C_D_slopes: drag coefficient lookup table (see
+    Plan_With_Constant_Power._get_C_D_table)
+
+    :times, speeds, weather_index, riding: arrays with the length of
+    the route (see Plan_With_Constant_Power._integrate), filled in
+    place from the point start
+
+    :start: first integrated segment, the points before it are the
+    ones of a previous plan
+
+    """
+    if start <= 1:
+        times[0] = time
+        speeds[0] = np.nan
+        weather_index[0] = _closest_weather(w_time, w_latitude, w_longitude,
+                                            latitude[0], longitude[0], time)
+    else:
+        time = times[start-1]
+
+    factor, rest = _lookup_time_table(time_step, time_factors, rest_times,
+                                      riding[max(start, 1)-1])
+
+    for k in range(max(start, 1), len(latitude)):
+        i = weather_index[k-1]
+
+        distance = _geodesic_distance(latitude[k-1], longitude[k-1],
+                                      latitude[k], longitude[k])
+
+        # head and cross wind
+        x = (w_windBearing[i] - _bearing(latitude[k-1], longitude[k-1],
+                                         latitude[k], longitude[k]))*(math.pi/180)
+        v_head = w_windSpeed[i]*math.cos(x)
+        v_cross = w_windSpeed[i]*math.sin(x)
+
+        slope = (elevation[k] - elevation[k-1])/distance if distance != 0 else np.nan
+        if not math.isfinite(slope):
+            slope = 0.0
+        K_2 = total_mass*g_constant*(C_rr + math.sin(math.atan(slope)))
+
+        speeds[k] = _solve_speed(w_air_density[i], K_2, v_head, v_cross,
+                                 P_rider*terrain[k]*factor*drivetrain_efficiency,
+                                 np.nan if 1 == k else speeds[k-1],
+                                 C_D_values, C_D_slopes, max_iterations)
+
+        # riding time and rest stops
+        riding[k] = riding[k-1] + distance/speeds[k]
+        factor, rest_k = _lookup_time_table(time_step, time_factors, rest_times, riding[k])
+        time = time + (distance/speeds[k] + (rest_k - rest))
+        times[k] = time
+        rest = rest_k
+
+        weather_index[k] = _closest_weather(w_time, w_latitude, w_longitude,
+                                            latitude[k], longitude[k], time)
+
+
+if numba is not None:
+    # the GIL is released, so that plans are computed in parallel
+    # by threads (see service)
+    _jit = numba.njit(cache=True, nogil=True)
+
+    # the helpers are compiled first, so that integrate_plan calls
+    # the compiled versions
+    _geodesic_distance = _jit(_geodesic_distance)
+    _bearing = _jit(_bearing)
+    _solve_cubic = _jit(_solve_cubic)
+    _compute_drag = _jit(_compute_drag)
+    _solve_speed = _jit(_solve_speed)
+    _closest_weather = _jit(_closest_weather)
+    _lookup_time_table = _jit(_lookup_time_table)
+    integrate_plan = _jit(integrate_plan)
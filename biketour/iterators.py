@@ -1,7 +1,6 @@
 #!/bin/env python
 
-import pandas as pd
-import datetime
+import logging
 
 class Iter_Historical_Weather(object):
     """Iterator class that allows iterate over a sample of historical weather
@@ -22,34 +21,42 @@ class Iter_Historical_Weather(object):
 
 
     def _init_iter_variables(self):
-        """Get sampled weather times
+        """Get sampled weather days
+
+        The days are read from the local day keys of the weather (see
+        Local_Time).
 
         """
-        # get cursor
-        c = self.hw._dbconn.cursor()
+        days = [x[0] for x in self.hw.store.fetch('''
+        SELECT DISTINCT day
+        FROM weather
+        ORDER BY day
+        ''')]
 
-        # query data from the database
-        try:
-            c.execute('''
-            SELECT DISTINCT time
-            FROM weather
-            ORDER BY time
-            ''')
+        days = self._filter_complete_days(days)
 
-            self._times = pd.DataFrame(c.fetchall(),columns=['time'])
-        except Exception as e:
-            logging.error("Error quering data from weather table",e)
-            self.hw._dbconn.rollback()
-            raise e
+        self._days = {self.hw.local_time.date(x): x for x in days}
+        self._dates = list(self._days.keys())
+        self.i = 0
+        self.n = len(self._dates)
 
-        self.hw._dbconn.commit()
 
-        self._times['datetime'] = self._times.apply(datetime.datetime.fromtimestamp,axis=1)
-        self._times['date'] = self._times['datetime'].apply(lambda x: (x.year,x.month,x.day))
+    def _filter_complete_days(self, days):
+        """Keep only days for which weather at all coordinates is queried
 
-        self._dates = list(self._times['date'].drop_duplicates())
-        self.i = 0
-        self.n = len(self._dates)
+        Incomplete days do not allow to compute a plan, hence they are
+        skipped here instead of failing later in the plan computation.
+
+        :days: list of day keys
+
+        """
+        # databases without sampled days are not filtered
+        if 0 == self.hw._count_query_dates_from_db():
+            return days
+
+        complete = set(self.hw.local_time.day_keys(self.hw.complete_days()).tolist())
+
+        return [x for x in days if x in complete]
 
 
     def __next__(self, columns='*'):
@@ -59,16 +66,41 @@ class Iter_Historical_Weather(object):
         if self.i >= self.n:
             raise StopIteration()
 
-        # get minimal and maximal time for this iteration
-        m = self._times[self._times['date'] == self._dates[self.i]]['time'].min()
-        M = self._times[self._times['date'] == self._dates[self.i]]['time'].max()
-
         # increment i
         self.i += 1
 
-        return self.hw.query_local_weather(
-            columns=columns,
-            where="time >= " + str(m) + " AND time <= " + str(M))
+        return self.query_date(self._dates[self.i-1], columns=columns)
+
+
+    def get_dates(self):
+        """Get list of dates in the sample
+
+        returns list of tuples (year, month, day)
+
+        """
+        return self._dates
+
+
+    def query_date(self, date, columns='*'):
+        """Return weather at a date of the sample
+
+        :date: a tuple (year, month, day) (see get_dates)
+
+        :columns: columns to query
+
+        """
+        return self.hw.query_local_weather(columns=columns, where="day = ?",
+                                           parameters=(self._days[date],))
+
+
+    def date_fingerprint(self, date):
+        """Return fingerprint of the weather at a date of the sample
+
+        :date: a tuple (year, month, day) (see get_dates)
+
+        """
+        return self.hw.weather_fingerprint(where="day = ?",
+                                           parameters=(self._days[date],))
 
 
 class Iter_Historical_Plan(object):
@@ -102,5 +134,6 @@ class Iter_Historical_Plan(object):
                 res=self.plan._compute_plan(self.ihw.__next__(columns = self.columns))
                 flag=False
             except TypeError as e:
+                logging.warning("Skipping a day with incomplete weather: " + str(e))
                 continue
         return res
@@ -0,0 +1,221 @@
+#!/bin/env python
+
+import time as _time
+import datetime, logging
+
+import numpy as np
+import pandas as pd
+
+# ordinal of 1970-01-01 (see datetime.date.toordinal)
+EPOCH_ORDINAL = 719163
+
+class Local_Time(object):
+    """Conversion of times to the local time of the route
+
+    Times are stored as seconds since epoch. Days and hours of the
+    local time are given by integer keys: the day key is the number of
+    local days since 1970-01-01, the hour key is the hour of the local
+    wall clock. The keys of whole arrays are computed at once, the
+    timezone is only needed to find the offsets of the local time.
+
+    """
+
+    def __init__(self, timezone=None):
+        """Initialise class
+
+        :timezone: name of the timezone of the route (e.g.
+        "Europe/Berlin"). In case None the local time of the system is
+        used.
+
+        """
+        self.timezone = timezone
+
+        # name of the timezone stored with the keys
+        if timezone is None:
+            from dateutil.tz import tzlocal
+            self._tz = tzlocal()
+            self.name = "local"
+        else:
+            self._tz = timezone
+            self.name = timezone
+
+    def _local_seconds(self, time):
+        """Convert times to seconds since epoch of the local wall clock
+
+        The offsets are computed once for every distinct time.
+
+        :time: array with times (seconds since epoch)
+
+        """
+        time = np.asarray(time, dtype=np.int64).ravel()
+        unique, inverse = np.unique(time, return_inverse=True)
+
+        local = pd.to_datetime(unique, unit='s', utc=True)\
+                  .tz_convert(self._tz).tz_localize(None)
+        local = local.values.astype('datetime64[s]').astype(np.int64)
+
+        return local[inverse]
+
+    def time_keys(self, time):
+        """Get day and hour keys of times
+
+        :time: array with times (seconds since epoch)
+
+        returns tuple of integer arrays (day keys, hour keys)
+
+        """
+        x = self._local_seconds(time)
+
+        return x//86400, x%86400//3600
+
+    def day_keys(self, time):
+        """Get day keys of times
+
+        :time: array with times (seconds since epoch)
+
+        """
+        return self.time_keys(time)[0]
+
+    def hour_keys(self, time):
+        """Get hour keys of times
+
+        :time: array with times (seconds since epoch)
+
+        """
+        return self.time_keys(time)[1]
+
+    def date(self, day):
+        """Convert day key to date
+
+        returns tuple (year, month, day)
+
+        """
+        x = datetime.date.fromordinal(EPOCH_ORDINAL + int(day))
+
+        return (x.year, x.month, x.day)
+
+    def day(self, date):
+        """Convert date to day key
+
+        :date: tuple (year, month, day)
+
+        """
+        return datetime.date(*date).toordinal() - EPOCH_ORDINAL
+
+    def timestamp(self, x):
+        """Convert local wall clock time to seconds since epoch
+
+        Times repeated at the end of daylight saving time are taken
+        the first time, skipped times are shifted forward.
+
+        :x: datetime object without timezone
+
+        """
+        x = pd.Timestamp(x).tz_localize(self._tz, ambiguous=True,
+                                        nonexistent='shift_forward')
+
+        return int(x.timestamp())
+
+    def midnights(self, days):
+        """Get times of local midnights
+
+        :days: list of day keys
+
+        returns integer array with times (seconds since epoch)
+
+        """
+        return np.array([self.timestamp(datetime.datetime.combine(
+            datetime.date.fromordinal(EPOCH_ORDINAL + int(x)), datetime.time()))
+                         for x in days], dtype=np.int64)
+
+    def now(self):
+        """Get current time (seconds since epoch)
+
+        """
+        return int(_time.time())
+
+    def today(self):
+        """Get day key of the current local day
+
+        """
+        return int(self.day_keys([self.now()])[0])
+
+
+def update_time_keys(c, table, local_time):
+    """Fill day and hour keys of the rows without them
+
+    :c: database cursor
+
+    :table: name of the table with a time column
+
+    :local_time: Local_Time object
+
+    """
+    c.execute('''
+    SELECT DISTINCT time
+    FROM ''' + table + '''
+    WHERE day IS NULL
+    ''')
+    time = [x[0] for x in c.fetchall()]
+    if 0 == len(time):
+        return
+
+    day, hour = local_time.time_keys(time)
+
+    c.executemany('''
+    UPDATE ''' + table + '''
+    SET day = ?, hour = ?
+    WHERE day IS NULL AND time = ?
+    ''', zip(day.tolist(), hour.tolist(), time))
+
+
+def init_time_keys(c, table, local_time):
+    """Initialise day and hour keys of a table
+
+    Columns and the index are added to tables created before the
+    keys were introduced. The timezone of the keys is stored, the keys
+    are recomputed in case it changes.
+
+    :c: database cursor
+
+    :table: name of the table with day and hour columns
+
+    :local_time: Local_Time object
+
+    """
+    c.execute('''PRAGMA table_info(''' + table + ''')''')
+    columns = [x[1] for x in c.fetchall()]
+    for x in ['day', 'hour']:
+        if x not in columns:
+            c.execute('''ALTER TABLE ''' + table + ''' ADD COLUMN ''' + x + ''' INTEGER''')
+
+    c.execute('''
+    CREATE INDEX IF NOT EXISTS idx_''' + table + '''_day_hour
+    ON ''' + table + ''' (day, hour)
+    ''')
+
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS time_keys
+    (
+    table_name          VARCHAR(255) PRIMARY KEY,
+    timezone            VARCHAR(255) NOT NULL
+    )''')
+
+    c.execute('''
+    SELECT timezone
+    FROM time_keys
+    WHERE table_name = ?
+    ''', (table,))
+    x = c.fetchone()
+
+    if x is None or x[0] != local_time.name:
+        if x is not None:
+            logging.info("Timezone of " + table + " changed, recomputing day and hour keys")
+        c.execute('''UPDATE ''' + table + ''' SET day = NULL, hour = NULL''')
+        c.execute('''
+        INSERT OR REPLACE INTO time_keys
+        (table_name, timezone)
+        VALUES (?,?)
+        ''', (table, local_time.name))
+
+    update_time_keys(c, table, local_time)
@@ -0,0 +1,119 @@
+#!/bin/env python
+
+import numpy as np
+import pandas as pd
+
+import time, logging
+
+class Monte_Carlo_Trip_Time(object):
+    """Distribution of trip times from resampled historical weather
+
+    Synthetic weather days are built by block resampling: the day is
+    split into blocks of consecutive hours, starting at the departure
+    hour, and the weather of every block (at all clusters at once) is
+    taken from a randomly chosen historical day. The synthetic days
+    are pushed through the batched plan computation of the plan
+    object.
+
+    Trips shorter than a block take all their weather from a single
+    historical day, i.e. they are not resampled (a warning is logged).
+
+    """
+
+    # weather variables needed by the plan computation
+    _variables = ['windSpeed','windBearing','pressure','temperature','humidity']
+
+    def __init__(self, plan, archive, block_hours=3, seed=None):
+        """Initialise the class
+
+        :plan: plan object with _compute_plan_batch method
+        (e.g. Plan_With_Constant_Power)
+
+        :archive: opened Weather_Archive with historical weather
+
+        :block_hours: number of consecutive hours taken from the same
+        historical day
+
+        :seed: random seed
+
+        """
+        self.plan = plan
+        self.archive = archive
+        self._block_hours = block_hours
+        self._rng = np.random.RandomState(seed)
+
+        # decoded weather (days x hours x clusters)
+        self._weather = {x: self.archive.get_variable(x) for x in self._variables}
+
+        # only days without missing weather are resampled
+        missing = np.zeros(self._weather['windSpeed'].shape[0], dtype=bool)
+        for x in self._variables:
+            missing |= np.isnan(self._weather[x]).any(axis=(1,2))
+        self._days = np.flatnonzero(~missing)
+
+        if 0 == len(self._days):
+            raise RuntimeError("No complete days in the weather archive")
+
+    def sample_weather(self, n):
+        """Build synthetic weather days
+
+        :n: number of days
+
+        returns dictionary with weather arrays (n x hours x clusters)
+
+        """
+        n_hours = self._weather['windSpeed'].shape[1]
+
+        # blocks of the hours, the first block starts at the departure
+        first = int(np.clip(np.rint(self.plan.departure_hour), 0, n_hours - 1))
+        block = (np.arange(n_hours) - first) // self._block_hours
+        block -= block.min()
+
+        source = self._rng.choice(self._days, size=(n, block.max() + 1))
+        source = source[:, block]
+
+        hours = np.arange(n_hours)[None,:]
+
+        return {x: y[source, hours] for x, y in self._weather.items()}
+
+    def simulate(self, n, batch_size=1000):
+        """Simulate trip times
+
+        :n: number of simulated trips
+
+        :batch_size: number of trips computed at once
+
+        returns array with trip times (in seconds)
+
+        """
+        res = []
+        t = time.time()
+
+        for i in range(0, n, batch_size):
+            times, _ = self.plan._compute_plan_batch(self.sample_weather(min(batch_size, n - i)),
+                                                     self.archive.coordinates)
+            res += [times[:,-1] - times[:,0]]
+
+            if 0 == i and np.nanmax(res[-1]) < 3600*self._block_hours:
+                logging.warning("Trips are shorter than a block of " +
+                                str(self._block_hours) + " hours, the weather of "
+                                "every trip is taken from a single historical day")
+
+            logging.info("Simulating trips, progress: " + str(i + len(res[-1])) +
+                         " (" + str(int(60*(i + len(res[-1]))/(time.time() - t))) + " trips/min)")
+
+        return np.concatenate(res)
+
+    def quantiles(self, n, q=(0.01,0.05,0.1,0.25,0.5,0.75,0.9,0.95,0.99), batch_size=1000):
+        """Simulate trip times and compute their quantiles
+
+        :n: number of simulated trips
+
+        :q: quantiles
+
+        :batch_size: number of trips computed at once
+
+        returns pandas Series with trip time quantiles
+
+        """
+        return pd.Series(np.quantile(self.simulate(n, batch_size), q), index=q)
@@ -1,12 +1,12 @@
 #!/bin/env python
 
-import numpy.polynomial.polynomial as poly
-
-from helping_functions import geodesic_distance, bearing
+from helping_functions import geodesic_distance, geodesic_distance_array, bearing
 
 from iterators import Iter_Historical_Plan
+from plan_result import Plan_Result
+from power_profiles import Power_Profile
 
-import datetime
+import integrator
 
 import math
 
@@ -14,13 +14,21 @@ import numpy as np
 
 import pandas as pd
 
-from pdb import set_trace as bp
-
 class Plan_With_Constant_Power(object):
     """ Compute plan given a constant power
 
     """
 
+    # version of the model, to be increased on every change of the
+    # computed plans (invalidates cached plan characteristics)
+    MODEL_VERSION = 3
+
+    # drag coefficient relative to C_D at the yaw angles of the
+    # apparent wind (in degrees, 0 means the apparent wind from the
+    # front), interpolated linearly
+    C_D_YAW_TABLE = (np.array([0, 5, 10, 15, 20, 30, 45, 60, 90, 180]),
+                     np.array([1.0, 1.0, 1.01, 1.03, 1.05, 1.08, 1.12, 1.15, 1.15, 1.0]))
+
     def __init__(self, starting_time,
                  route, historical_weather, weather_forecast,
                  **kwargs):
@@ -42,6 +50,10 @@ class Plan_With_Constant_Power(object):
         self.wf = weather_forecast
         self.ihp = Iter_Historical_Plan(self)
 
+        # states of the last forecast plans by forecast day (see
+        # update_plan)
+        self._forecast_states = {}
+
         # parse kwargs for set parameters
         self._parse_kwargs(kwargs)
 
@@ -74,135 +86,315 @@ class Plan_With_Constant_Power(object):
         else:
             self._C_rr = 0.005
 
+        if "power_profile" in kwargs.keys():
+            self._power_profile = kwargs["power_profile"]
+        else:
+            self._power_profile = Power_Profile()
+
+        if "backend" in kwargs.keys():
+            self._backend = kwargs["backend"]
+        else:
+            self._backend = "auto"
+
+        if self._backend not in ("auto", "numpy", "numba"):
+            raise ValueError("Unknown backend: " + str(self._backend))
+
+        if "numba" == self._backend and not integrator.is_available():
+            raise ImportError("The numba backend requires numba to be installed")
+
+    def get_parameters(self):
+        """Get physical parameters of the model
+
+        The parameters of the power profile are included.
+
+        """
+        res = {'total_mass': self._total_mass,
+               'P_rider': self._P_rider,
+               'drivetrain_efficiency': self._drivetrain_efficiency,
+               'C_D': self._C_D,
+               'C_rr': self._C_rr}
+        res.update(self._power_profile.get_parameters())
+
+        return res
+
+    def get_kwargs(self):
+        """Get keyword arguments creating the same model
+
+        Unlike get_parameters, the power profile and the backend are
+        given as they are.
+
+        """
+        return {'total_mass': self._total_mass,
+                'P_rider': self._P_rider,
+                'drivetrain_efficiency': self._drivetrain_efficiency,
+                'C_D': self._C_D,
+                'C_rr': self._C_rr,
+                'power_profile': self._power_profile,
+                'backend': self._backend}
+
     def _get_weather_at_location_and_time(self, weather, location, time):
         """Get the closest weather at location and time
 
-        :weather: pandas dataframe with time, latitude and longitude
+        :weather: dictionary with time, latitude and longitude arrays
+        of the weather
 
-        :location: location of interest
+        :location: location of interest (latitude, longitude)
 
         :time: time of interest
+
+        returns position of the weather row
         """
         # select items with smallest
-        x = (weather['time'] - time).apply(abs)
-        res = weather[(x-x.min()).abs() < 1].copy()
+        x = np.abs(weather['time'] - time)
+        idx = np.flatnonzero(np.abs(x - x.min()) < 1)
 
         # select with closest coordinates
-        res['distance'] = [geodesic_distance((location.latitude,location.longitude),x)
-                           for x in zip(res.latitude, res.longitude)]
-        res = res.loc[res['distance'].idxmin()]
-        res = res.drop(columns=['distance'])
+        distance = geodesic_distance_array(location[0], location[1],
+                                           weather['latitude'][idx],
+                                           weather['longitude'][idx])
 
-        return res
+        return idx[np.argmin(distance)]
 
-    def _convert_departure_hour(self, departure_hour, weather):
-        """Convert departure hour to the given weather time frame
+    def _use_compiled_backend(self):
+        """Check whether _compute_plan uses the compiled integrator
+
+        The compiled integrator (see integrator) is used in case numba
+        is installed, unless the numpy backend is requested.
 
         """
-        x = (weather['time'].apply(lambda x: datetime.datetime.fromtimestamp(x).hour) - departure_hour).apply(abs)
+        return "numpy" != self._backend and integrator.is_available()
+
+    def _lookup_time_table(self, riding):
+        """Time factors and rest times of the power profile
 
-        return int(weather['time'][x.idxmin()])
+        Looked up in the time table of the profile (see
+        Power_Profile.get_time_table).
 
+        :riding: riding time since departure (in seconds, without
+        rest stops), a number or an array
+
+        returns tuple (time factors, rest times)
 
-    def _compute_absolute_of_air_speed(self, coord_prev, coord_cur, windSpeed, windBearing):
         """
+        step, factors, rests = self._power_profile.get_time_table()
+
+        x = np.asarray(riding, dtype=float)/step
+        i = np.clip(x.astype(np.int64), 0, len(factors) - 2)
+        j = np.minimum(x.astype(np.int64), len(rests) - 1)
+
+        return factors[i] + (factors[i+1] - factors[i])*(x - i), rests[j]
+
+    def _convert_departure_hour(self, departure_hour, weather):
+        """Convert departure hour to the given weather time frame
+
+        The local hours are the hour keys stored with the weather, or
+        computed by the time layer of the historical weather (see
+        Local_Time) in case they are missing.
 
-        :data: pandas DataFrame with coordinates, windSpeed and windBearing
         """
-        routeBearing = bearing(start = coord_prev, finish = coord_cur)
+        if 'hour' in weather:
+            hour = weather['hour'].values.astype(float)
+        else:
+            hour = self.hw.local_time.hour_keys(weather['time'].values)
 
-        return windSpeed*math.cos(routeBearing - windBearing)
+        return int(weather['time'].iloc[np.argmin(np.abs(hour - departure_hour))])
 
 
-    def _power_model(self,
-                     P_rider, total_mass, v_wind, slope,
-                     air_pressure, air_temperature, air_relative_humidity,
-                     drivetrain_efficiency, C_D, C_rr,
-                     specific_gas_constant_dry_air = 287.058,
-                     specific_gas_constant_water_vapor = 461.495,
-                     g_constant=9.8):
-        """ Compute rider speed given power and other parameters
+    def _compute_air_speed(self, route_bearing, windSpeed, windBearing):
+        """Decompose the wind into head and cross wind
 
-        :P_rider: power of the rider (Watts)
+        :route_bearing: bearing of the route (in degrees)
 
-        :total_mass: total mass of the rider (kg)
+        :windSpeed: wind speed (m/s)
 
-        :v_wind: absolute speed of head wind (m/s)
+        :windBearing: direction the wind is coming from (in degrees)
 
-        :slope: ckimbing slope (ratio of height and length)
+        returns tuple (head wind, cross wind) in m/s, the head wind is
+        negative for tail wind
 
-        :air_pressure: air pressure (Pa)
+        """
+        x = np.radians(np.asarray(windBearing, dtype=float) - route_bearing)
 
-        :air_temperature: air temperature (K)
+        return windSpeed*np.cos(x), windSpeed*np.sin(x)
 
-        :air_relative_humidity: relative humidity (in interval [0,1])
+    def _compute_air_density(self, air_pressure, air_temperature, air_relative_humidity,
+                             specific_gas_constant_dry_air = 287.058,
+                             specific_gas_constant_water_vapor = 461.495):
+        """Compute density of humid air
 
-        :drivetrain_efficiency: efficiency of the drivetrain
+        :air_pressure: air pressure (Pa)
 
-        :C_D: drag coefficient (default is questionable)
+        :air_temperature: air temperature (K)
 
-        :C_rr: rolling resistance coefficient
+        :air_relative_humidity: relative humidity (in interval
+        [0,1]), missing values are taken as dry air
 
         :specific_gas_constant_dry_air: specific gas constant for dry air (J/(kg*K))
 
         :specific_gas_constant_water_vapor: specific gas constant for water vapor (J/(kg*K))
 
-        :g_constant: free-body acceleration
+        """
+        humidity = np.asarray(air_relative_humidity, dtype=float)
+        humidity = np.where(np.isfinite(humidity), humidity, 0)
+
+        # partial pressures of water vapor (Tetens formula) and dry air
+        p_v = humidity*610.78*10**(7.5*(air_temperature-273.15)/(air_temperature-35.85))
+        p_d = air_pressure - p_v
+
+        return (p_d/specific_gas_constant_dry_air +
+                p_v/specific_gas_constant_water_vapor)/air_temperature
+
+    def _get_C_D_table(self):
+        """Lookup table of the drag coefficient at every degree of yaw
+
+        The table is computed once from C_D_YAW_TABLE.
+
+        returns tuple of arrays (drag coefficients, their slopes)
+
+        """
+        if getattr(self, '_C_D_table', None) is None:
+            x = np.interp(np.arange(182), self.C_D_YAW_TABLE[0], self.C_D_YAW_TABLE[1])
+            self._C_D_table = (self._C_D*x[:-1], self._C_D*np.diff(x))
+
+        return self._C_D_table
+
+    def _compute_C_D(self, yaw):
+        """Drag coefficient at the yaw angles of the apparent wind
+
+        Interpolated linearly from the lookup table (see
+        _get_C_D_table)
+
+        :yaw: array with yaw angles (in degrees, from 0 to 180)
+
+        returns tuple (drag coefficient, its derivative by the yaw
+        angle)
+
+        """
+        values, slopes = self._get_C_D_table()
+
+        i = np.clip(np.asarray(yaw).astype(int), 0, 180)
+
+        return values[i] + slopes[i]*(yaw - i), slopes[i]
+
+    def _compute_drag(self, v_bike, air_density, v_head, v_cross):
+        """Aerodynamic force against the direction of riding
+
+        The apparent wind is the sum of the head wind and the bike
+        speed, and the cross wind. The drag acts along the apparent
+        wind, its component along the route is returned.
+
+        :v_bike: bike speed (m/s)
+
+        :air_density: air density (kg/m^3)
+
+        :v_head, v_cross: head and cross wind (m/s)
+
+        returns tuple (force, derivative of the force by the bike
+        speed)
 
         """
-        # p_v = air_relative_humidity*610.78*10**(7.5*(air_temperature-273.15)/(air_temperature-35.85))
-        # p_d = air_pressure - p_v
-        # K_1 = (p_d/specific_gas_constant_dry_air + p_v/specific_gas_constant_water_vapor)*C_D/(2*air_temperature)
+        v_air = v_bike + v_head
+        v_cross = np.abs(v_cross)
+        v_apparent = np.sqrt(v_air*v_air + v_cross*v_cross)
+        yaw = np.degrees(np.arctan2(v_cross, v_air))
+
+        C_D, dC_D = self._compute_C_D(yaw)
+
+        # derivatives of the yaw angle and the apparent wind speed
+        x = np.where(v_apparent > 0, v_apparent, 1)
+        dyaw = np.degrees(-v_cross/(x*x))
+        dv_apparent = v_air/x
 
-        K_1 = (air_pressure/specific_gas_constant_dry_air)*C_D/(2*air_temperature)
+        force = air_density/2*C_D*v_apparent*v_air
+        derivative = air_density/2*(dC_D*dyaw*v_apparent*v_air +
+                                    C_D*(dv_apparent*v_air + v_apparent))
 
-        K_2 = total_mass*g_constant * (C_rr + math.sin(math.atan(slope)))
+        return force, derivative
 
-        v_bike = poly.polyroots([-P_rider*drivetrain_efficiency/K_1,
-                                 v_wind*v_wind + K_2/K_1,
-                                 -2*v_wind,
-                                 1])
+    def _power_model(self, P_rider, v_head, v_cross, slope, air_density,
+                     v_start=None, g_constant=9.8):
+        """ Compute rider speed given power and other parameters
+
+        The total mass, the drivetrain efficiency, the drag and the
+        rolling resistance coefficients are the ones of the plan.
 
-        # get a real root
-        return float(np.real(v_bike[np.angle(v_bike) == 0])[0])
+        :P_rider: power of the rider (Watts)
 
-    def _compute_time(self, prev_point, cur_loc):
+        :v_head: head wind (m/s), negative for tail wind
+
+        :v_cross: cross wind (m/s)
+
+        :slope: ckimbing slope (ratio of height and length)
+
+        :air_density: air density (kg/m^3) (see _compute_air_density)
+
+        :v_start: starting speed of the solver (see _solve_speed_batch)
+
+        :g_constant: free-body acceleration
+
+        """
+        K_2 = self._total_mass*g_constant * (self._C_rr + math.sin(math.atan(slope)))
+
+        return float(self._solve_speed_batch(np.array([air_density], dtype=float),
+                                             np.array([K_2]),
+                                             np.array([v_head], dtype=float),
+                                             np.array([v_cross], dtype=float),
+                                             np.array([P_rider], dtype=float),
+                                             None if v_start is None else np.array([v_start]))[0])
+
+    def _compute_speed(self, coord_prev, coord_cur, elevation_prev, elevation_cur,
+                       weather, i, P_rider=None, v_start=None):
         """Compute adjusted speed
 
-        :plan_point: a tuple with location, weather and time
+        :coord_prev: previous location (latitude, longitude)
+
+        :coord_cur: current location (latitude, longitude)
 
-        :cur_loc: current locations
+        :elevation_prev: elevation of the previous location
+
+        :elevation_cur: elevation of the current location
+
+        :weather: dictionary with windSpeed, windBearing and
+        air_density arrays
+
+        :i: position of the weather row at the previous location
+
+        :P_rider: power of the rider. In case None P_rider of the
+        plan is used.
+
+        :v_start: starting speed of the solver (e.g. the speed at the
+        previous segment)
+
+        returns tuple (distance, speed)
 
         """
         # compute distance
-        distance = geodesic_distance(prev_point[0][['latitude','longitude']],
-                                     cur_loc[['latitude','longitude']])
+        distance = geodesic_distance(coord_prev, coord_cur)
 
-        # compute absolute wind
-        v_wind = self._compute_absolute_of_air_speed(prev_point[0][['latitude','longitude']],
-                                                     cur_loc[['latitude','longitude']],
-                                                     prev_point[1].windSpeed,
-                                                     prev_point[1].windBearing)
+        # compute head and cross wind
+        v_head, v_cross = self._compute_air_speed(bearing(start = coord_prev,
+                                                          finish = coord_cur),
+                                                  weather['windSpeed'][i],
+                                                  weather['windBearing'][i])
 
         # compute slope
-        try:
-            slope = (np.array(cur_loc.elevation) - np.array(prev_point[0].elevation))/distance
-        except Exception as e:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = (elevation_cur - elevation_prev)/distance
+        if not np.isfinite(slope):
             slope = 0
 
         # compute adjusted bike speed
-        v_bike = self._power_model(P_rider = self._P_rider,
-                                   total_mass = self._total_mass,
-                                   v_wind = v_wind,
+        if P_rider is None:
+            P_rider = self._P_rider
+
+        v_bike = self._power_model(P_rider = P_rider,
+                                   v_head = v_head,
+                                   v_cross = v_cross,
                                    slope = slope,
-                                   air_pressure = prev_point[1].pressure*100,
-                                   air_temperature = prev_point[1].temperature + 273.15,
-                                   air_relative_humidity = prev_point[1].humidity,
-                                   drivetrain_efficiency = self._drivetrain_efficiency,
-                                   C_D = self._C_D,
-                                   C_rr = self._C_rr)
+                                   air_density = weather['air_density'][i],
+                                   v_start = v_start)
 
-        return distance/v_bike
+        return distance, v_bike
 
     def _compute_plan(self, weather):
         """Compute the journey plan given a weather during the whole day
@@ -213,53 +405,372 @@ class Plan_With_Constant_Power(object):
         :weather_at_that_day: weather at the day (at least starting
         from the departure time)
 
+        returns Plan_Result
+
+        """
+        return self._compute_plan_state(weather)['result']
+
+    def _compute_plan_state(self, weather, state=None):
+        """Compute the journey plan and keep the state of the segments
+
+        In case the state of a previous plan is given, the journey is
+        integrated again only from the first segment whose weather
+        changed (see _first_changed_segment). The segments before it
+        are taken from the previous plan.
+
+        :weather: weather at the day (see _compute_plan)
+
+        :state: state of a previous plan, returned by this method
+
+        returns dictionary with the weather arrays, the departure time,
+        the arrays of the segments (times, speeds, weather_index,
+        riding), the first integrated segment and the Plan_Result
+
         """
         # get route together with corresponding weather coordinates
-        route = self.route.get_join_coordinates()
+        route = self.route.get_join_coordinates()\
+                          .sort_values('point_no').reset_index(drop=True)
+        weather = weather.reset_index(drop=True)
 
         # convert departure time to the time of the weather timestamp
         time = self._convert_departure_hour(self.departure_hour,weather)
 
-        plan = []
+        # arrays used in the computations
+        lat = route['latitude'].values.astype(float)
+        lon = route['longitude'].values.astype(float)
+        elevation = pd.to_numeric(route['elevation'], errors='coerce').values
+        w = self._get_weather_arrays(weather)
+
+        # power factors of the segments (see Power_Profile)
+        terrain = self._power_profile.terrain_factor(self.route.get_segments()['slope'].values)
+
+        n = len(route)
+        if state is None or len(state['times']) != n:
+            start = 1
+            times = np.empty(n)
+            speeds = np.full(n, np.nan)
+            weather_index = np.empty(n, dtype=np.int64)
+            riding = np.zeros(n)
+        else:
+            start = self._first_changed_segment(state, w, time)
+            times = state['times'].copy()
+            speeds = state['speeds'].copy()
+            weather_index = state['weather_index'].copy()
+            riding = state['riding'].copy()
 
-        # iterate through each location
-        for k in route['point_no']:
-            # get current location
-            l = route.loc[route['point_no'] == k].squeeze()
+        if start < n:
+            self._integrate(lat, lon, elevation, time, w, terrain,
+                            times, speeds, weather_index, riding, start)
+
+        return {'w': w, 'time': time,
+                'times': times, 'speeds': speeds,
+                'weather_index': weather_index, 'riding': riding,
+                'start': start,
+                'result': Plan_Result(route, weather, times, speeds, weather_index)}
+
+    def _first_changed_segment(self, state, w, time):
+        """Find the first segment whose weather input changed
+
+        A segment depends on the weather row at its starting point
+        (wind and air density). In case the departure time, or the
+        times and locations of the weather rows changed, all segments
+        change.
+
+        :state: state of the previous plan (see _compute_plan_state)
+
+        :w: dictionary with the new weather arrays
+
+        :time: new departure time
+
+        returns position of the first changed segment, the number of
+        route points in case nothing changed
+
+        """
+        previous = state['w']
+        if time != state['time'] or \
+           any(not np.array_equal(previous[x], w[x]) for x in ['time','latitude','longitude']):
+            return 1
+
+        changed = np.zeros(len(w['time']), dtype=bool)
+        for x in ['windSpeed','windBearing','air_density']:
+            changed |= ~((previous[x] == w[x]) | (np.isnan(previous[x]) & np.isnan(w[x])))
+
+        k = np.flatnonzero(changed[state['weather_index'][:-1]])
+
+        return 1 + k[0] if len(k) else len(state['times'])
+
+    def _get_weather_arrays(self, weather):
+        """Get arrays of the weather used in the plan computations
+
+        :weather: pandas DataFrame with weather (index from 0)
+
+        returns dictionary with arrays of the weather columns and the
+        air density
+
+        """
+        w = {x: pd.to_numeric(weather[x], errors='coerce').values.astype(float)
+             for x in ['time','latitude','longitude','windSpeed','windBearing',
+                       'pressure','temperature','humidity']}
+        w['air_density'] = self._compute_air_density(
+            air_pressure = w['pressure']*100,
+            air_temperature = w['temperature'] + 273.15,
+            air_relative_humidity = w['humidity'])
+
+        return w
 
-            # if starting point. Here we assume that at the start
-            # point_no has value 0
-            if 0 == k:
-                # get current weather at starting point
-                w = self._get_weather_at_location_and_time(weather, l, time)
+    def _integrate(self, lat, lon, elevation, time, w, terrain,
+                   times, speeds, weather_index, riding, start=1):
+        """Integrate the journey along the route points
 
-                plan += [(l,w,time)]
-                continue
+        The arrays are filled in place from the point start. The
+        points before start are the ones of a previous plan.
 
+        :lat, lon, elevation: arrays with the route points
+
+        :time: departure time
+
+        :w: dictionary with the weather arrays
+
+        :terrain: array with power factors of the segments (see
+        Power_Profile)
+
+        :times, speeds, weather_index: arrays with the arrival times,
+        speeds and weather rows at the points (see Plan_Result)
+
+        :riding: array with riding times without rest stops, the
+        first value is the riding time at the departure
+
+        :start: first integrated segment
+
+        """
+        if self._use_compiled_backend():
+            C_D_values, C_D_slopes = self._get_C_D_table()
+            time_step, time_factors, rest_times = self._power_profile.get_time_table()
+            integrator.integrate_plan(lat, lon, elevation.astype(float), float(time),
+                                      w['time'], w['latitude'], w['longitude'],
+                                      w['windSpeed'], w['windBearing'], w['air_density'],
+                                      float(self._P_rider), terrain.astype(float),
+                                      time_step, time_factors, rest_times,
+                                      float(self._drivetrain_efficiency),
+                                      float(self._total_mass), float(self._C_rr),
+                                      C_D_values, C_D_slopes,
+                                      times, speeds, weather_index, riding, start)
+            return
+
+        if start <= 1:
+            # weather at the starting point
+            times[0] = time
+            weather_index[0] = self._get_weather_at_location_and_time(w, (lat[0],lon[0]), time)
+        else:
+            time = times[start-1]
+
+        # power profile at the riding time (see _lookup_time_table)
+        factor, rest = self._lookup_time_table(riding[max(start,1)-1])
+
+        # iterate through each location
+        for k in range(max(start,1),len(times)):
             # compute required time
-            time += self._compute_time(plan[-1], l)
+            P_rider = self._P_rider*terrain[k]*float(factor)
+            distance, speeds[k] = self._compute_speed((lat[k-1],lon[k-1]), (lat[k],lon[k]),
+                                                      elevation[k-1], elevation[k],
+                                                      w, weather_index[k-1], P_rider,
+                                                      None if 1 == k else speeds[k-1])
+
+            # riding time and rest stops
+            riding[k] = riding[k-1] + distance/speeds[k]
+            factor, rest_k = self._lookup_time_table(riding[k])
+            time += distance/speeds[k] + (float(rest_k) - float(rest))
+            times[k] = time
+            rest = rest_k
 
             # get weather at the reached point
-            w = self._get_weather_at_location_and_time(weather, l, time)
+            weather_index[k] = self._get_weather_at_location_and_time(w, (lat[k],lon[k]), time)
 
-            plan += [(l,w,time)]
+    def _solve_cubic_batch(self, K_1, K_2, v_head, P):
+        """Compute rider speeds at a fixed drag coefficient and no cross wind
 
-        # return plan
-        return self._convert_list_plan_to_pandas(plan)
+        Solves P = v*(K_2 + K_1*(v + v_head)^2) for arrays of
+        constants, the smallest positive real root of the cubic
+        equation is taken. The roots are computed analytically
+        (Cardano formula or trigonometric method for three real roots)
+        and refined by Newton steps.
 
-    def _convert_list_plan_to_pandas(self,plan):
-        """Convert plan list to pandas
+        :K_1: array with air drag constants (air density*C_D/2)
 
-        The list consists of tuples: (location, weather, time)
+        :K_2: array with gravity and rolling resistance constants
+
+        :v_head: array with head wind (m/s)
+
+        :P: array with powers at the wheel (Watts)
 
         """
-        res = []
-        for x in plan:
-            res += [pd.concat([x[0],
-                               x[1].rename(lambda x: "w_" + x),
-                               pd.Series(x[2]).rename(lambda x: "time")])]
+        # v^3 + a v^2 + b v + c = 0
+        a = 2*v_head
+        b = v_head*v_head + K_2/K_1
+        c = -P/K_1
+
+        # depressed cubic x^3 + p x + q = 0, v = x - a/3
+        p = b - a*a/3
+        q = 2*a*a*a/27 - a*b/3 + c
+        D = (q/2)**2 + (p/3)**3
+
+        roots = np.full((3,) + np.shape(a), np.nan)
+
+        with np.errstate(invalid='ignore'):
+            # single real root
+            one = D > 0
+            x = np.sqrt(np.where(one, D, 0))
+            roots[0] = np.where(one, np.cbrt(-q/2 + x) + np.cbrt(-q/2 - x), np.nan)
+
+            # three real roots
+            r = 2*np.sqrt(np.where(one, np.nan, -p/3))
+            phi = np.arccos(np.clip(3*q/(p*r), -1, 1))/3
+            for k in range(3):
+                roots[k] = np.where(one, roots[k], r*np.cos(phi - 2*np.pi*k/3))
+
+        roots -= a/3
+        v = np.where(roots > 0, roots, np.inf).min(axis=0)
+
+        # refine the root
+        for i in range(2):
+            f = ((v + a)*v + b)*v + c
+            df = (3*v + 2*a)*v + b
+            with np.errstate(invalid='ignore', divide='ignore'):
+                v = np.where(df != 0, v - f/df, v)
+
+        return v
+
+    def _solve_speed_batch(self, air_density, K_2, v_head, v_cross, P_rider=None,
+                           v_start=None, max_iterations=20):
+        """Compute rider speeds for arrays of model constants
+
+        Solves the power balance
+        P_rider*drivetrain_efficiency = v*(K_2 + drag(v)),
+        where the drag depends on the apparent wind and its yaw angle
+        (see _compute_drag) by Newton steps. The steps start from the
+        solution without cross wind (see _solve_cubic_batch), or from
+        given speeds.
+
+        :air_density: array with air densities (kg/m^3)
 
-        return pd.concat(res,axis=1).transpose()
+        :K_2: array with gravity and rolling resistance constants
+
+        :v_head, v_cross: arrays with head and cross wind (m/s)
+
+        :P_rider: array with powers of the rider. In case None
+        P_rider of the plan is used.
+
+        :v_start: array with starting speeds (e.g. speeds at the
+        previous segment). In case None the solution without cross
+        wind is used.
+
+        :max_iterations: maximal number of Newton steps
+
+        """
+        if P_rider is None:
+            P_rider = self._P_rider
+        P = P_rider*self._drivetrain_efficiency
+
+        if v_start is None:
+            v = self._solve_cubic_batch(air_density*self._compute_C_D(0)[0]/2, K_2, v_head, P)
+        else:
+            v = v_start
+
+        # bracket of the root, the power balance is negative at zero speed
+        lo = np.zeros_like(v)
+        hi = np.full_like(v, np.inf)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for i in range(max_iterations):
+                drag, derivative = self._compute_drag(v, air_density, v_head, v_cross)
+                f = v*(K_2 + drag) - P
+
+                lo = np.where(f < 0, v, lo)
+                hi = np.where(f > 0, v, hi)
+
+                # bisect (or expand the bracket) in case the Newton
+                # step leaves the bracket
+                x = v - f/(K_2 + drag + v*derivative)
+                x = np.where((x >= lo) & (x <= hi), x,
+                             np.where(np.isfinite(hi), (lo + hi)/2, 2*v))
+
+                converged = np.all(np.abs(x - v) <= 1e-10*(1 + v))
+                v = x
+
+                if converged:
+                    break
+
+        return v
+
+    def _compute_plan_batch(self, weather, coordinates, g_constant=9.8):
+        """Compute journey plans for a batch of days with hourly weather
+
+        All days are integrated at once: the route is walked point by
+        point and every step is vectorised over the days.
+
+        :weather: dictionary with windSpeed, windBearing, pressure,
+        temperature and humidity arrays of the shape (days x hours x
+        clusters), with hourly weather starting at the midnight
+
+        :coordinates: array (clusters x 2) with latitude and longitude
+        of the weather clusters
+
+        :g_constant: see _power_model
+
+        returns tuple of arrays (days x points): arrival times (in
+        seconds since the midnight) and speeds
+
+        """
+        segments = self.route.get_segments()
+        distance = segments['distance'].values
+        bearing = segments['bearing'].values
+        K_2 = self._total_mass*g_constant * \
+            (self._C_rr + np.sin(np.arctan(segments['slope'].values)))
+
+        # power factors of the segments (see Power_Profile)
+        terrain = self._power_profile.terrain_factor(segments['slope'].values)
+
+        # weather cluster closest to every point
+        cluster = np.argmin(geodesic_distance_array(segments['latitude'].values[:,None],
+                                                    segments['longitude'].values[:,None],
+                                                    coordinates[None,:,0],
+                                                    coordinates[None,:,1]), axis=1)
+
+        n_days, n_hours = weather['windSpeed'].shape[:2]
+        days = np.arange(n_days)
+
+        times = np.empty((n_days, len(segments)))
+        speeds = np.full((n_days, len(segments)), np.nan)
+        riding = np.zeros(n_days)
+        factor, rest = self._lookup_time_table(riding)
+
+        # departure at the closest hourly slot
+        times[:,0] = 3600*np.clip(np.rint(self.departure_hour), 0, n_hours - 1)
+
+        for k in range(1, len(segments)):
+            # weather at the previous point
+            h = np.clip(np.rint(times[:,k-1]/3600).astype(int), 0, n_hours - 1)
+            i = cluster[k-1]
+
+            v_head, v_cross = self._compute_air_speed(bearing[k],
+                                                      weather['windSpeed'][days,h,i],
+                                                      weather['windBearing'][days,h,i])
+            air_density = self._compute_air_density(weather['pressure'][days,h,i]*100,
+                                                    weather['temperature'][days,h,i] + 273.15,
+                                                    weather['humidity'][days,h,i])
+
+            P_rider = self._P_rider*terrain[k]*factor
+            speeds[:,k] = self._solve_speed_batch(air_density, np.full(n_days, K_2[k]),
+                                                  v_head, v_cross, P_rider,
+                                                  v_start=None if 1 == k else speeds[:,k-1])
+
+            # riding time and rest stops
+            riding = riding + distance[k]/speeds[:,k]
+            factor, rest_k = self._lookup_time_table(riding)
+            times[:,k] = times[:,k-1] + distance[k]/speeds[:,k] + (rest_k - rest)
+            rest = rest_k
+
+        return times, speeds
 
     def historical_plans(self):
         """Iterator through historical plans
@@ -274,4 +785,119 @@ class Plan_With_Constant_Power(object):
         tomorrow
 
         """
-        return self._compute_plan(self.wf.forecast(forecast_days))
+        return self.update_plan(forecast_days)[0]
+
+    def resume_plan(self, latitude, longitude, timestamp, previous_offset=None,
+                    riding_time=None, forecast_days=0):
+        """Compute plan of the rest of the journey from a position during the ride
+
+        The position is projected onto the route (see
+        Route.get_projection_index) and the journey is integrated from
+        there with the current forecast.
+
+        :latitude, longitude: current position (e.g. a GPS fix)
+
+        :timestamp: time at the position (unix time)
+
+        :previous_offset: offset along the route (in meters) of the
+        previous position, used to choose the pass on loops and
+        out-and-back sections
+
+        :riding_time: riding time since the departure (in seconds,
+        without rest stops). In case None, the time elapsed since the
+        departure of the plan is used.
+
+        :forecast_days: forecast day of the ride, default 0 means today
+
+        returns tuple (Plan_Result of the rest of the journey starting
+        at the projected position, projected position (see
+        Route_Projection_Index.project))
+
+        """
+        position = self.route.get_projection_index().project(latitude, longitude,
+                                                              previous_offset)
+
+        return self._compute_resumed_plan(self.wf.forecast(forecast_days), position,
+                                          timestamp, riding_time), position
+
+    def _compute_resumed_plan(self, weather, position, timestamp, riding_time=None):
+        """Compute plan of the rest of the journey
+
+        :weather: weather at the day (see _compute_plan)
+
+        :position: projected position on the route (see
+        Route_Projection_Index.project)
+
+        :timestamp, riding_time: see resume_plan
+
+        returns Plan_Result, its first point is the projected position
+
+        """
+        j = position['segment']
+
+        # the rest of the route starts at the projected position on
+        # the segment leading to the point j
+        route = self.route.get_join_coordinates()\
+                          .sort_values('point_no').iloc[j-1:].reset_index(drop=True)
+        route['elevation'] = pd.to_numeric(route['elevation'], errors='coerce')
+        route.loc[0, ['latitude','longitude','elevation']] = \
+            [position['latitude'], position['longitude'], position['elevation']]
+        weather = weather.reset_index(drop=True)
+
+        if riding_time is None:
+            riding_time = max(timestamp - self._convert_departure_hour(self.departure_hour,
+                                                                       weather), 0)
+
+        lat = route['latitude'].values.astype(float)
+        lon = route['longitude'].values.astype(float)
+        elevation = route['elevation'].values.astype(float)
+        w = self._get_weather_arrays(weather)
+        terrain = self._power_profile.terrain_factor(
+            self.route.get_segments()['slope'].values)[j-1:]
+
+        n = len(route)
+        times = np.empty(n)
+        speeds = np.full(n, np.nan)
+        weather_index = np.empty(n, dtype=np.int64)
+        riding = np.zeros(n)
+        riding[0] = riding_time
+
+        self._integrate(lat, lon, elevation, timestamp, w, terrain,
+                        times, speeds, weather_index, riding)
+
+        return Plan_Result(route, weather, times, speeds, weather_index)
+
+    def update_plan(self, forecast_days=1):
+        """Compute plan with the current forecast, reusing the previous one
+
+        The state of the last forecast plan is kept for every forecast
+        day. After a forecast refresh the journey is integrated again
+        only from the first segment whose weather changed.
+
+        :forecast_days: when to compute the forecast (see plan)
+
+        returns tuple (Plan_Result, changes). The changes is a pandas
+        DataFrame with the points whose arrival time or speed changed
+        (point_no, time, time_change, speed, speed_change), None in
+        case there is no previous plan.
+
+        """
+        previous = self._forecast_states.get(forecast_days)
+        state = self._compute_plan_state(self.wf.forecast(forecast_days), previous)
+        self._forecast_states[forecast_days] = state
+
+        if previous is None or len(previous['times']) != len(state['times']):
+            return state['result'], None
+
+        time_change = state['times'] - previous['times']
+        speed_change = state['speeds'] - previous['speeds']
+        idx = np.flatnonzero((time_change != 0) |
+                             ((speed_change != 0) & ~np.isnan(previous['speeds'])))
+
+        changes = pd.DataFrame({'point_no': state['result'].route['point_no'].values[idx],
+                                'time': state['times'][idx],
+                                'time_change': time_change[idx],
+                                'speed': state['speeds'][idx],
+                                'speed_change': speed_change[idx]})
+
+        return state['result'], changes
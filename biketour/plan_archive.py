@@ -0,0 +1,133 @@
+#!/bin/env python
+
+from iterators import Iter_Historical_Weather
+
+import numpy as np
+import pandas as pd
+
+import os, json, logging
+
+class Plan_Archive(object):
+    """Archive of full historical plans in memory-mapped arrays
+
+    For every historical day the archive stores the arrival times and
+    speeds at all route points as rows of (days x points) matrices:
+
+     + time.npy: arrival times (seconds since epoch)
+
+     + speed.npy: speeds on the segments leading to the points (m/s)
+
+     + days.npz: day metadata (date, departure time, trip time,
+       whether the plan is computed)
+
+     + points.npz: point metadata (point_no, coordinates, elevation,
+       cluster)
+
+     + meta.json: plan type, parameters and departure hour
+
+    The matrices are opened memory-mapped, so slices of them are read
+    from disk only when accessed.
+
+    """
+
+    def __init__(self, directory):
+        """Initialise class
+
+        :directory: directory of the archive
+
+        """
+        self.directory = directory
+
+        self.time = None
+        self.speed = None
+        self.days = None
+        self.points = None
+        self.meta = None
+
+    def _filename(self, name):
+        return os.path.join(self.directory, name)
+
+    def write(self, plan):
+        """Compute historical plans and write them to the archive
+
+        :plan: plan object (e.g. Plan_With_Constant_Power)
+
+        """
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+        ihw = Iter_Historical_Weather(plan.hw)
+        dates = ihw.get_dates()
+
+        route = plan.route.get_join_coordinates()\
+                          .sort_values('point_no').reset_index(drop=True)
+        shape = (len(dates), len(route))
+
+        time = np.lib.format.open_memmap(self._filename("time.npy"), mode="w+",
+                                         dtype=np.float64, shape=shape)
+        speed = np.lib.format.open_memmap(self._filename("speed.npy"), mode="w+",
+                                          dtype=np.float64, shape=shape)
+        valid = np.zeros(len(dates), dtype=bool)
+
+        for i, date in enumerate(dates):
+            logging.info("Archiving historical plans, progress: " + str(i+1))
+
+            try:
+                x = plan._compute_plan(ihw.query_date(date))
+            except TypeError as e:
+                logging.warning("Skipping a day with incomplete weather: " + str(e))
+                time[i] = np.nan
+                speed[i] = np.nan
+                continue
+
+            time[i] = x.time
+            speed[i] = x.speed
+            valid[i] = True
+
+        time.flush()
+        speed.flush()
+
+        np.savez(self._filename("days.npz"),
+                 date=np.array(["%04d-%02d-%02d" % x for x in dates], dtype=str),
+                 departure=time[:,0],
+                 trip_time=time[:,-1] - time[:,0],
+                 valid=valid)
+
+        np.savez(self._filename("points.npz"),
+                 point_no=route['point_no'].values.astype(np.int64),
+                 latitude=route['latitude'].values.astype(float),
+                 longitude=route['longitude'].values.astype(float),
+                 elevation=pd.to_numeric(route['elevation'], errors='coerce').values,
+                 cluster=route['cluster'].values.astype(np.int64))
+
+        with open(self._filename("meta.json"), "w") as f:
+            json.dump({'model': type(plan).__name__,
+                       'model_version': plan.MODEL_VERSION,
+                       'parameters': plan.get_parameters(),
+                       'departure_hour': plan.departure_hour,
+                       'route': plan.route.get_hash()}, f)
+
+        del time, speed
+
+        return self.open()
+
+    def open(self):
+        """Open the archive
+
+        The time and speed matrices are memory-mapped, the day and
+        point metadata are loaded as pandas DataFrames.
+
+        """
+        self.time = np.load(self._filename("time.npy"), mmap_mode="r")
+        self.speed = np.load(self._filename("speed.npy"), mmap_mode="r")
+
+        with np.load(self._filename("days.npz"), allow_pickle=False) as x:
+            self.days = pd.DataFrame({k: x[k] for k in x.files})
+
+        with np.load(self._filename("points.npz"), allow_pickle=False) as x:
+            self.points = pd.DataFrame({k: x[k] for k in x.files})
+
+        with open(self._filename("meta.json")) as f:
+            self.meta = json.load(f)
+
+        return self
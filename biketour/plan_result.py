@@ -0,0 +1,114 @@
+#!/bin/env python
+
+import numpy as np
+import pandas as pd
+
+class Plan_Result(object):
+    """Computed journey plan stored as typed arrays
+
+    For every route point the plan stores the arrival time, the speed
+    on the segment leading to the point and the row of the weather
+    table used at the point. The route and the weather tables are
+    shared with the plan object, not copied.
+
+    Columns are accessible in the same way as in the plan pandas
+    DataFrame: route columns, weather columns prefixed with "w_", the
+    "time" and the "speed" columns.
+
+    """
+
+    def __init__(self, route, weather, time, speed, weather_index):
+        """Initialise the class
+
+        :route: pandas DataFrame with the route coordinates (see
+        Route.get_join_coordinates), ordered by point_no
+
+        :weather: pandas DataFrame with weather
+
+        :time: array with arrival times at the route points
+
+        :speed: array with speeds on segments leading to the route
+        points (first value is nan)
+
+        :weather_index: array with positions of rows in the weather
+        used at the route points
+
+        """
+        self.route = route
+        self.weather = weather
+        self.time = np.ascontiguousarray(time, dtype=np.float64)
+        self.speed = np.ascontiguousarray(speed, dtype=np.float64)
+        self.weather_index = np.ascontiguousarray(weather_index, dtype=np.int64)
+
+        self._frame = None
+
+    def __len__(self):
+        return len(self.time)
+
+    def columns(self):
+        """Get list of available columns
+
+        """
+        return list(self.route.columns) \
+            + ["w_" + x for x in self.weather.columns] \
+            + ["time", "speed"]
+
+    def arrays(self):
+        """Get the underlying arrays (without copying)
+
+        returns dictionary with time, speed and weather_index arrays
+
+        """
+        return {'time': self.time,
+                'speed': self.speed,
+                'weather_index': self.weather_index}
+
+    def _column(self, column):
+        """Get values of a column as an array
+
+        :column: column name
+
+        """
+        if "time" == column:
+            return self.time
+
+        if "speed" == column:
+            return self.speed
+
+        if column in self.route.columns:
+            return self.route[column].values
+
+        if column.startswith("w_") and column[2:] in self.weather.columns:
+            return self.weather[column[2:]].values[self.weather_index]
+
+        raise KeyError(column)
+
+    def __getitem__(self, key):
+        """Get a column (pandas Series) or a list of columns (pandas
+        DataFrame)
+
+        """
+        if isinstance(key, str):
+            return pd.Series(self._column(key), name=key)
+
+        return pd.DataFrame({x: self._column(x) for x in key})
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def to_pandas(self):
+        """Convert plan to pandas DataFrame
+
+        The DataFrame is computed only once.
+
+        """
+        if self._frame is None:
+            self._frame = self[self.columns()]
+
+        return self._frame
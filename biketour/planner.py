@@ -4,6 +4,8 @@ from forecast_weather import Forecast_Weather
 from historical_weather import Historical_Weather
 from route import Route
 from physical_models import Plan_With_Constant_Power
+from weather_store import Weather_Store
+from quota_ledger import Quota_Ledger, DAILY_LIMIT
 
 import os
 
@@ -15,25 +17,112 @@ class Planner(object):
 
     """
 
-    def __init__(self, route_file, darksky_apikey):
+    def __init__(self, route_file, darksky_apikey, grid_resolution=None,
+                 weather_provider=None, timezone=None,
+                 quota_ledger=None, daily_limit=DAILY_LIMIT, **kwargs):
         """Initialise class
 
         :route_path: path to a gpx file containing the route
 
         :darksky_apikey: key to the darksky api
 
+        :grid_resolution: resolution of the weather data (in
+        degrees). In case given, the route points are clustered by
+        the cells of the weather grid (see Route.get_short_coordinates)
+
+        :weather_provider: provider of the weather data (see
+        weather_provider). In case None the darksky API is queried.
+
+        :timezone: timezone of the route (see Local_Time). In case
+        None the local time of the system is used.
+
+        :quota_ledger: Quota_Ledger object counting the API calls,
+        which can be shared with other planners. In case None the
+        calls are counted in the weather database.
+
+        :daily_limit: maximum number of API calls per day (ignored in
+        case quota_ledger is given)
+
+        :kwargs: further arguments passed to Historical_Weather
+        (e.g. sample_size, sample_seed)
+
         """
 
         self.route = Route(route_file)
+        self.route.get_short_coordinates(grid_resolution=grid_resolution)
+
+        # historical weather and forecasts share one database
+        self.weather_store = Weather_Store(self._get_historical_weather_filename(route_file))
+
+        # API calls of the historical weather and the forecasts are
+        # counted together, the forecast calls are reserved
+        if quota_ledger is None:
+            quota_ledger = Quota_Ledger(self.weather_store, darksky_apikey,
+                                        daily_limit=daily_limit)
+        self.quota_ledger = quota_ledger
 
         self.historical_weather = Historical_Weather(
             coordinates=self.route.get_short_coordinates(),
             darksky_apikey = darksky_apikey,
-            filename=self._get_historical_weather_filename(route_file))
+            store=self.weather_store,
+            weather_provider=weather_provider,
+            timezone=timezone,
+            quota_ledger=self.quota_ledger,
+            **kwargs)
 
         self.weather_forecast = Forecast_Weather(
             coordinates=self.route.get_short_coordinates(),
-            darksky_apikey = darksky_apikey)
+            darksky_apikey = darksky_apikey,
+            store=self.weather_store,
+            weather_provider=weather_provider,
+            timezone=timezone,
+            quota_ledger=self.quota_ledger)
+        self.quota_ledger.forecast_reserve += self.weather_forecast.daily_calls()
+
+        # clusters merged in previous runs
+        groups = self.historical_weather.read_merged_coordinates()
+        if len(groups):
+            self._merge_clusters(groups)
+
+    def merge_identical_weather(self, min_days=5):
+        """Merge route clusters that have identical sampled weather
+
+        The weather at the merged coordinates is not queried any
+        more, which reduces the number of API calls per day. The
+        merges are saved in the weather database and applied again
+        whenever the route is loaded.
+
+        :min_days: minimal number of complete queried days needed to
+        decide that weather is identical
+
+        returns list of removed coordinates
+
+        """
+        groups = self.historical_weather.find_identical_coordinates(min_days)
+        self.historical_weather.save_merged_coordinates(groups)
+
+        return self._merge_clusters(groups)
+
+    def _merge_clusters(self, groups):
+        """Merge route clusters and stop querying the removed ones
+
+        :groups: list of lists of coordinates, merged into their
+        first coordinate (see Route.merge_clusters)
+
+        returns list of removed coordinates
+
+        """
+        calls = self.weather_forecast.daily_calls()
+
+        removed = self.route.merge_clusters(groups)
+
+        self.historical_weather.remove_coordinates(removed)
+        self.weather_forecast.remove_coordinates(removed)
+
+        # forecasts of the removed coordinates are not queried any more
+        self.quota_ledger.forecast_reserve -= calls - self.weather_forecast.daily_calls()
+
+        return removed
 
     def _get_historical_weather_filename(self, filename):
         """Add and change extension of the route filename
@@ -70,10 +159,15 @@ class Planner(object):
         :K: constant K describing cross-sectional area and drag
         coefficient (in Ns^2/m^2) (wind/elevation plans)
 
+        :direction: direction of riding the route, "forward",
+        "reversed" or "out_and_back" (see Route.get_view). All
+        directions are planned with the weather of the route.
+
         """
         if "with_constant_power" == plan_type:
-            return Plan_With_Constant_Power(starting_time = kwargs["starting_time"],
-                                            route = self.route,
+            return Plan_With_Constant_Power(starting_time = kwargs.pop("starting_time"),
+                                            route = self.route.get_view(
+                                                kwargs.pop("direction", "forward")),
                                             historical_weather = self.historical_weather,
                                             weather_forecast = self.weather_forecast,
                                             **kwargs)
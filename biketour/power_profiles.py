@@ -0,0 +1,215 @@
+#!/bin/env python
+
+import numpy as np
+
+class Power_Profile(object):
+    """Rider power along the journey
+
+    The power of the rider is P_rider multiplied by a terrain factor
+    (depending on the slope of a segment) and a time factor
+    (depending on the riding time since departure). Further, a
+    profile can add rest stops to the journey.
+
+    All methods are evaluated on whole arrays: the terrain factor for
+    all segments of the route at once. The time factor and the rest
+    time are evaluated once on a grid of riding times (see
+    get_time_table), the plans look them up in the table.
+
+    The base class is the constant power.
+
+    """
+
+    # step (in seconds) and length (in hours) of the grid of riding
+    # times of the time table (see get_time_table)
+    TABLE_STEP = 60
+    TABLE_HOURS = 72
+
+    def terrain_factor(self, slope):
+        """Power factor given the slope of the segments
+
+        :slope: array with slopes (ratio of height and length)
+
+        """
+        return np.ones_like(slope, dtype=float)
+
+    def time_factor(self, riding_time):
+        """Power factor given the riding time
+
+        :riding_time: array with riding time since departure (in
+        seconds), without rest stops
+
+        """
+        return np.ones_like(riding_time, dtype=float)
+
+    def rest_time(self, riding_time):
+        """Total time of the rest stops made until the riding time
+
+        :riding_time: array with riding time since departure (in
+        seconds), without rest stops
+
+        """
+        return np.zeros_like(riding_time, dtype=float)
+
+    def get_time_table(self):
+        """Time factors and rest times on a grid of riding times
+
+        The table is computed once. The time factors are interpolated
+        linearly between the grid points, the rest time is the one at
+        the preceding grid point, which is exact for stops after a
+        multiple of TABLE_STEP. Beyond TABLE_HOURS the values at the
+        end of the table are used.
+
+        returns tuple (step of the grid in seconds, array with time
+        factors, array with rest times)
+
+        """
+        if getattr(self, '_time_table', None) is None:
+            riding = self.TABLE_STEP*np.arange(3600*self.TABLE_HOURS//self.TABLE_STEP + 1)
+            self._time_table = (float(self.TABLE_STEP),
+                                np.ascontiguousarray(self.time_factor(riding), dtype=float),
+                                np.ascontiguousarray(self.rest_time(riding), dtype=float))
+
+        return self._time_table
+
+    def get_parameters(self):
+        """Get parameters of the profile
+
+        returns dictionary with numeric parameters, their names are
+        unique among the profiles
+
+        """
+        return {}
+
+
+class Fatigue_Profile(Power_Profile):
+    """Power decaying exponentially with the riding time
+
+    """
+
+    def __init__(self, time_constant=8, min_fraction=0.6):
+        """Initialise class
+
+        :time_constant: decay time of the power (in hours)
+
+        :min_fraction: fraction of the power that is kept after a
+        long ride
+
+        """
+        self._time_constant = time_constant
+        self._min_fraction = min_fraction
+
+    def time_factor(self, riding_time):
+        x = np.exp(-np.asarray(riding_time, dtype=float)/(3600*self._time_constant))
+
+        return self._min_fraction + (1 - self._min_fraction)*x
+
+    def get_parameters(self):
+        return {'fatigue_time_constant': self._time_constant,
+                'fatigue_min_fraction': self._min_fraction}
+
+
+class Climb_Profile(Power_Profile):
+    """Power increasing on climbs and decreasing on descents
+
+    """
+
+    def __init__(self, climb_gain=5, max_factor=1.3,
+                 descent_slope=-0.04, descent_factor=0.3):
+        """Initialise class
+
+        :climb_gain: increase of the power factor per unit of slope
+
+        :max_factor: maximal power factor on climbs
+
+        :descent_slope: slope below which the rider eases off
+
+        :descent_factor: power factor on descents (must be positive)
+
+        """
+        self._climb_gain = climb_gain
+        self._max_factor = max_factor
+        self._descent_slope = descent_slope
+        self._descent_factor = descent_factor
+
+    def terrain_factor(self, slope):
+        slope = np.asarray(slope, dtype=float)
+
+        res = np.minimum(1 + self._climb_gain*np.maximum(slope, 0), self._max_factor)
+
+        return np.where(slope < self._descent_slope, self._descent_factor, res)
+
+    def get_parameters(self):
+        return {'climb_gain': self._climb_gain,
+                'climb_max_factor': self._max_factor,
+                'climb_descent_slope': self._descent_slope,
+                'climb_descent_factor': self._descent_factor}
+
+
+class Rest_Stops_Profile(Power_Profile):
+    """Rest stops after regular intervals of riding
+
+    """
+
+    def __init__(self, interval=2, duration=15):
+        """Initialise class
+
+        :interval: riding time between the stops (in hours)
+
+        :duration: duration of a stop (in minutes)
+
+        """
+        self._interval = interval
+        self._duration = duration
+
+    def rest_time(self, riding_time):
+        x = np.floor(np.asarray(riding_time, dtype=float)/(3600*self._interval))
+
+        return 60*self._duration*x
+
+    def get_parameters(self):
+        return {'rest_interval': self._interval,
+                'rest_duration': self._duration}
+
+
+class Combined_Profile(Power_Profile):
+    """Several profiles applied together
+
+    The power factors are multiplied and the rest times are added.
+
+    """
+
+    def __init__(self, *profiles):
+        """Initialise class
+
+        :profiles: Power_Profile objects
+
+        """
+        self._profiles = profiles
+
+    def terrain_factor(self, slope):
+        res = super(Combined_Profile, self).terrain_factor(slope)
+        for x in self._profiles:
+            res = res*x.terrain_factor(slope)
+
+        return res
+
+    def time_factor(self, riding_time):
+        res = super(Combined_Profile, self).time_factor(riding_time)
+        for x in self._profiles:
+            res = res*x.time_factor(riding_time)
+
+        return res
+
+    def rest_time(self, riding_time):
+        res = super(Combined_Profile, self).rest_time(riding_time)
+        for x in self._profiles:
+            res = res + x.rest_time(riding_time)
+
+        return res
+
+    def get_parameters(self):
+        res = {}
+        for x in self._profiles:
+            res.update(x.get_parameters())
+
+        return res
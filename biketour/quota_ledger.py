@@ -0,0 +1,297 @@
+#!/bin/env python
+
+import logging, hashlib, time
+
+# default maximal number of API calls per day
+DAILY_LIMIT = 1000
+
+class Quota_Ledger(object):
+    """Daily API calls ledger shared by processes
+
+    The calls made to the weather API are counted per API key and day
+    in a table of the weather database (see Weather_Store). Every call
+    is reserved before it is made, the reservation is a single
+    transaction, so processes sharing the database never exceed the
+    daily limit together. The usage reported by the API
+    (X-Forecast-API-Calls header) is recorded as well, the larger of
+    both counts is used.
+
+    Days are UTC days, the darksky allowance is reset at UTC midnight.
+
+    A part of the daily limit is kept for the forecasts (see
+    forecast_reserve): historical weather can only use the calls that
+    are left after the reserve not yet used by forecasts.
+
+    """
+
+    # kinds of the calls
+    KINDS = ("historical", "forecast")
+
+    # calls of a key and day
+    _USAGE_SQL = '''
+    SELECT kind, calls
+    FROM api_calls
+    WHERE key = ? AND day = ?
+    '''
+
+    def __init__(self, store, apikey=None, daily_limit=DAILY_LIMIT,
+                 forecast_reserve=0):
+        """Initialise class
+
+        :store: Weather_Store object (typically the store of the
+        weather database, or a store shared by several routes). The
+        calls are written by its writer connection and read by its
+        pool of read connections.
+
+        :apikey: API key, calls are counted per key (only its hash is
+        stored)
+
+        :daily_limit: maximal number of API calls per day
+
+        :forecast_reserve: number of calls per day kept for the
+        forecasts
+
+        """
+        self._store = store
+        self.filename = store.filename
+        self.daily_limit = daily_limit
+        self.forecast_reserve = forecast_reserve
+
+        self._key = hashlib.sha1(str(apikey).encode()).hexdigest()
+
+        # database connection is opened on first use
+        self._connection = None
+
+    @property
+    def _dbconn(self):
+        """Database connection for writing
+
+        The database is initialised on first use. The transactions
+        are started explicitly.
+
+        """
+        if self._connection is None:
+            with self._store.write_lock:
+                if self._connection is None:
+                    # initialise database
+                    self._init_database()
+
+                    self._connection = self._store.connection
+
+        return self._connection
+
+    def _init_database(self):
+        """Initialise the table with the API calls
+
+        """
+        connection = self._store.connection
+
+        try:
+            c = connection.execute('''BEGIN IMMEDIATE''')
+
+            c.execute('''
+            CREATE TABLE IF NOT EXISTS api_calls
+            (
+            key                 VARCHAR(64) NOT NULL,
+            day                 INTEGER NOT NULL,
+            kind                VARCHAR(32) NOT NULL,
+            calls               INTEGER NOT NULL,
+            CONSTRAINT uc_key_day_kind UNIQUE (key, day, kind)
+            )''')
+
+            connection.commit()
+        except Exception as e:
+            logging.error("Error creating table (api_calls): " + str(e))
+            connection.rollback()
+            raise e
+
+    def get_day(self):
+        """Get the current day (UTC days since epoch)
+
+        """
+        return int(time.time())//86400
+
+    def _read_usage(self, rows):
+        """Calls of a day by kind
+
+        :rows: list of tuples (kind, calls) read from api_calls
+
+        """
+        res = {x: 0 for x in self.KINDS + ("reported",)}
+        res.update(dict(rows))
+
+        return res
+
+    def _available(self, usage, kind):
+        """Number of calls of a kind allowed given the usage
+
+        """
+        used = max(sum(usage[x] for x in self.KINDS), usage["reported"])
+        res = self.daily_limit - used
+
+        if "historical" == kind:
+            res -= max(self.forecast_reserve - usage["forecast"], 0)
+
+        return max(res, 0)
+
+    def usage(self, day=None):
+        """Get calls of a day
+
+        :day: day (see get_day). In case None today is used.
+
+        returns dictionary with calls by kind and the usage reported
+        by the API
+
+        """
+        self._dbconn
+
+        if day is None:
+            day = self.get_day()
+
+        return self._read_usage(self._store.fetch(self._USAGE_SQL, (self._key, day)))
+
+    def available(self, kind):
+        """Number of calls of a kind still allowed today
+
+        :kind: either of KINDS
+
+        """
+        return self._available(self.usage(), kind)
+
+    def reserve(self, kind, calls=1):
+        """Reserve API calls
+
+        The calls are counted in case they are allowed. They stay
+        counted even if the API call fails.
+
+        :kind: either of KINDS
+
+        :calls: number of calls
+
+        returns True in case the calls are allowed
+
+        """
+        if kind not in self.KINDS:
+            raise ValueError("Unknown kind of API calls: " + str(kind))
+
+        day = self.get_day()
+
+        with self._store.write_lock:
+            try:
+                c = self._dbconn.execute('''BEGIN IMMEDIATE''')
+
+                # the usage is read in the transaction, so that other
+                # processes can not reserve the same calls
+                c.execute(self._USAGE_SQL, (self._key, day))
+                if self._available(self._read_usage(c.fetchall()), kind) < calls:
+                    self._dbconn.rollback()
+                    return False
+
+                c.execute('''
+                INSERT OR IGNORE INTO api_calls
+                (key, day, kind, calls)
+                VALUES (?,?,?,0)
+                ''', (self._key, day, kind))
+
+                c.execute('''
+                UPDATE api_calls
+                SET calls = calls + ?
+                WHERE key = ? AND day = ? AND kind = ?
+                ''', (calls, self._key, day, kind))
+
+                self._dbconn.commit()
+            except Exception as e:
+                logging.error("Error with db insertion into api_calls table: " + str(e))
+                self._dbconn.rollback()
+                raise e
+
+        return True
+
+    def report(self, calls):
+        """Record the usage reported by the API
+
+        :calls: number of calls made today according to the API
+
+        """
+        day = self.get_day()
+
+        with self._store.write_lock:
+            try:
+                c = self._dbconn.execute('''BEGIN IMMEDIATE''')
+
+                c.execute('''
+                INSERT OR IGNORE INTO api_calls
+                (key, day, kind, calls)
+                VALUES (?,?,'reported',0)
+                ''', (self._key, day))
+
+                c.execute('''
+                UPDATE api_calls
+                SET calls = max(calls, ?)
+                WHERE key = ? AND day = ? AND kind = 'reported'
+                ''', (calls, self._key, day))
+
+                self._dbconn.commit()
+            except Exception as e:
+                logging.error("Error with db insertion into api_calls table: " + str(e))
+                self._dbconn.rollback()
+                raise e
+
+
+class Backfill_Scheduler(object):
+    """Spread querying of historical weather over days
+
+    Every day the historical weather uses the calls of the daily
+    limit that are not reserved for the forecasts. Only days whose
+    missing coordinates all fit into the allowance are scheduled, so
+    that the queried days are complete and can be used for plans.
+
+    """
+
+    def __init__(self, ledger):
+        """Initialise class
+
+        :ledger: Quota_Ledger object
+
+        """
+        self._ledger = ledger
+
+    def schedule(self, days):
+        """Choose days to query today
+
+        :days: list of tuples (day, number of calls needed to complete
+        it) in the order of priority
+
+        returns list of days
+
+        """
+        budget = self._ledger.available("historical")
+
+        res = []
+        for day, calls in days:
+            if calls <= budget:
+                res += [day]
+                budget -= calls
+
+        return res
+
+    def days_to_complete(self, calls):
+        """Estimate number of days (including today) needed to make
+        the calls
+
+        The full daily allowance of the historical weather is assumed
+        for the days after today.
+
+        :calls: number of calls
+
+        """
+        today = self._ledger.available("historical")
+        allowance = self._ledger.daily_limit - self._ledger.forecast_reserve
+
+        if calls <= today:
+            return 0 if 0 == calls else 1
+
+        if allowance <= 0:
+            return float('inf')
+
+        return 1 + -(-(calls - today)//allowance)
@@ -0,0 +1,115 @@
+#!/bin/env python
+
+import numpy as np
+import pandas as pd
+
+import os, json
+
+class Chunked_Results(object):
+    """Store table rows incrementally in a directory of npz chunks
+
+    Every appended batch of rows is written to a separate chunk
+    file. A manifest file lists the written chunks together with the
+    keys of the stored rows and serves as a checkpoint: a chunk is
+    considered written only after the manifest is updated.
+
+    """
+
+    def __init__(self, directory):
+        """Initialise class
+
+        :directory: directory where chunks are stored. Created in
+        case it does not exist.
+
+        """
+        self.directory = directory
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+        self._manifest = self._read_manifest()
+
+    def _manifest_filename(self):
+        return os.path.join(self.directory, "manifest.json")
+
+    def _read_manifest(self):
+        """Read the manifest file
+
+        """
+        if not os.path.exists(self._manifest_filename()):
+            return {'chunks': [], 'keys': []}
+
+        with open(self._manifest_filename()) as f:
+            return json.load(f)
+
+    def _write_manifest(self):
+        """Write the manifest file atomically
+
+        """
+        tmp = self._manifest_filename() + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._manifest, f)
+
+        os.replace(tmp, self._manifest_filename())
+
+    def get_keys(self):
+        """Get keys of the stored rows
+
+        """
+        return set(self._manifest['keys'])
+
+    def append(self, keys, rows):
+        """Append a batch of rows
+
+        :keys: list of keys identifying rows (strings)
+
+        :rows: list of dictionaries with the same keys
+
+        """
+        if 0 == len(rows):
+            return
+
+        data = {'_key': np.array(keys, dtype=str)}
+        for column, x in pd.DataFrame(rows).items():
+            if x.dtype == object:
+                data[column] = np.array(x.fillna('').astype(str), dtype=str)
+            else:
+                data[column] = np.array(x)
+
+        name = "chunk_%06d.npz" % len(self._manifest['chunks'])
+
+        # write chunk under temporary name, so that partially written
+        # chunks are never picked up
+        tmp = os.path.join(self.directory, name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, **data)
+        os.replace(tmp, os.path.join(self.directory, name))
+
+        self._manifest['chunks'] += [name]
+        self._manifest['keys'] += list(keys)
+        self._write_manifest()
+
+    def iter_chunks(self):
+        """Iterate through stored chunks
+
+        Chunks are returned as pandas DataFrames indexed by the row keys
+
+        """
+        for name in self._manifest['chunks']:
+            with np.load(os.path.join(self.directory, name), allow_pickle=False) as x:
+                res = pd.DataFrame({column: x[column] for column in x.files})
+
+            yield res.set_index('_key')
+
+    def load(self):
+        """Load all stored rows
+
+        returns pandas DataFrame sorted by the row keys
+
+        """
+        chunks = list(self.iter_chunks())
+
+        if 0 == len(chunks):
+            return pd.DataFrame()
+
+        return pd.concat(chunks).sort_index().reset_index(drop=True)
@@ -2,7 +2,7 @@
 
 import xml.etree.ElementTree
 
-from scipy.cluster.hierarchy import linkage, fcluster
+import hashlib
 
 import numpy as np
 
@@ -10,7 +10,7 @@ import math
 
 import pandas as pd
 
-from helping_functions import geodesic_distance
+from helping_functions import geodesic_distance, geodesic_distance_array, bearing_array
 
 class Route(object):
     """A class that parses the xml route file and stores it in memory.
@@ -23,6 +23,9 @@ class Route(object):
     elevation data).
     """
 
+    # direction of riding the route (see get_view)
+    direction = "forward"
+
     def __init__(self, gpx_path):
         """Initialise class
 
@@ -30,6 +33,9 @@ class Route(object):
         self.filename = gpx_path
         self._coordinates = None
         self._short_coordinates = None
+        self._segments = None
+        self._projection_index = None
+        self._views = {}
 
 
     def _parse_gpx(self):
@@ -85,12 +91,30 @@ class Route(object):
         clusters
 
         """
+        from scipy.cluster.hierarchy import linkage, fcluster
+
         Z = linkage(self._coordinates[['latitude','longitude']],
                     method=method,metric=geodesic_distance)
 
         return fcluster(Z, max_distance, criterion='distance')
 
 
+    def _cluster_coordinates_grid(self, grid_resolution):
+        """Cluster coordinates by cells of the weather grid
+
+        Points within the same grid cell get the same weather from
+        the weather service, hence there is no need to query them
+        separately.
+
+        :grid_resolution: size of the grid cell (in degrees)
+
+        """
+        cells = list(zip(np.floor(self._coordinates['latitude']/grid_resolution),
+                         np.floor(self._coordinates['longitude']/grid_resolution)))
+
+        return pd.factorize(pd.Series(cells))[0] + 1
+
+
     def _compute_average_from_cluster(self):
         """Compute average coordinates
 
@@ -106,7 +130,8 @@ class Route(object):
 
         return self._coordinates
 
-    def get_short_coordinates(self, method="average",max_distance=4000):
+    def get_short_coordinates(self, method="average",max_distance=4000,
+                              grid_resolution=None):
         """Get a shorter list of coordinates by clustering them together. This
         allow to reduce number of queries to the weather API
 
@@ -116,14 +141,146 @@ class Route(object):
         :max_distance: maximal distance (in meters) between the
         clusters
 
+        :grid_resolution: resolution of the weather data (in
+        degrees). In case it is given, points are clustered by the
+        cells of the weather grid instead of the distance between
+        them.
+
         """
         if self._short_coordinates is None:
             self._coordinates = self.get_coordinates()
-            self._coordinates['cluster'] = self._cluster_coordinates(method, max_distance)
+            if grid_resolution is None:
+                self._coordinates['cluster'] = self._cluster_coordinates(method, max_distance)
+            else:
+                self._coordinates['cluster'] = self._cluster_coordinates_grid(grid_resolution)
             self._short_coordinates = self._compute_average_from_cluster()
 
         return self._short_coordinates
 
+    def merge_clusters(self, groups):
+        """Merge clusters with identical weather
+
+        Every group of short coordinates is replaced by its first
+        coordinate, i.e. the points of the other clusters in the group
+        are assigned to the cluster of the first coordinate.
+
+        :groups: list of lists of coordinates (latitude, longitude)
+
+        returns list of the removed short coordinates
+
+        """
+        short = self.get_short_coordinates()
+
+        def find_cluster(coord):
+            x = short[np.isclose(short['latitude'], coord[0]) &
+                      np.isclose(short['longitude'], coord[1])]
+            return None if 0 == len(x) else x['cluster'].iloc[0]
+
+        removed = []
+        for group in groups:
+            clusters = [find_cluster(x) for x in group]
+            if clusters[0] is None:
+                continue
+
+            for coord, cluster in zip(group[1:], clusters[1:]):
+                if cluster is None:
+                    continue
+
+                self._coordinates.loc[self._coordinates['cluster'] == cluster,
+                                      'cluster'] = clusters[0]
+                removed += [coord]
+
+        clusters = self._coordinates['cluster'].unique()
+        self._short_coordinates = short[short['cluster'].isin(clusters)]\
+            .reset_index(drop=True)
+        self._segments = None
+        self._projection_index = None
+
+        return removed
+
+    def get_segments(self):
+        """Get table of route segments
+
+        Every row describes the segment leading from the previous
+        point to the point: its distance (in meters), bearing (in
+        degrees) and slope. The first point has zero distance and
+        slope. Slopes of segments without elevation data are zero.
+
+        The table is computed once and ordered by point_no.
+
+        """
+        if self._segments is None:
+            x = self.get_join_coordinates().sort_values('point_no').reset_index(drop=True)
+
+            lat = x['latitude'].values.astype(float)
+            lon = x['longitude'].values.astype(float)
+            elevation = pd.to_numeric(x['elevation'], errors='coerce').values
+
+            distance = np.zeros(len(x))
+            distance[1:] = geodesic_distance_array(lat[:-1], lon[:-1], lat[1:], lon[1:])
+
+            bearing = np.zeros(len(x))
+            bearing[1:] = bearing_array(lat[:-1], lon[:-1], lat[1:], lon[1:])
+
+            slope = np.zeros(len(x))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                slope[1:] = np.diff(elevation)/distance[1:]
+            slope[~np.isfinite(slope)] = 0
+
+            self._segments = pd.DataFrame({'point_no': x['point_no'].values,
+                                           'latitude': lat,
+                                           'longitude': lon,
+                                           'elevation': elevation,
+                                           'cluster': x['cluster'].values,
+                                           'distance': distance,
+                                           'bearing': bearing,
+                                           'slope': slope})
+
+        return self._segments
+
+    def get_projection_index(self, **kwargs):
+        """Get spatial index projecting positions onto the route
+
+        The index is built once (see Route_Projection_Index).
+
+        :kwargs: arguments of Route_Projection_Index
+
+        """
+        from route_projection import Route_Projection_Index
+
+        if self._projection_index is None:
+            self._projection_index = Route_Projection_Index(self.get_segments(), **kwargs)
+
+        return self._projection_index
+
+    def get_view(self, direction):
+        """Get the route ridden in another direction
+
+        The view shares the clusters (hence the weather databases) and
+        the segment table with this route (see Route_View).
+
+        :direction: "forward" (the route itself), "reversed" or
+        "out_and_back" (the route followed by the reversed route)
+
+        """
+        if "forward" == direction:
+            return self
+
+        if direction not in self._views:
+            self._views[direction] = Route_View(self, direction)
+
+        return self._views[direction]
+
+    def get_hash(self):
+        """Compute hash of the route and its clusters
+
+        """
+        x = self.get_join_coordinates()[['point_no','latitude','longitude','elevation',
+                                          'latitude_short','longitude_short']]
+
+        return hashlib.sha1(pd.util.hash_pandas_object(x, index=False).values.tobytes())\
+                      .hexdigest()
+
     def get_join_coordinates(self):
         """Join coordinates and short coordinates together
 
@@ -133,3 +290,102 @@ class Route(object):
         return pd.merge(self.get_coordinates(),
                         self.get_short_coordinates(),
                         on='cluster',suffixes=('','_short'))
+
+
+class Route_View(Route):
+    """Route ridden in the reversed direction or out and back
+
+    The view is computed from the coordinates, the clusters and the
+    segment table of the route, the gpx file is not parsed again. The
+    short coordinates are the ones of the route, so the view is
+    planned with the weather queried for the route.
+
+    """
+
+    DIRECTIONS = ("reversed", "out_and_back")
+
+    def __init__(self, route, direction):
+        """Initialise class
+
+        :route: Route object
+
+        :direction: either of DIRECTIONS
+
+        """
+        if direction not in self.DIRECTIONS:
+            raise ValueError("Unknown direction: " + str(direction))
+
+        super(Route_View, self).__init__(route.filename)
+        self.route = route
+        self.direction = direction
+
+        # segment table of the route the view was computed from
+        self._route_segments = None
+
+    def _order(self, x):
+        """Order rows of the route by the direction of the view
+
+        :x: pandas DataFrame ordered by point_no
+
+        """
+        res = x.iloc[::-1]
+        if "out_and_back" == self.direction:
+            res = pd.concat([x, res.iloc[1:]])
+
+        return res.reset_index(drop=True)
+
+    def get_coordinates(self):
+        """Return coordinates in the direction of the view
+
+        The points are numbered from the start of the view.
+
+        """
+        x = self._order(self.route.get_coordinates().sort_values('point_no'))
+        x['point_no'] = np.arange(len(x))
+
+        return x
+
+    def get_short_coordinates(self, *args, **kwargs):
+        return self.route.get_short_coordinates(*args, **kwargs)
+
+    def merge_clusters(self, groups):
+        return self.route.merge_clusters(groups)
+
+    def get_view(self, direction):
+        """Get view of the route (see Route.get_view)
+
+        The direction is relative to the route, not to the view.
+
+        """
+        return self.route.get_view(direction)
+
+    def get_segments(self):
+        """Get table of segments in the direction of the view
+
+        The segments of the route are reused: on the reversed
+        segments the bearings are flipped and the slopes negated.
+
+        """
+        segments = self.route.get_segments()
+
+        if self._segments is None or self._route_segments is not segments:
+            n = len(segments)
+            x = segments.iloc[::-1].reset_index(drop=True)
+
+            # the segment leading to the point i of the reversed route
+            # is the segment leading to the point n-i of the route
+            for c in ['distance','bearing','slope']:
+                x[c] = np.r_[0, segments[c].values[:0:-1]] if n else segments[c].values
+            x['bearing'] = np.where(np.arange(n) > 0, (x['bearing'] + 180) % 360, 0)
+            x['slope'] = -x['slope']
+
+            if "out_and_back" == self.direction:
+                x = pd.concat([segments, x.iloc[1:]], ignore_index=True)
+
+            x['point_no'] = np.arange(len(x))
+
+            self._segments = x
+            self._route_segments = segments
+            self._projection_index = None
+
+        return self._segments
@@ -0,0 +1,340 @@
+#!/bin/env python
+
+from concurrent.futures import ProcessPoolExecutor
+
+from forecast_weather import Forecast_Weather
+from historical_weather import Historical_Weather
+from iterators import Iter_Historical_Weather
+from route import Route
+from physical_models import Plan_With_Constant_Power
+from trip_characteristics import Trip_Characteristics
+from characteristics_cache import Characteristics_Cache
+from weather_store import Weather_Store
+from quota_ledger import Quota_Ledger, DAILY_LIMIT
+
+import logging
+
+import pandas as pd
+
+class _Weather_Cells(Route):
+    """Short coordinates of several routes clustered together
+
+    The clusters are the weather cells shared by the routes, so that
+    weather at places visited by several routes is queried only once.
+
+    """
+
+    def __init__(self, routes):
+        """Initialise class
+
+        :routes: list of Route objects with computed short coordinates
+
+        """
+        super(_Weather_Cells, self).__init__(None)
+        self._routes = routes
+
+    def _parse_gpx(self):
+        """Join the short coordinates of the routes
+
+        """
+        x = pd.concat([r.get_short_coordinates()[['latitude','longitude','elevation']]
+                       for r in self._routes], ignore_index=True)
+        x.insert(0, 'point_no', range(len(x)))
+        x['name'] = None
+
+        self._coordinates = x
+
+        return self._coordinates
+
+
+# state of a worker process (see _init_worker)
+_worker = {}
+
+def _init_worker(plans, filename, coordinates, timezone=None):
+    """Initialise worker process computing historical plans
+
+    The plan objects are rebuilt in the worker, since database
+    connections can not be passed between processes.
+
+    :plans: list of tuples (plan class, departure hour, route,
+    keyword arguments of the plan (see
+    Plan_With_Constant_Power.get_kwargs))
+
+    :filename: filename of the historical weather database
+
+    :coordinates: coordinates of the weather cells
+
+    :timezone: timezone of the routes (see Local_Time)
+
+    """
+    hw = Historical_Weather(coordinates=coordinates, darksky_apikey=None,
+                            filename=filename, timezone=timezone)
+
+    _worker['plans'] = [x[0](starting_time=x[1], route=x[2],
+                             historical_weather=hw, weather_forecast=None,
+                             **x[3])
+                        for x in plans]
+    _worker['ihw'] = Iter_Historical_Weather(hw)
+
+
+def _compute_days(tasks):
+    """Compute characteristics of plans at historical days
+
+    The weather of every day is queried once and used for all plans.
+
+    :tasks: list of tuples (day, list of plan indices)
+
+    returns list of tuples (plan index, day, characteristics)
+
+    """
+    tc = Trip_Characteristics()
+
+    res = []
+    for date, idx in tasks:
+        weather = _worker['ihw'].query_date(date)
+
+        plans = []
+        for i in idx:
+            try:
+                x = _worker['plans'][i]._compute_plan(weather)
+            except TypeError as e:
+                logging.warning("Skipping a day with incomplete weather: " + str(e))
+                continue
+            plans += [tc._reduce_plan(x, i)]
+
+        if 0 == len(plans):
+            continue
+
+        x = tc.aggregate(pd.concat(plans, ignore_index=True))
+        res += [(i, date, y) for i, y in zip(x.index, x.to_dict('records'))]
+
+    return res
+
+
+class Route_Library(object):
+    """Planner of many routes at once
+
+    The routes share the weather cells (see _Weather_Cells), the
+    historical weather database and the forecast database. Historical
+    plans of all routes and departure hours are computed together: the
+    weather of every day is read once, and the days are distributed
+    over a pool of worker processes.
+
+    """
+
+    def __init__(self, route_files, darksky_apikey,
+                 filename="route_library_weather.db",
+                 grid_resolution=None, max_distance=4000,
+                 weather_provider=None, timezone=None,
+                 quota_ledger=None, daily_limit=DAILY_LIMIT, **kwargs):
+        """Initialise class
+
+        :route_files: list of paths to gpx files
+
+        :darksky_apikey: key to the darksky api
+
+        :filename: filename of the weather database shared by the
+        routes (historical weather and forecasts)
+
+        :grid_resolution: resolution of the weather data (in
+        degrees). In case given, the points are clustered by the cells
+        of the weather grid (see Route.get_short_coordinates)
+
+        :max_distance: maximal distance (in meters) between the
+        clusters, in case grid_resolution is not given
+
+        :weather_provider: provider of the weather data (see
+        weather_provider). In case None the darksky API is queried.
+
+        :timezone: timezone of the routes (see Local_Time). In case
+        None the local time of the system is used.
+
+        :quota_ledger: Quota_Ledger object counting the API calls,
+        which can be shared with other route libraries. In case None the
+        calls are counted in the weather database.
+
+        :daily_limit: maximum number of API calls per day (ignored in
+        case quota_ledger is given)
+
+        :kwargs: further arguments passed to Historical_Weather
+        (e.g. sample_size, sample_seed)
+
+        """
+        self.routes = {}
+        for x in route_files:
+            self.routes[x] = Route(x)
+            self.routes[x].get_short_coordinates(max_distance=max_distance,
+                                                 grid_resolution=grid_resolution)
+
+        self.cells = _Weather_Cells(list(self.routes.values()))
+        coordinates = self.cells.get_short_coordinates(max_distance=max_distance,
+                                                       grid_resolution=grid_resolution)
+
+        # historical weather and forecasts share one database
+        self.weather_store = Weather_Store(filename)
+
+        # API calls of the historical weather and the forecasts are
+        # counted together, the forecast calls are reserved
+        if quota_ledger is None:
+            quota_ledger = Quota_Ledger(self.weather_store, darksky_apikey,
+                                        daily_limit=daily_limit)
+        self.quota_ledger = quota_ledger
+
+        self.historical_weather = Historical_Weather(
+            coordinates=coordinates,
+            darksky_apikey=darksky_apikey,
+            store=self.weather_store,
+            weather_provider=weather_provider,
+            timezone=timezone,
+            quota_ledger=self.quota_ledger,
+            **kwargs)
+
+        self.weather_forecast = Forecast_Weather(
+            coordinates=coordinates,
+            darksky_apikey=darksky_apikey,
+            store=self.weather_store,
+            weather_provider=weather_provider,
+            timezone=timezone,
+            quota_ledger=self.quota_ledger)
+        self.quota_ledger.forecast_reserve += self.weather_forecast.daily_calls()
+
+    def get_plans(self, departure_hours, **kwargs):
+        """Get plans with constant power of all routes and departures
+
+        :departure_hours: list of departure hours
+
+        :kwargs: physical parameters of the plans (see
+        Plan_With_Constant_Power)
+
+        returns list of plan objects
+
+        """
+        return [Plan_With_Constant_Power(starting_time=h,
+                                         route=r,
+                                         historical_weather=self.historical_weather,
+                                         weather_forecast=self.weather_forecast,
+                                         **kwargs)
+                for r in self.routes.values() for h in departure_hours]
+
+    def compute_historical(self, plans, use_cache=True, workers=None, batch_size=1):
+        """Compute historical characteristics of many plans
+
+        :plans: list of plan objects (see get_plans)
+
+        :use_cache: whether to use the cache of characteristics (see
+        Trip_Characteristics.iter_historical)
+
+        :workers: number of worker processes. In case None the number
+        of processors is used, in case 1 the plans are computed in
+        this process.
+
+        :batch_size: number of days computed by a worker at once
+
+        returns list of pandas DataFrames with characteristics sorted
+        by day (one per plan)
+
+        """
+        ihw = Iter_Historical_Weather(self.historical_weather)
+        res = [{} for x in plans]
+
+        cache, keys, fingerprints = None, None, {}
+        if use_cache:
+            cache = Characteristics_Cache(self.historical_weather.store)
+            keys = [cache.get_key(x) for x in plans]
+
+        # days and plans that are not cached
+        tasks = []
+        for date in ihw.get_dates():
+            idx = list(range(len(plans)))
+            if cache is not None:
+                fingerprints[date] = ihw.date_fingerprint(date)
+                for i in range(len(plans)):
+                    x = cache.get(keys[i], date, fingerprints[date])
+                    if x is not None:
+                        res[i][date] = x
+                idx = [i for i in idx if date not in res[i]]
+
+            if len(idx):
+                tasks += [(date, idx)]
+
+        batches = [tasks[i:i + batch_size] for i in range(0, len(tasks), batch_size)]
+
+        initargs = ([(type(x), x.departure_hour, x.route, x.get_kwargs()) for x in plans],
+                    self.historical_weather.filename,
+                    self.cells.get_short_coordinates(),
+                    self.historical_weather.local_time.timezone)
+
+        if 1 == workers:
+            _init_worker(*initargs)
+            results = map(_compute_days, batches)
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers,
+                                       initializer=_init_worker,
+                                       initargs=initargs)
+            results = pool.map(_compute_days, batches)
+
+        n = 0
+        for x in results:
+            for i, date, y in x:
+                res[i][date] = y
+                if cache is not None:
+                    cache.put(keys[i], date, fingerprints[date], y)
+
+            n += 1
+            logging.info("Computing historical plans, progress: " + str(n) + "/" + str(len(batches)))
+
+        if 1 != workers:
+            pool.shutdown()
+
+        return [pd.DataFrame([x[date] for date in sorted(x)]) for x in res]
+
+    def compare(self, departure_hours, forecast_days=(), use_cache=True,
+                workers=None, **kwargs):
+        """Compare routes and departures
+
+        :departure_hours: list of departure hours
+
+        :forecast_days: forecast days to plan with (1 means tomorrow)
+
+        :use_cache: whether to use the cache of characteristics
+
+        :workers: number of worker processes (see compute_historical)
+
+        :kwargs: physical parameters of the plans
+
+        returns pandas DataFrame with one row per route and departure,
+        sorted by the expected trip time
+
+        """
+        plans = self.get_plans(departure_hours, **kwargs)
+        historical = self.compute_historical(plans, use_cache=use_cache, workers=workers)
+
+        tc = Trip_Characteristics()
+        forecasts = {day: self.weather_forecast.forecast(day) for day in forecast_days}
+
+        res = []
+        for plan, x in zip(plans, historical):
+            y = {'route': plan.route.filename,
+                 'departure_hour': plan.departure_hour,
+                 'days': len(x)}
+
+            if len(x):
+                y['time_mean'] = x['time'].mean()
+                y['time_median'] = x['time'].median()
+                y['time_q90'] = x['time'].quantile(0.9)
+                y['w_precipProbability_mean'] = x['w_precipProbability'].mean()
+                y['w_temperature_Average_mean'] = x['w_temperature_Average'].mean()
+
+            for day, weather in forecasts.items():
+                z = tc._get_all(plan._compute_plan(weather))
+                y['forecast_' + str(day) + '_time'] = z['time']
+                if len(x):
+                    y['forecast_' + str(day) + '_rank'] = 100*(x['time'] < z['time']).mean()
+
+            res += [y]
+
+        res = pd.DataFrame(res)
+        if 'time_mean' in res.columns:
+            res = res.sort_values('time_mean', kind='stable').reset_index(drop=True)
+
+        return res
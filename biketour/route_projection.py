@@ -0,0 +1,205 @@
+#!/bin/env python
+
+from helping_functions import earth_radius
+
+import math
+
+import numpy as np
+
+class Route_Projection_Index(object):
+    """Spatial index of the route polyline
+
+    Projects arbitrary positions (e.g. GPS fixes during the ride) onto
+    the route. The segments are mapped to local planar coordinates (in
+    meters) and stored in the cells of a square grid, a query looks
+    only at the segments in the cells around the position.
+
+    Routes can visit the same place several times (loops, out-and-back
+    sections). In case the offset of the previous fix is given, the
+    next pass after it is taken.
+
+    """
+
+    def __init__(self, segments, cell_size=None, tolerance=50):
+        """Initialise class
+
+        :segments: table of route segments (see Route.get_segments)
+
+        :cell_size: size of the grid cells (in meters). In case None,
+        the median segment length is used (at least 50 meters)
+
+        :tolerance: distance (in meters) within which the passes of
+        the route are considered equally close to a position (GPS
+        accuracy)
+
+        """
+        self._tolerance = tolerance
+
+        self._latitude = segments['latitude'].values.astype(float)
+        self._longitude = segments['longitude'].values.astype(float)
+        self._elevation = segments['elevation'].values.astype(float)
+        self._distance = segments['distance'].values.astype(float)
+
+        # offset of the points along the route (in meters)
+        self._offset = np.cumsum(self._distance)
+
+        # local planar coordinates
+        self._latitude_0 = np.mean(self._latitude) if len(self._latitude) else 0
+        self._x, self._y = self._to_planar(self._latitude, self._longitude)
+
+        # segment j leads from the point j-1 to the point j
+        self._dx = np.diff(self._x)
+        self._dy = np.diff(self._y)
+        self._length2 = self._dx*self._dx + self._dy*self._dy
+
+        # table of the segments (start, direction, inverse squared
+        # length), gathered at once by the queries
+        with np.errstate(divide='ignore'):
+            inverse = np.where(self._length2 > 0, 1/self._length2, 0)
+        self._table = np.stack([self._x[:-1], self._y[:-1], self._dx, self._dy, inverse], axis=1)
+
+        if cell_size is None:
+            cell_size = max(np.median(np.sqrt(self._length2)) if len(self._length2) else 0, 50)
+        self._cell_size = cell_size
+
+        self._build_grid()
+
+    def _to_planar(self, latitude, longitude):
+        """Convert coordinates to local planar coordinates (in meters)
+
+        """
+        r = earth_radius()*math.pi/180
+
+        return (r*math.cos(math.radians(self._latitude_0))*np.asarray(longitude),
+                r*np.asarray(latitude))
+
+    def _get_cell(self, x, y):
+        return (int(math.floor(x/self._cell_size)), int(math.floor(y/self._cell_size)))
+
+    def _build_grid(self):
+        """Store the segments in the cells they pass through
+
+        A segment is stored in every cell of its bounding box.
+
+        """
+        x0 = np.floor(np.minimum(self._x[:-1], self._x[1:])/self._cell_size).astype(int)
+        x1 = np.floor(np.maximum(self._x[:-1], self._x[1:])/self._cell_size).astype(int)
+        y0 = np.floor(np.minimum(self._y[:-1], self._y[1:])/self._cell_size).astype(int)
+        y1 = np.floor(np.maximum(self._y[:-1], self._y[1:])/self._cell_size).astype(int)
+
+        grid = {}
+        for j in range(len(x0)):
+            for i in range(x0[j], x1[j] + 1):
+                for k in range(y0[j], y1[j] + 1):
+                    grid.setdefault((i,k), []).append(j)
+
+        self._grid = {k: np.array(v, dtype=np.int64) for k, v in grid.items()}
+        self._neighbours = {}
+
+    def _candidates(self, x, y, ring):
+        """Segments stored in the cells within a ring around a position
+
+        """
+        i, k = self._get_cell(x, y)
+
+        # the segments around a cell are kept for the next fixes
+        if 1 == ring and (i,k) in self._neighbours:
+            return self._neighbours[(i,k)]
+
+        res = [self._grid[c] for c in ((a,b)
+                                       for a in range(i - ring, i + ring + 1)
+                                       for b in range(k - ring, k + ring + 1))
+               if c in self._grid]
+
+        res = np.unique(np.concatenate(res)) if len(res) else np.empty(0, dtype=np.int64)
+
+        if 1 == ring:
+            self._neighbours[(i,k)] = res
+
+        return res
+
+    def _project_segments(self, x, y, idx):
+        """Project a position onto segments
+
+        returns tuple of arrays (fraction along the segments, distance)
+
+        """
+        x0, y0, dx, dy, inverse = self._table[idx].T
+        x0 = x0 - x
+        y0 = y0 - y
+
+        t = np.minimum(np.maximum(-(x0*dx + y0*dy)*inverse, 0), 1)
+
+        return t, np.hypot(x0 + t*dx, y0 + t*dy)
+
+    def project(self, latitude, longitude, previous_offset=None):
+        """Project a position onto the route
+
+        :latitude, longitude: position
+
+        :previous_offset: offset of the previous position along the
+        route (in meters). In case given, the first pass of the route
+        after it is taken among the passes within tolerance from the
+        closest one.
+
+        returns dictionary with the segment (position of the point the
+        segment leads to), the fraction along the segment, the offset
+        along the route (in meters), the distance to the route (in
+        meters) and the latitude, longitude and elevation of the
+        projected position
+
+        """
+        if 0 == len(self._length2):
+            raise ValueError("The route has less than two points")
+
+        x, y = self._to_planar(latitude, longitude)
+
+        # widen the search until the closest segment found is within
+        # the searched cells
+        ring = 1
+        while True:
+            idx = self._candidates(x, y, ring)
+            if len(idx):
+                t, distance = self._project_segments(x, y, idx)
+                if distance.min() <= ring*self._cell_size:
+                    break
+
+            if len(self._grid) <= (2*ring + 1)**2:
+                idx = np.arange(len(self._length2))
+                t, distance = self._project_segments(x, y, idx)
+                break
+
+            ring *= 2
+
+        offset = self._offset[idx] + t*self._distance[idx + 1]
+
+        # passes of the route close to the position: runs of
+        # consecutive segments, the closest segment of every pass
+        close = np.flatnonzero(distance <= distance.min() + self._tolerance)
+        breaks = np.flatnonzero(np.diff(idx[close]) > 1) + 1
+        if 0 == len(breaks):
+            passes = close[np.argmin(distance[close])][None]
+        else:
+            passes = np.array([x[np.argmin(distance[x])] for x in np.split(close, breaks)])
+
+        best = passes[np.argmin(distance[passes])]
+        if previous_offset is not None:
+            ahead = passes[offset[passes] >= previous_offset - self._tolerance]
+            if len(ahead):
+                best = ahead[np.argmin(offset[ahead])]
+
+        j, t = idx[best], t[best]
+
+        return {'segment': int(j + 1),
+                'fraction': float(t),
+                'offset': float(offset[best]),
+                'distance': float(distance[best]),
+                'latitude': float(self._latitude[j] + t*(self._latitude[j+1] - self._latitude[j])),
+                'longitude': float(self._longitude[j] + t*(self._longitude[j+1] - self._longitude[j])),
+                'elevation': float(self._elevation[j] + t*(self._elevation[j+1] - self._elevation[j]))}
+
+    def length(self):
+        """Length of the route (in meters)
+
+        """
+        return float(self._offset[-1]) if len(self._offset) else 0.0
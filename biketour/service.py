@@ -0,0 +1,625 @@
+#!/bin/env python
+
+"""Long-running local planning service
+
+The service keeps the routes (with their clusters and segments), the
+weather databases and the computed forecast plans in memory, and
+serves plan, forecast, rank and arrival requests over a local HTTP
+API:
+
+    GET /plan?route=...&day=1&departure_hour=7&P_rider=150
+    GET /forecast?route=...&day=1
+    GET /rank?route=...&days=3&departure_hour=7
+    GET /eta?route=...&latitude=...&longitude=...&time=...&previous_offset=...
+    GET /routes
+    POST /refresh
+
+The responses are json. Requests of concurrent clients are computed
+in parallel by a pool of reader threads, which read the weather by
+the pooled read connections of the weather stores (see
+Weather_Store). Loading routes and querying weather write to the
+databases, they run one after another in a single writer thread.
+Forecasts are refreshed in the background.
+
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import os, json, time, datetime, logging, threading
+
+import numpy as np
+
+from quota_ledger import DAILY_LIMIT
+
+# requests writing to the weather databases (see Planning_Service.submit)
+WRITE_REQUESTS = ('load', 'refresh')
+
+# parameters of the plans and their types
+PLAN_PARAMETERS = {'direction': str,
+                   'total_mass': float,
+                   'P_rider': float,
+                   'drivetrain_efficiency': float,
+                   'C_D': float,
+                   'C_rr': float}
+
+
+class Planning_Service(object):
+    """Planners of routes kept in memory between requests
+
+    """
+
+    def __init__(self, darksky_apikey, grid_resolution=None,
+                 weather_provider=None, refresh_interval=3600,
+                 timezone=None, quota_db=None, daily_limit=DAILY_LIMIT,
+                 backfill=False, workers=4):
+        """Initialise class
+
+        :darksky_apikey: key to the darksky api
+
+        :grid_resolution: resolution of the weather grid (see Planner)
+
+        :weather_provider: provider of the weather data (see
+        weather_provider)
+
+        :refresh_interval: interval between forecast refreshes in
+        seconds
+
+        :timezone: timezone of the routes (see Planner)
+
+        :quota_db: filename of the database counting the API calls of
+        all routes. In case None the calls are counted by route (in
+        its weather database).
+
+        :daily_limit: maximum number of API calls per day
+
+        :backfill: query historical weather of the loaded routes with
+        the API calls left after every forecast refresh
+
+        :workers: number of reader threads computing the requests
+
+        """
+        self._darksky_apikey = darksky_apikey
+        self._grid_resolution = grid_resolution
+        self._weather_provider = weather_provider
+        self._refresh_interval = refresh_interval
+        self._timezone = timezone
+        self._daily_limit = daily_limit
+        self._backfill = backfill
+
+        # API calls ledger shared by the routes
+        self._quota_ledger = None
+        if quota_db is not None:
+            from quota_ledger import Quota_Ledger
+            from weather_store import Weather_Store
+            self._quota_ledger = Quota_Ledger(Weather_Store(quota_db), darksky_apikey,
+                                              daily_limit=daily_limit)
+
+        # planners by route file
+        self._planners = {}
+
+        # plan objects by (route, departure hour, parameters)
+        self._plans = {}
+
+        # computed responses by (route, request, arguments, version,
+        # date), the version of a route is increased on every refresh
+        self._results = {}
+        self._versions = {}
+
+        # locks of the responses being computed, so that every
+        # response is computed once
+        self._result_locks = {}
+        self._lock = threading.Lock()
+
+        # reads run in parallel, writes in a single thread
+        self._readers = ThreadPoolExecutor(max_workers=workers)
+        self._writer = ThreadPoolExecutor(max_workers=1,
+                                          initializer=self._init_writer)
+        self._writer_thread = None
+
+        self._stop = threading.Event()
+        self._refresh_thread = None
+
+    def _init_writer(self):
+        self._writer_thread = threading.current_thread()
+
+    def submit(self, func, *args, **kwargs):
+        """Run function in a worker thread and wait for its result
+
+        The requests writing to the weather databases (see
+        WRITE_REQUESTS) run in the writer thread, the other ones in
+        the pool of reader threads.
+
+        """
+        if func.__name__ in WRITE_REQUESTS:
+            return self._write(func, *args, **kwargs)
+
+        return self._readers.submit(func, *args, **kwargs).result()
+
+    def _write(self, func, *args, **kwargs):
+        """Run function in the writer thread and wait for its result
+
+        """
+        if threading.current_thread() is self._writer_thread:
+            return func(*args, **kwargs)
+
+        return self._writer.submit(func, *args, **kwargs).result()
+
+    def _get_route_key(self, route_file):
+        return os.path.abspath(route_file)
+
+    def _get_planner(self, route_file):
+        """Get planner of a route, it is initialised on first use
+
+        The planner is initialised in the writer thread.
+
+        :route_file: path to the gpx file
+
+        """
+        key = self._get_route_key(route_file)
+        if key not in self._planners:
+            self._write(self._load_planner, key)
+
+        return self._planners[key]
+
+    def _load_planner(self, key):
+        """Initialise planner of a route
+
+        :key: route key (see _get_route_key)
+
+        """
+        from planner import Planner
+
+        if key not in self._planners:
+            if not os.path.exists(key):
+                raise ValueError("Unknown route: " + str(key))
+
+            logging.info("Loading route: " + key)
+            planner = Planner(key, self._darksky_apikey,
+                              grid_resolution=self._grid_resolution,
+                              weather_provider=self._weather_provider,
+                              timezone=self._timezone,
+                              quota_ledger=self._quota_ledger,
+                              daily_limit=self._daily_limit)
+            planner.route.get_segments()
+
+            # the databases are initialised by the writer
+            planner.historical_weather.store
+            planner.weather_forecast.store
+
+            self._planners[key] = planner
+
+    def _get_forecast_planner(self, route_file):
+        """Get planner of a route with a recent forecast
+
+        An expired forecast is queried in the writer thread.
+
+        :route_file: path to the gpx file
+
+        """
+        planner = self._get_planner(route_file)
+
+        if not planner.weather_forecast._is_recent_forecast_present():
+            self._write(self._refresh_route, self._get_route_key(route_file),
+                        planner, False)
+
+        return planner
+
+    def _get_plan(self, route_file, departure_hour, parameters):
+        """Get plan object with constant power
+
+        :route_file: path to the gpx file
+
+        :departure_hour: departure hour
+
+        :parameters: dictionary with physical parameters
+
+        """
+        key = (self._get_route_key(route_file), float(departure_hour),
+               tuple(sorted(parameters.items())))
+
+        if key not in self._plans:
+            plan = self._get_planner(route_file)\
+                       .get_plan("with_constant_power",
+                                 starting_time=departure_hour,
+                                 **parameters)
+
+            # a plan computed concurrently is kept
+            with self._lock:
+                self._plans.setdefault(key, plan)
+
+        return self._plans[key]
+
+    def _cached(self, route_file, request, args, func):
+        """Get cached response or compute it
+
+        Responses are valid until the next forecast refresh of the
+        route, or until the local date of the route changes. Every
+        response is computed once, concurrent requests of the same
+        response wait for it.
+
+        """
+        route = self._get_route_key(route_file)
+        planner = self._get_forecast_planner(route_file)
+
+        with self._lock:
+            key = (route, request, args, self._versions.get(route, 0),
+                   planner.weather_forecast.local_time.today())
+            if key in self._results:
+                return self._results[key]
+
+            lock = self._result_locks.setdefault(key, threading.Lock())
+
+        with lock:
+            if key in self._results:
+                return self._results[key]
+
+            res = func()
+
+            with self._lock:
+                # a response computed during a refresh or over midnight
+                # is returned but not kept, older responses of the route
+                # are dropped
+                if key[3] == self._versions.get(route, 0) and \
+                   key[4] == planner.weather_forecast.local_time.today():
+                    self._results = {k: v for k, v in self._results.items()
+                                     if k[0] != route or k[4] == key[4]}
+                    self._result_locks = {k: v for k, v in self._result_locks.items()
+                                          if k[0] != route or k[4] == key[4]}
+                    self._results[key] = res
+                else:
+                    self._result_locks.pop(key, None)
+
+        return res
+
+    def _forecast_plan(self, route_file, departure_hour, parameters, day):
+        """Get forecast plan, it is computed only once per forecast
+
+        """
+        return self._cached(route_file, 'forecast_plan',
+                            (float(departure_hour), tuple(sorted(parameters.items())), day),
+                            lambda: self._get_plan(route_file, departure_hour,
+                                                   parameters).plan(day))
+
+    def load(self, route_file):
+        """Load route, so that the first request is fast
+
+        """
+        self._get_planner(route_file)
+
+        return {'route': self._get_route_key(route_file)}
+
+    def plan(self, route_file, departure_hour=7, day=1, **parameters):
+        """Compute characteristics of the forecast plan
+
+        :route_file: path to the gpx file
+
+        :departure_hour: departure hour
+
+        :day: forecast day, 1 means tomorrow
+
+        :parameters: physical parameters of the plan
+
+        returns dictionary with plan characteristics
+
+        """
+        from trip_characteristics import Trip_Characteristics
+
+        return self._cached(route_file, 'plan',
+                            (float(departure_hour), tuple(sorted(parameters.items())), day),
+                            lambda: Trip_Characteristics()._get_all(
+                                self._forecast_plan(route_file, departure_hour,
+                                                    parameters, day)))
+
+    def forecast(self, route_file, day=1):
+        """Get weather forecast along the route
+
+        :route_file: path to the gpx file
+
+        :day: forecast day, 1 means tomorrow
+
+        returns list of dictionaries with the forecast weather
+
+        """
+        return self._cached(route_file, 'forecast', (day,),
+                            lambda: self._get_planner(route_file)\
+                                        .weather_forecast.forecast(day)\
+                                        .to_dict('records'))
+
+    def rank(self, route_file, departure_hour=7, days=3, **parameters):
+        """Rank forecast plans against the historical plans
+
+        :route_file: path to the gpx file
+
+        :departure_hour: departure hour
+
+        :days: number of forecast days
+
+        :parameters: physical parameters of the plan
+
+        returns list of dictionaries with date, time and its rank
+
+        """
+        from trip_characteristics import Trip_Characteristics
+
+        def compute():
+            plan = self._get_plan(route_file, departure_hour, parameters)
+            plans = [self._forecast_plan(route_file, departure_hour, parameters, day)
+                     for day in range(1, days + 1)]
+
+            return Trip_Characteristics().rank_forecast(plan, plans).to_dict('records')
+
+        return self._cached(route_file, 'rank',
+                            (float(departure_hour), tuple(sorted(parameters.items())), days),
+                            compute)
+
+    def eta(self, route_file, latitude, longitude, time=None, departure_hour=7,
+            previous_offset=None, **parameters):
+        """Estimate the arrival from a position during the ride
+
+        The rest of the journey is planned with the current forecast
+        (see Plan_With_Constant_Power.resume_plan).
+
+        :route_file: path to the gpx file
+
+        :latitude, longitude: current position
+
+        :time: time at the position (unix time). In case None the
+        current time is used.
+
+        :departure_hour: departure hour of the plan
+
+        :previous_offset: offset along the route of the previous
+        position (see Route_Projection_Index.project)
+
+        :parameters: physical parameters of the plan
+
+        returns dictionary with the projected position, the remaining
+        distance (in meters), the arrival time and the remaining time
+        (in seconds)
+
+        """
+        self._get_forecast_planner(route_file)
+        plan = self._get_plan(route_file, departure_hour, parameters)
+
+        if time is None:
+            time = plan.hw.local_time.now()
+
+        res, position = plan.resume_plan(latitude, longitude, time, previous_offset)
+
+        position['remaining_distance'] = plan.route.get_projection_index().length() - \
+            position['offset']
+        position['arrival'] = res.time[-1]
+        position['remaining_time'] = res.time[-1] - time
+
+        return position
+
+    def routes(self):
+        """List loaded routes
+
+        """
+        return sorted(self._planners.keys())
+
+    def refresh(self, force=False):
+        """Refresh weather forecasts of the loaded routes
+
+        The cached responses of a route are dropped in case its
+        forecast was queried. With backfill the API calls left today
+        are used to query the historical weather afterwards.
+
+        :force: query forecasts even if recent ones are present
+
+        returns list of refreshed routes
+
+        """
+        res = []
+        for key, planner in list(self._planners.items()):
+            if self._refresh_route(key, planner, force):
+                res += [key]
+
+        if self._backfill:
+            for key, planner in list(self._planners.items()):
+                hw = planner.historical_weather
+                fingerprint = hw.weather_fingerprint()
+
+                logging.info("Querying historical weather: " + key)
+                hw.query_darksky_weather()
+
+                if hw.weather_fingerprint() != fingerprint:
+                    self._drop_results(key)
+                    if key not in res:
+                        res += [key]
+
+        return res
+
+    def _refresh_route(self, key, planner, force=False):
+        """Refresh weather forecast of a route
+
+        :key: route key (see _get_route_key)
+
+        :planner: planner of the route
+
+        :force: query forecast even if a recent one is present
+
+        returns True in case the forecast was queried
+
+        """
+        wf = planner.weather_forecast
+        if not force and wf._is_recent_forecast_present():
+            return False
+
+        logging.info("Refreshing forecast: " + key)
+        wf.query_darksky_weather()
+
+        self._drop_results(key)
+
+        return True
+
+    def _drop_results(self, key):
+        """Drop the cached responses of a route
+
+        Responses being computed are not stored (see _cached).
+
+        :key: route key (see _get_route_key)
+
+        """
+        with self._lock:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            self._results = {k: v for k, v in self._results.items() if k[0] != key}
+            self._result_locks = {k: v for k, v in self._result_locks.items()
+                                  if k[0] != key}
+
+    def _refresh_loop(self):
+        """Periodically refresh forecasts in the writer thread
+
+        """
+        while not self._stop.wait(self._refresh_interval):
+            try:
+                self.submit(self.refresh)
+            except Exception as e:
+                logging.error("Error refreshing forecasts: " + str(e))
+
+    def start_refresh(self):
+        """Start background refresh of the forecasts
+
+        """
+        if self._refresh_thread is not None:
+            return
+
+        self._refresh_thread = threading.Thread(target=self._refresh_loop, daemon=True)
+        self._refresh_thread.start()
+
+    def stop(self):
+        """Stop the background refresh and the worker threads
+
+        """
+        self._stop.set()
+        self._readers.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+
+
+def _to_json(x):
+    """Convert numpy and pandas values to json types
+
+    """
+    if isinstance(x, np.generic):
+        return x.item()
+    if isinstance(x, (datetime.datetime, datetime.date)):
+        return x.isoformat()
+
+    return str(x)
+
+
+def _get_arguments(query):
+    """Convert request query to arguments of the service methods
+
+    :query: dictionary of the parsed query string
+
+    """
+    res = {}
+    for k, v in query.items():
+        v = v[-1]
+        if 'route' == k:
+            res['route_file'] = v
+        elif k in ('day', 'days'):
+            res[k] = int(v)
+        elif k in ('departure_hour','latitude','longitude','time','previous_offset'):
+            res[k] = float(v)
+        elif k in PLAN_PARAMETERS:
+            res[k] = PLAN_PARAMETERS[k](v)
+        else:
+            raise ValueError("Unknown argument: " + k)
+
+    return res
+
+
+class _Request_Handler(BaseHTTPRequestHandler):
+    """Handler of the service requests
+
+    The service is set as the attribute of the server.
+
+    """
+
+    _get_methods = {'/plan': 'plan',
+                    '/forecast': 'forecast',
+                    '/rank': 'rank',
+                    '/eta': 'eta',
+                    '/routes': 'routes',
+                    '/load': 'load'}
+
+    _post_methods = {'/refresh': 'refresh'}
+
+    def _respond(self, code, data):
+        body = json.dumps(data, default=_to_json).encode()
+
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, methods):
+        url = urlparse(self.path)
+        if url.path not in methods:
+            self._respond(404, {'error': "Unknown request: " + url.path})
+            return
+
+        service = self.server.service
+        t = time.time()
+        try:
+            args = _get_arguments(parse_qs(url.query))
+        except ValueError as e:
+            self._respond(400, {'error': str(e)})
+            return
+
+        try:
+            res = service.submit(getattr(service, methods[url.path]), **args)
+        except ValueError as e:
+            self._respond(400, {'error': str(e)})
+            return
+        except Exception as e:
+            logging.error("Error handling request " + self.path + ": " + str(e))
+            self._respond(500, {'error': str(e)})
+            return
+
+        self._respond(200, {'result': res, 'elapsed': time.time() - t})
+
+    def do_GET(self):
+        self._handle(self._get_methods)
+
+    def do_POST(self):
+        self._handle(self._post_methods)
+
+    def log_message(self, format, *args):
+        logging.info("%s - %s" % (self.address_string(), format % args))
+
+
+def serve(service, host="127.0.0.1", port=8642, routes=()):
+    """Serve requests until interrupted
+
+    :service: Planning_Service object
+
+    :host, port: address to listen on. The service is meant to be
+    local, do not expose it to the network.
+
+    :routes: routes loaded before serving
+
+    """
+    for x in routes:
+        service.submit(service.load, x)
+
+    server = ThreadingHTTPServer((host, port), _Request_Handler)
+    server.daemon_threads = True
+    server.service = service
+
+    service.start_refresh()
+
+    print("Serving on http://" + host + ":" + str(server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
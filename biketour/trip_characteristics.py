@@ -1,7 +1,12 @@
 #!/bin/env python
 
+from iterators import Iter_Historical_Weather
+from characteristics_cache import Characteristics_Cache
+from result_store import Chunked_Results
+from local_time import Local_Time
+
 import pandas as pd
-import datetime
+import logging
 
 class Trip_Characteristics:
     """Given a plan the class returns a list of available journey
@@ -9,16 +14,47 @@ class Trip_Characteristics:
 
     """
 
+    # weather columns summarised by their min, max and average
+    _column_quantities = ['w_temperature','w_apparentTemperature',
+                          'w_dewPoint','w_humidity','w_pressure',
+                          'w_cloudCover','w_uvIndex', 'w_visibility','w_ozone']
+
     def __init__(self):
         """Initialise the class
 
         """
+        # local time of plans without day keys in their weather
+        self._local_time = Local_Time()
+
+    def _format_days(self, days):
+        """Convert day keys to dates (strings YYYY-MM-DD)
+
+        :days: pandas Series with day keys
+
+        """
+        return pd.Series(pd.to_datetime(days.values.astype('int64'), unit='D')
+                         .strftime('%Y-%m-%d'), index=days.index)
+
+    def _get_days(self, plans):
+        """Get day keys of the plan rows
+
+        The day keys of the weather are used, in case they are missing
+        the keys are computed from the times.
+
+        :plans: a pandas DataFrame with journey times
+
+        """
+        if 'w_day' in plans:
+            return plans['w_day']
+
+        return pd.Series(self._local_time.day_keys(plans['time'].values),
+                         index=plans.index)
 
     def _compute_journey_date(self, plan):
         """Compute journey date
 
         """
-        return str(datetime.datetime.fromtimestamp(plan.time[0]).date())
+        return self._format_days(self._get_days(self._reduce_plan(plan, 0)).iloc[:1]).iloc[0]
 
 
     def _compute_journey_time(self, plan):
@@ -42,34 +78,103 @@ class Trip_Characteristics:
 
         """
 
-    def _compute_column_quantities(self, plan, column):
-        """Compute weather related quantities along the journey
+    def _compute_grouped_journey_date(self, plans, day):
+        """Compute journey date of every day
+
+        The date is given by the local day of the departure (first row
+        of the plan).
 
         """
-        return (plan[column].min(),
-                plan[column].max(),
-                plan[column].mean())
+        return self._format_days(self._get_days(plans).groupby(plans[day], sort=False).first())
 
+    def _compute_grouped_journey_time(self, plans, day):
+        """Compute journey longevity of every day
 
-    def _compute_precipitation_quantities(self, plan):
-        """Compute some precipitation quantities.
+        """
+        x = plans.groupby(day, sort=False)['time']
+
+        return x.max() - x.min()
+
+    def _compute_grouped_column_quantities(self, plans, day, columns):
+        """Compute weather related quantities along the journey of every day
+
+        returns pandas DataFrame with column_Min, column_Max and
+        column_Average columns
+
+        """
+        x = plans.groupby(day, sort=False)[columns].agg(['min','max','mean'])
+        x.columns = [c + {'min': "_Min", 'max': "_Max", 'mean': "_Average"}[f]
+                     for c, f in x.columns]
+
+        return x
+
+    def _compute_grouped_precipitation_quantities(self, plans, day):
+        """Compute some precipitation quantities of every day.
 
         Such as overall probability and overall amount
 
         """
-        x = plan[['w_time','w_precipProbability','w_precipIntensity']]\
-            .drop_duplicates(subset="w_time")
+        x = plans[[day,'w_time','w_precipProbability','w_precipIntensity']]\
+            .drop_duplicates(subset=[day,'w_time'])
 
         # silly probability computation, assuming independent events
+        probability = 1 - (1 - x.w_precipProbability)\
+            .groupby(x[day], sort=False).prod(min_count=1)
+        intensity = x.w_precipIntensity\
+            .groupby(x[day], sort=False).sum(min_count=1)
 
-        return (1-(1-x.w_precipProbability).prod(min_count=1),
-                x.w_precipIntensity.sum(min_count=1))
+        return probability, intensity
 
-    def _compute_most_likely_summary(self, plan):
-        """Get most common summary
+    def _compute_grouped_most_likely_summary(self, plans, day):
+        """Get most common summary of every day
+
+        In case of ties the summary appearing first along the route is
+        chosen.
 
         """
-        return plan.w_summary.value_counts().idxmax()
+        x = plans.groupby([day,'w_summary'], sort=False).size()\
+                 .rename('count').reset_index()
+
+        return x.sort_values('count', ascending=False, kind='stable')\
+                .drop_duplicates(subset=day)\
+                .set_index(day)['w_summary']
+
+    def aggregate(self, plans, day='day'):
+        """Compute plan characteristics of many plans at once
+
+        All characteristics are computed in one grouped pass over
+        the plans.
+
+        :plans: a pandas DataFrame with journey coordinates and weather
+        of many plans concatenated together
+
+        :day: name of the column identifying the plan
+
+        returns pandas DataFrame with one row per plan (indexed by
+        the day column, in the order of appearance)
+
+        """
+        column_quantites = self._column_quantities
+
+        # plans might be of object type
+        columns = ['time','w_time','w_precipProbability','w_precipIntensity'] \
+            + (['w_day'] if 'w_day' in plans else []) + column_quantites
+
+        x = plans[[day,'w_summary'] + columns].copy()
+        for column in columns:
+            x[column] = pd.to_numeric(x[column], errors='coerce')
+
+        res = pd.DataFrame(index=pd.Index(x[day].unique(), name=day))
+        res["date"] = self._compute_grouped_journey_date(x, day)
+        res["time"] = self._compute_grouped_journey_time(x, day)
+
+        y = self._compute_grouped_precipitation_quantities(x, day)
+        res["w_precipProbability"] = y[0]
+        res["w_precipIntensity"] = y[1]
+
+        res["summary"] = self._compute_grouped_most_likely_summary(x, day)
+
+        return res.join(self._compute_grouped_column_quantities(x, day, column_quantites))
 
     def _get_all(self, plan):
         """Compute all plan characteristics
@@ -77,45 +182,214 @@ class Trip_Characteristics:
         :plan: a pandas DataFrame with journey coordinates and weather
 
         """
+        return self.aggregate(self._reduce_plan(plan, 0)).iloc[0].to_dict()
+
+    def _reduce_plan(self, plan, date):
+        """Keep only plan columns needed for the characteristics
 
-        res={}
-        res["date"] = self._compute_journey_date(plan)
-        res["time"] = self._compute_journey_time(plan)
-        # res["distance"] = self._compute_journey_distance(plan)
-        # res["wind_index"] = self._compute_wind_index(plan)
-        # res["climbing_index"] = self._compute_climbing_index(plan)
+        :plan: a Plan_Result or a pandas DataFrame with journey
+        coordinates and weather
 
-        x = self._compute_precipitation_quantities(plan)
-        res["w_precipProbability"] = x[0]
-        res["w_precipIntensity"] = x[1]
+        :date: day key of the plan
 
-        res["summary"] = self._compute_most_likely_summary(plan)
+        """
+        columns = ['time','w_time','w_precipProbability','w_precipIntensity',
+                   'w_summary'] + self._column_quantities
 
-        column_quantites = ['w_temperature','w_apparentTemperature',
-                            'w_dewPoint','w_humidity','w_pressure',
-                            'w_cloudCover','w_uvIndex', 'w_visibility','w_ozone']
+        # day keys of the weather (see Local_Time)
+        try:
+            x = plan[columns + ['w_day']]
+        except KeyError:
+            x = plan[columns]
 
-        for column in column_quantites:
-            x = self._compute_column_quantities(plan,column)
-            res[column + "_Min"] = x[0]
-            res[column + "_Max"] = x[1]
-            res[column + "_Average"] = x[2]
+        return x.assign(day=[date]*len(x))
 
-        return res
+    def iter_historical(self, plan, use_cache=True, batch_size=25, skip=()):
+        """Iterate through historical plan characteristics
 
-    def compute_historical(self, plan):
-        """Compute historical plan characteristics
+        Characteristics are yielded as soon as they are available:
+        cached days immediately, computed days after every batch of
+        plans. At most batch_size reduced plans are kept in memory.
 
         :plan: plan object (e.g. Plan_With_Constant_Power)
 
+        :use_cache: whether to use the cache of characteristics,
+        stored in the historical weather database. Only the days that
+        are not yet cached, or whose weather changed, are computed.
+
+        :batch_size: number of plans aggregated at once
+
+        :skip: days (tuples (year, month, day)) to skip
+
+        returns generator of tuples (day, dictionary with
+        characteristics)
+
         """
+        ihw = Iter_Historical_Weather(plan.hw)
+
+        cache, key = None, None
+        if use_cache:
+            cache = Characteristics_Cache(plan.hw.store)
+            key = cache.get_key(plan)
+
         i = 0
-        res = []
+        plans = []
+        fingerprints = {}
 
-        for x in plan.historical_plans():
+        for date in ihw.get_dates():
             i += 1
-            print("Computing historical plans, progress: " + str(i))
 
-            res += [self._get_all(x)]
+            if date in skip:
+                continue
+
+            if cache is not None:
+                fingerprints[date] = ihw.date_fingerprint(date)
+                x = cache.get(key, date, fingerprints[date])
+                if x is not None:
+                    yield date, x
+                    continue
+
+            logging.info("Computing historical plans, progress: " + str(i))
+
+            try:
+                x = plan._compute_plan(ihw.query_date(date))
+            except TypeError as e:
+                logging.warning("Skipping a day with incomplete weather: " + str(e))
+                continue
+
+            plans += [self._reduce_plan(x, date)]
+
+            if len(plans) < batch_size:
+                continue
+
+            for y in self._aggregate_batch(plans, cache, key, fingerprints):
+                yield y
+            plans = []
+
+        for y in self._aggregate_batch(plans, cache, key, fingerprints):
+            yield y
+
+    def _aggregate_batch(self, plans, cache, key, fingerprints):
+        """Compute characteristics of a batch of plans
+
+        :plans: list of reduced plans (see _reduce_plan)
+
+        :cache: Characteristics_Cache object or None
+
+        :key: cache key
+
+        :fingerprints: dictionary with weather fingerprints of days
+
+        returns list of tuples (day, dictionary with characteristics)
+
+        """
+        if 0 == len(plans):
+            return []
+
+        x = self.aggregate(pd.concat(plans, ignore_index=True))
+        res = list(zip(x.index, x.to_dict('records')))
+
+        if cache is not None:
+            for date, y in res:
+                cache.put(key, date, fingerprints[date], y)
+
+        return res
+
+    def compute_historical(self, plan, use_cache=True, output=None, batch_size=25):
+        """Compute historical plan characteristics
+
+        :plan: plan object (e.g. Plan_With_Constant_Power)
+
+        :use_cache: whether to use the cache of characteristics (see
+        iter_historical)
+
+        :output: directory where the characteristics are incrementally
+        written (see Chunked_Results). In case the directory already
+        contains results, only the missing days are computed, so an
+        interrupted run is resumed.
+
+        :batch_size: number of plans aggregated (and written) at once
+
+        returns pandas DataFrame with characteristics sorted by day
+
+        """
+        if output is None:
+            res = sorted(self.iter_historical(plan, use_cache=use_cache,
+                                              batch_size=batch_size),
+                         key=lambda x: x[0])
+
+            return pd.DataFrame([x[1] for x in res])
+
+        store = Chunked_Results(output)
+        done = set(tuple(int(y) for y in x.split("-")) for x in store.get_keys())
+
+        batch = []
+        for date, x in self.iter_historical(plan, use_cache=use_cache,
+                                            batch_size=batch_size, skip=done):
+            batch += [(self._format_day(date), x)]
+
+            if len(batch) >= batch_size:
+                store.append([y[0] for y in batch], [y[1] for y in batch])
+                batch = []
+
+        store.append([y[0] for y in batch], [y[1] for y in batch])
+
+        return store.load()
+
+    def update_rank_index(self, plan):
+        """Compute historical characteristics and index them for ranking
+
+        Only the days missing in the cache are computed (see
+        iter_historical). Run after new historical weather is queried.
+
+        :plan: plan object (e.g. Plan_With_Constant_Power)
+
+        """
+        self.compute_historical(plan, use_cache=True)
+
+        cache = Characteristics_Cache(plan.hw.store)
+        cache.build_rank_index(cache.get_key(plan))
+
+    def rank_forecast(self, plan, forecast_plans, columns=('time',)):
+        """Rank forecast plans against the historical plans
+
+        The historical characteristics are read from the rank index
+        stored in the historical weather database. The index is
+        (re)built only in case it is missing or outdated.
+
+        :plan: plan object (e.g. Plan_With_Constant_Power)
+
+        :forecast_plans: list of plans computed with the weather
+        forecast (results of plan.plan)
+
+        :columns: characteristics to rank
+
+        returns pandas DataFrame with the date, the characteristics
+        and their percentile ranks (columns with suffix '_rank')
+
+        """
+        cache = Characteristics_Cache(plan.hw.store)
+        key = cache.get_key(plan)
+
+        if not cache.is_rank_index_valid(key):
+            self.update_rank_index(plan)
+
+        res = []
+        for x in forecast_plans:
+            x = self._get_all(x)
+
+            y = {'date': x['date']}
+            for k in columns:
+                y[k] = x[k]
+                y[k + '_rank'] = cache.percentile_rank(key, k, x[k])
+            res += [y]
 
         return pd.DataFrame(res)
+
+    def _format_day(self, date):
+        """Format day key as a string
+
+        :date: a tuple (year, month, day)
+
+        """
+        return "%04d-%02d-%02d" % tuple(date)
@@ -0,0 +1,253 @@
+#!/bin/env python
+
+from iterators import Iter_Historical_Weather
+
+import numpy as np
+import pandas as pd
+
+import os, json
+
+# fixed-point representation of numeric weather variables: value =
+# offset + scale*stored integer
+NUMERIC_VARIABLES = {
+    'precipIntensity':     (0.001, 0),
+    'precipProbability':   (0.0001, 0),
+    'temperature':         (0.01, 0),
+    'apparentTemperature': (0.01, 0),
+    'dewPoint':            (0.01, 0),
+    'humidity':            (0.0001, 0),
+    'pressure':            (0.01, 1000),
+    'windSpeed':           (0.01, 0),
+    'windGust':            (0.01, 0),
+    'windBearing':         (0.01, 180),
+    'cloudCover':          (0.0001, 0),
+    'uvIndex':             (0.01, 0),
+    'visibility':          (0.01, 0),
+    'ozone':               (0.01, 350),
+}
+
+# text variables are stored as codes of their dictionaries
+TEXT_VARIABLES = ['summary', 'icon', 'precipType']
+
+# integer marking missing numeric values
+MISSING = np.iinfo(np.int16).min
+
+
+class Weather_Archive(object):
+    """Compact archive of historical weather in memory-mapped arrays
+
+    The weather of the complete historical days is stored as dense
+    arrays of the shape (days x 24 hours x clusters x variables):
+
+     + values.npy: numeric variables quantized to int16 fixed-point
+       values (see NUMERIC_VARIABLES)
+
+     + text.npy: codes (uint16) of text variables, 0 means missing
+
+     + time.npy: (days x 24) times of the hourly slots
+
+     + days.npz: dates of the days
+
+     + coordinates.npy: (clusters x 2) latitude and longitude
+
+     + meta.json: variables, their scales and offsets, and the
+       dictionaries of text variables
+
+    The archive is an export of the historical weather database,
+    which stays the source of truth. The arrays are opened
+    memory-mapped, so opening the archive does not read the weather,
+    and a day of weather is a view of the arrays.
+
+    """
+
+    def __init__(self, directory):
+        """Initialise class
+
+        :directory: directory of the archive
+
+        """
+        self.directory = directory
+
+        self.values = None
+        self.text = None
+        self.time = None
+        self.dates = None
+        self.coordinates = None
+        self.meta = None
+
+    def _filename(self, name):
+        return os.path.join(self.directory, name)
+
+    def _quantize(self, x, variable):
+        """Convert values of a numeric variable to fixed-point
+
+        """
+        scale, offset = NUMERIC_VARIABLES[variable]
+        x = np.asarray(pd.to_numeric(x, errors='coerce'), dtype=float)
+
+        res = np.round((x - offset)/scale)
+        res = np.clip(res, MISSING + 1, np.iinfo(np.int16).max)
+        res[~np.isfinite(x)] = MISSING
+
+        return res.astype(np.int16)
+
+    def write(self, hw):
+        """Export historical weather to the archive
+
+        Only complete days are exported. The days and hours are the
+        local day and hour keys stored with the weather (see
+        Local_Time), on days with daylight saving time change an hour
+        might be missing or merged.
+
+        :hw: Historical_Weather object
+
+        """
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+        ihw = Iter_Historical_Weather(hw)
+        dates = ihw.get_dates()
+        days = np.array([hw.local_time.day(x) for x in dates], dtype=np.int64)
+        midnights = hw.local_time.midnights(days)
+
+        weather = hw.query_local_weather()
+
+        # clusters
+        coordinates = weather[['latitude','longitude']].drop_duplicates()\
+                                                       .sort_values(['latitude','longitude'])\
+                                                       .reset_index(drop=True)
+        cluster = pd.MultiIndex.from_frame(coordinates)\
+                               .get_indexer(pd.MultiIndex.from_frame(weather[['latitude','longitude']]))
+
+        # days and hours
+        key = weather['day'].values.astype(np.int64)
+        day = np.searchsorted(days, key)
+        keep = day < len(days)
+        keep[keep] = days[day[keep]] == key[keep]
+        day = np.where(keep, day, 0)
+        hour = weather['hour'].values.astype(np.int64)
+        keep &= (hour >= 0) & (hour < 24)
+        hour = np.clip(hour, 0, 23)
+
+        shape = (len(dates), 24, len(coordinates))
+        variables = list(NUMERIC_VARIABLES.keys())
+
+        values = np.lib.format.open_memmap(self._filename("values.npy"), mode="w+",
+                                           dtype=np.int16,
+                                           shape=shape + (len(variables),))
+        values[:] = MISSING
+        for i, x in enumerate(variables):
+            values[day[keep], hour[keep], cluster[keep], i] = self._quantize(weather[x], x)[keep]
+        values.flush()
+
+        text = np.lib.format.open_memmap(self._filename("text.npy"), mode="w+",
+                                         dtype=np.uint16,
+                                         shape=shape + (len(TEXT_VARIABLES),))
+        dictionaries = {}
+        for i, x in enumerate(TEXT_VARIABLES):
+            codes, dictionaries[x] = pd.factorize(weather[x])
+            text[day[keep], hour[keep], cluster[keep], i] = (codes + 1)[keep]
+            dictionaries[x] = [str(y) for y in dictionaries[x]]
+        text.flush()
+
+        np.save(self._filename("time.npy"),
+                midnights[:,None] + 3600*np.arange(24, dtype=np.int64)[None,:])
+        np.savez(self._filename("days.npz"),
+                 date=np.array(["%04d-%02d-%02d" % x for x in dates], dtype=str),
+                 day=days)
+        np.save(self._filename("coordinates.npy"), coordinates.values.astype(float))
+
+        with open(self._filename("meta.json"), "w") as f:
+            json.dump({'variables': variables,
+                       'scales': [NUMERIC_VARIABLES[x][0] for x in variables],
+                       'offsets': [NUMERIC_VARIABLES[x][1] for x in variables],
+                       'text_variables': TEXT_VARIABLES,
+                       'dictionaries': dictionaries}, f)
+
+        del values, text
+
+        return self.open()
+
+    def open(self):
+        """Open the archive
+
+        """
+        self.values = np.load(self._filename("values.npy"), mmap_mode="r")
+        self.text = np.load(self._filename("text.npy"), mmap_mode="r")
+        self.time = np.load(self._filename("time.npy"), mmap_mode="r")
+        self.coordinates = np.load(self._filename("coordinates.npy"))
+
+        with np.load(self._filename("days.npz"), allow_pickle=False) as x:
+            self.dates = list(x['date'])
+            # day keys (missing in archives written before the keys)
+            self.days = x['day'] if 'day' in x else None
+
+        with open(self._filename("meta.json")) as f:
+            self.meta = json.load(f)
+
+        return self
+
+    def get_variable(self, variable, day=slice(None)):
+        """Get values of a numeric variable
+
+        :variable: name of the variable
+
+        :day: index or slice of days
+
+        returns float array (hours x clusters for a single day),
+        missing values are nan
+
+        """
+        i = self.meta['variables'].index(variable)
+        x = self.values[day, ..., i]
+
+        res = self.meta['offsets'][i] + self.meta['scales'][i]*x.astype(float)
+        res[x == MISSING] = np.nan
+
+        return res
+
+    def get_text(self, variable, day=slice(None)):
+        """Get values of a text variable
+
+        :variable: name of the variable
+
+        :day: index or slice of days
+
+        returns object array, missing values are None
+
+        """
+        i = self.meta['text_variables'].index(variable)
+        dictionary = np.array([None] + self.meta['dictionaries'][variable], dtype=object)
+
+        return dictionary[self.text[day, ..., i]]
+
+    def get_weather(self, day):
+        """Get weather of a day as a pandas DataFrame
+
+        The DataFrame has the same format as the result of
+        Historical_Weather.query_local_weather, so it can be used to
+        compute plans.
+
+        :day: index of the day
+
+        """
+        n_hours, n_clusters = self.values.shape[1:3]
+
+        res = pd.DataFrame({
+            'latitude': np.tile(self.coordinates[:,0], n_hours),
+            'longitude': np.tile(self.coordinates[:,1], n_hours),
+            'time': np.repeat(np.asarray(self.time[day]), n_clusters),
+            'hour': np.repeat(np.arange(n_hours), n_clusters)})
+
+        if self.days is not None:
+            res['day'] = self.days[day]
+
+        for x in self.meta['text_variables']:
+            res[x] = self.get_text(x, day).ravel()
+
+        for x in self.meta['variables']:
+            res[x] = self.get_variable(x, day).ravel()
+
+        # drop missing hours
+        return res[~np.isnan(res[self.meta['variables']].values).all(axis=1)]\
+            .reset_index(drop=True)
@@ -0,0 +1,185 @@
+#!/bin/env python
+
+import os, json, time, random, hashlib, logging
+
+class Darksky_Provider(object):
+    """Weather provider making live queries to the darksky API
+
+    All providers implement the forecast method with the arguments of
+    darksky.forecast. The result supports result['hourly']['data'],
+    result['daily']['data'] and result.response_headers.
+
+    """
+
+    def forecast(self, key, latitude, longitude, time=None, units="si"):
+        """Query weather at a given place (and time)
+
+        :key: darksky api key
+
+        :latitude, longitude: coordinate of the place
+
+        :time: time in seconds since epoch. In case None the forecast
+        is queried.
+
+        :units: units of the data
+
+        """
+        from darksky import forecast
+
+        if time is None:
+            return forecast(key=key, latitude=latitude, longitude=longitude,
+                            units=units)
+
+        return forecast(key=key, latitude=latitude, longitude=longitude,
+                        time=time, units=units)
+
+
+class Recorded_Response(dict):
+    """Weather query result read from a recording
+
+    """
+
+    def __init__(self, data, response_headers):
+        super(Recorded_Response, self).__init__(data)
+        self.response_headers = response_headers
+
+
+def _get_request_filename(directory, latitude, longitude, time, units):
+    """Get filename of a recorded request
+
+    The api key is not part of the recording.
+
+    """
+    x = json.dumps(["%.6f" % float(latitude), "%.6f" % float(longitude),
+                    None if time is None else int(time), units])
+
+    return os.path.join(directory, hashlib.sha1(x.encode()).hexdigest() + ".json")
+
+
+class Recording_Provider(object):
+    """Weather provider recording query results to disk
+
+    Every query is passed to the underlying provider and its result
+    is written to a json file in the recording directory.
+
+    """
+
+    def __init__(self, directory, provider=None):
+        """Initialise class
+
+        :directory: directory to write recordings to
+
+        :provider: provider making the queries. In case None
+        Darksky_Provider is used.
+
+        """
+        self.directory = directory
+        self.provider = Darksky_Provider() if provider is None else provider
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+    def _get_data(self, res):
+        """Get raw data of a query result
+
+        """
+        if isinstance(getattr(res, 'json', None), dict):
+            return res.json
+
+        data = {}
+        for x in ('hourly', 'daily'):
+            try:
+                data[x] = {'data': list(res[x]['data'])}
+            except (KeyError, TypeError):
+                continue
+
+        return data
+
+    def forecast(self, key, latitude, longitude, time=None, units="si"):
+        """Query weather and record the result
+
+        See Darksky_Provider.forecast
+
+        """
+        res = self.provider.forecast(key=key, latitude=latitude, longitude=longitude,
+                                     time=time, units=units)
+
+        headers = {}
+        try:
+            headers['X-Forecast-API-Calls'] = res.response_headers['X-Forecast-API-Calls']
+        except Exception:
+            pass
+
+        filename = _get_request_filename(self.directory, latitude, longitude, time, units)
+        with open(filename + ".tmp", "w") as f:
+            json.dump({'request': {'latitude': latitude, 'longitude': longitude,
+                                   'time': None if time is None else int(time),
+                                   'units': units},
+                       'response_headers': headers,
+                       'data': self._get_data(res)}, f)
+        os.replace(filename + ".tmp", filename)
+
+        return res
+
+
+class Replay_Provider(object):
+    """Weather provider replaying recorded query results
+
+    Latency and errors of the weather service can be injected, which
+    allows to test the querying and storing of weather without the
+    live service.
+
+    """
+
+    def __init__(self, directory, latency=0, error_rate=0, seed=None):
+        """Initialise class
+
+        :directory: directory with recordings (see Recording_Provider)
+
+        :latency: injected latency of every query in seconds. Either a
+        number or a tuple (minimum, maximum) for uniformly distributed
+        latency.
+
+        :error_rate: probability of a query to fail with an error
+
+        :seed: seed for the injected latency and errors
+
+        """
+        self.directory = directory
+        self._latency = latency
+        self._error_rate = error_rate
+        self._random = random.Random(seed)
+
+    def _sleep(self):
+        """Wait for the injected latency
+
+        """
+        if isinstance(self._latency, (tuple, list)):
+            x = self._random.uniform(self._latency[0], self._latency[1])
+        else:
+            x = self._latency
+
+        if x > 0:
+            time.sleep(x)
+
+    def forecast(self, key, latitude, longitude, time=None, units="si"):
+        """Replay a recorded query
+
+        See Darksky_Provider.forecast
+
+        """
+        self._sleep()
+
+        if self._random.random() < self._error_rate:
+            raise RuntimeError("Injected weather provider error")
+
+        filename = _get_request_filename(self.directory, latitude, longitude, time, units)
+        if not os.path.exists(filename):
+            logging.error("Missing recording for latitude = " + str(latitude) +
+                          " longitude = " + str(longitude) + " time = " + str(time))
+            raise RuntimeError("Missing recording")
+
+        with open(filename) as f:
+            x = json.load(f)
+
+        return Recorded_Response(x['data'], x['response_headers'])
@@ -0,0 +1,279 @@
+#!/bin/env python
+
+import sqlite3, logging, threading, queue
+
+# types of the weather columns, shared by the historical and the
+# forecast tables
+COLUMNS = {
+    'id':                         'INTEGER PRIMARY KEY AUTOINCREMENT',
+    'forecast_type':              'VARCHAR(255)',
+    'forecast_time':              'INTEGER NOT NULL',
+    'latitude':                   'REAL NOT NULL',
+    'longitude':                  'REAL NOT NULL',
+    'time':                       'INTEGER NOT NULL',
+    'summary':                    'VARCHAR(255)',
+    'icon':                       'VARCHAR(255)',
+    'sunriseTime':                'INTEGER',
+    'sunsetTime':                 'INTEGER',
+    'moonPhase':                  'REAL',
+    'precipIntensity':            'REAL',
+    'precipIntensityMax':         'REAL',
+    'precipIntensityTime':        'INTEGER',
+    'precipProbability':          'REAL',
+    'precipType':                 'VARCHAR(255)',
+    'temperature':                'REAL',
+    'temperatureHigh':            'REAL',
+    'temperatureHighTime':        'INTEGER',
+    'temperatureLow':             'REAL',
+    'temperatureLowTime':         'INTEGER',
+    'apparentTemperature':        'REAL',
+    'apparentTemperatureHigh':    'REAL',
+    'apparentTemperatureHighTime':'INTEGER',
+    'apparentTemperatureLow':     'REAL',
+    'apparentTemperatureLowTime': 'INTEGER',
+    'dewPoint':                   'REAL',
+    'humidity':                   'REAL',
+    'pressure':                   'REAL',
+    'windSpeed':                  'REAL',
+    'windGust':                   'REAL',
+    'windGustTime':               'INTEGER',
+    'windBearing':                'REAL',
+    'cloudCover':                 'REAL',
+    'uvIndex':                    'REAL',
+    'uvIndexTime':                'INTEGER',
+    'visibility':                 'REAL',
+    'ozone':                      'REAL',
+    'day':                        'INTEGER',
+    'hour':                       'INTEGER',
+}
+
+# columns (in the order of the tables) and constraints of the tables
+TABLES = {
+    'weather': (
+        ['id', 'latitude', 'longitude', 'time', 'summary', 'icon',
+         'precipIntensity', 'precipProbability', 'precipType',
+         'temperature', 'apparentTemperature', 'dewPoint', 'humidity',
+         'pressure', 'windSpeed', 'windGust', 'windBearing',
+         'cloudCover', 'uvIndex', 'visibility', 'ozone', 'day', 'hour'],
+        'CONSTRAINT uc_time_latitude_longitude UNIQUE (time, latitude, longitude)'),
+    'weather_forecast': (
+        ['id', 'forecast_type', 'forecast_time', 'latitude', 'longitude',
+         'time', 'summary', 'icon', 'sunriseTime', 'sunsetTime',
+         'moonPhase', 'precipIntensity', 'precipIntensityMax',
+         'precipIntensityTime', 'precipProbability', 'precipType',
+         'temperature', 'temperatureHigh', 'temperatureHighTime',
+         'temperatureLow', 'temperatureLowTime', 'apparentTemperature',
+         'apparentTemperatureHigh', 'apparentTemperatureHighTime',
+         'apparentTemperatureLow', 'apparentTemperatureLowTime',
+         'dewPoint', 'humidity', 'pressure', 'windSpeed', 'windGust',
+         'windGustTime', 'windBearing', 'cloudCover', 'uvIndex',
+         'uvIndexTime', 'visibility', 'ozone', 'day', 'hour'],
+        'CONSTRAINT uc_time_latitude_longitude_ftype_ftime '
+        'UNIQUE (time, latitude, longitude, forecast_type, forecast_time)'),
+}
+
+
+class Weather_Store(object):
+    """Database with the historical weather and the weather forecasts
+
+    Both kinds of weather are stored in one database file, their
+    tables share the column definitions (see COLUMNS).
+
+    Writes go through a single connection (see connection), every
+    write transaction is made holding write_lock. Reads are made by a
+    pool of read-only connections that can be used from any thread.
+    The database is in write-ahead log mode, so reads do not wait for
+    the writes.
+
+    Other tables of the weather database (plan characteristics, API
+    calls) are written and read by the store as well, so that the
+    database has a single writer.
+
+    """
+
+    def __init__(self, filename, pool_size=4, timeout=15):
+        """Initialise class
+
+        :filename: filename of the sqlite database
+
+        :pool_size: maximal number of read connections
+
+        :timeout: time (in seconds) to wait for a locked database
+
+        """
+        self.filename = filename
+
+        self._pool_size = pool_size
+        self._timeout = timeout
+
+        # connections are opened on first use
+        self._connection = None
+        self._readers = queue.LifoQueue()
+        self._n_readers = 0
+        self._lock = threading.Lock()
+
+        # held during write transactions
+        self.write_lock = threading.RLock()
+
+    @property
+    def connection(self):
+        """Database connection for writing
+
+        """
+        with self._lock:
+            if self._connection is None:
+                self._connection=sqlite3.connect(self.filename, timeout = self._timeout,
+                                                 isolation_level="EXCLUSIVE",
+                                                 check_same_thread=False)
+                self._connection.execute('''PRAGMA journal_mode=WAL''')
+
+                # in write-ahead log mode the transactions are not
+                # synced to the disk one by one
+                self._connection.execute('''PRAGMA synchronous=NORMAL''')
+
+        return self._connection
+
+    def _acquire_reader(self):
+        """Take a read connection from the pool
+
+        A new connection is opened in case the pool is empty and has
+        less than pool_size connections, otherwise it waits for a
+        connection to be returned.
+
+        """
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._n_readers >= self._pool_size:
+                connection = None
+            else:
+                self._n_readers += 1
+                connection = sqlite3.connect(self.filename, timeout = self._timeout,
+                                             check_same_thread=False)
+                connection.execute('''PRAGMA query_only=1''')
+
+        if connection is None:
+            connection = self._readers.get()
+
+        return connection
+
+    def fetch(self, sql, parameters=()):
+        """Run a read query
+
+        :sql: sql query
+
+        :parameters: values of the query placeholders
+
+        returns list of rows
+
+        """
+        # the writer creates the database and switches it to the
+        # write-ahead log
+        self.connection
+
+        connection = self._acquire_reader()
+        try:
+            return connection.execute(sql, parameters).fetchall()
+        except Exception as e:
+            logging.error("Error quering data from " + self.filename + ": " + str(e))
+            raise e
+        finally:
+            self._readers.put(connection)
+
+    def get_schema(self, table):
+        """Get columns of a table with their types
+
+        :table: name of the table (see TABLES)
+
+        """
+        return {x: COLUMNS[x] for x in TABLES[table][0]}
+
+    def create_table(self, c, table):
+        """Create table in case it does not exist
+
+        :c: database cursor
+
+        :table: name of the table (see TABLES)
+
+        """
+        c.execute('''
+        CREATE TABLE IF NOT EXISTS ''' + table + '''
+        (
+        ''' + ", ".join(x[0] + " " + x[1] for x in self.get_schema(table).items()) + ''',
+        ''' + TABLES[table][1] + '''
+        )''')
+
+    def _to_frame(self, rows, columns):
+        """Convert rows to a pandas DataFrame with typed columns
+
+        Real columns are float, integer columns are int (float in case
+        of missing values), other columns are objects.
+
+        """
+        # pandas is imported on first query, so that the tables read
+        # without it (e.g. the cached plan characteristics) open fast
+        import numpy as np
+        import pandas as pd
+
+        values = list(zip(*rows)) if len(rows) else [()]*len(columns)
+
+        res = {}
+        for x, y in zip(columns, values):
+            kind = COLUMNS.get(x, '').split(' ')[0]
+            if 'REAL' == kind:
+                res[x] = np.array(y, dtype=float)
+            elif 'INTEGER' == kind:
+                res[x] = np.array(y, dtype=float if None in y else np.int64)
+            else:
+                res[x] = np.array(y, dtype=object)
+
+        return pd.DataFrame(res, columns=columns)
+
+    def query(self, table, columns='*', where=None, parameters=()):
+        """Query weather rows
+
+        :table: name of the table (see TABLES)
+
+        :columns: columns to query (list or string in sql format), '*'
+        queries all columns of the table
+
+        :where: where condition in terms of database column names and
+        sql language
+
+        :parameters: values of the placeholders in the where condition
+
+        returns pandas DataFrame
+
+        """
+        if '*' == columns:
+            columns = TABLES[table][0]
+        elif isinstance(columns, str):
+            columns = columns.split(",")
+        columns = [x.strip() for x in columns]
+
+        sql = '''
+        SELECT
+        ''' + ",".join(columns) + '''
+        FROM ''' + table
+
+        if where is not None:
+            sql += '''
+            WHERE ''' + where
+
+        return self._to_frame(self.fetch(sql, parameters), columns)
+
+    def close(self):
+        """Close all connections
+
+        """
+        with self._lock:
+            while not self._readers.empty():
+                self._readers.get_nowait().close()
+            self._n_readers = 0
+
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
@@ -0,0 +1,39 @@
+import os, sys
+
+# modules of biketour import each other by their plain names, the
+# benchmarks provide the synthetic routes and weather
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root, "biketour"))
+sys.path.insert(0, os.path.join(root, "benchmarks"))
+
+import pytest
+
+from synthetic import generate_gpx, generate_weather_db
+
+from route import Route
+from physical_models import Plan_With_Constant_Power
+
+
+@pytest.fixture
+def route(tmp_path):
+    """Synthetic route of 12 km
+
+    """
+    return Route(generate_gpx(str(tmp_path / "route.gpx"), length=12000, spacing=300))
+
+
+@pytest.fixture
+def historical_weather(tmp_path, route):
+    """Synthetic weather of 8 days at the route coordinates
+
+    """
+    return generate_weather_db(str(tmp_path / "weather.db"),
+                               route.get_short_coordinates(), n_days=8)
+
+
+@pytest.fixture
+def plan(route, historical_weather):
+    """Plan with constant power on the synthetic route and weather
+
+    """
+    return Plan_With_Constant_Power(7, route, historical_weather, None)
@@ -0,0 +1,53 @@
+import datetime
+
+from synthetic import Synthetic_Provider
+
+from historical_weather import Historical_Weather
+from physical_models import Plan_With_Constant_Power
+from adaptive_sampling import Adaptive_Historical_Sampling
+
+
+def test_sampling_stops_once_quantiles_are_stable(tmp_path, route):
+    hw = Historical_Weather(route.get_short_coordinates(), None,
+                            filename=str(tmp_path / "weather.db"),
+                            sample_size=30, sample_seed=0,
+                            sample_current_date=datetime.datetime(2019, 6, 1, 12),
+                            weather_provider=Synthetic_Provider())
+    plan = Plan_With_Constant_Power(7, route, hw, None)
+
+    sampling = Adaptive_Historical_Sampling(plan, batch_size=5, min_days=10,
+                                            tolerance=24*3600)
+    res = sampling.run()
+
+    # two batches reach min_days, the wide tolerance is met at once
+    assert 10 == len(hw.complete_days())
+    assert 10 == len(sampling.get_times())
+    assert (res['lower'] <= res['estimate']).all()
+    assert (res['estimate'] <= res['upper']).all()
+
+
+def test_days_with_incomplete_weather_are_skipped(tmp_path, route, caplog):
+    hw = Historical_Weather(route.get_short_coordinates(), None,
+                            filename=str(tmp_path / "weather.db"),
+                            sample_size=30, sample_seed=0,
+                            sample_current_date=datetime.datetime(2019, 6, 1, 12),
+                            weather_provider=Synthetic_Provider())
+    plan = Plan_With_Constant_Power(7, route, hw, None)
+
+    # the plan of the first computed day fails
+    compute_plan = plan._compute_plan
+    bad = []
+    def _compute_plan(weather):
+        if 0 == len(bad) or bad[0] == weather['day'][0]:
+            bad[:] = [weather['day'][0]]
+            raise TypeError("missing weather")
+        return compute_plan(weather)
+    plan._compute_plan = _compute_plan
+
+    sampling = Adaptive_Historical_Sampling(plan, batch_size=5, min_days=10,
+                                            tolerance=24*3600)
+    sampling.run()
+
+    assert 15 == len(hw.complete_days())
+    assert 14 == len(sampling.get_times())
+    assert "Skipping a day with incomplete weather" in caplog.text
@@ -0,0 +1,17 @@
+from run_benchmarks import compare, relative_times
+
+
+def _results(reference, compute_plan):
+    return {'reference': reference,
+            'scales': {'small': {'compute_plan': compute_plan, 'parse_gpx': 0.01}}}
+
+
+def test_baselines_are_compared_relative_to_the_reference():
+    baselines = {'scales': relative_times(_results(0.1, 0.05))}
+
+    # a slower machine is not a regression
+    assert [] == compare(_results(0.3, 0.15), baselines, 1.5)
+
+    regressions = compare(_results(0.1, 0.1), baselines, 1.5)
+    assert [('small', 'compute_plan')] == [x[:2] for x in regressions]
+    assert abs(regressions[0][2] - 2) < 1e-9
@@ -0,0 +1,62 @@
+import os, subprocess, sys
+
+import numpy as np
+
+from characteristics_cache import Characteristics_Cache
+from trip_characteristics import Trip_Characteristics
+
+
+def test_key_lookup_writes_alias_once(plan):
+    cache = Characteristics_Cache(plan.hw.store)
+
+    key = cache.get_key(plan)
+    changes = cache._dbconn.total_changes
+
+    assert key == cache.get_key(plan)
+    assert changes == cache._dbconn.total_changes
+    assert key == cache.get_key_by_alias(
+        cache.get_alias(plan.route.filename, plan.get_parameters(),
+                        plan.departure_hour, type(plan).__name__))
+
+
+def _fail(weather):
+    raise AssertionError("cached day is computed again")
+
+
+def test_cached_days_are_not_computed_again(plan):
+    res = Trip_Characteristics().compute_historical(plan)
+
+    # every day is served by the cache
+    plan._compute_plan = _fail
+    cached = Trip_Characteristics().compute_historical(plan)
+
+    assert 8 == len(res)
+    assert res.equals(cached)
+
+
+def test_percentile_rank_matches_brute_force(plan):
+    tc = Trip_Characteristics()
+    tc.update_rank_index(plan)
+
+    cache = Characteristics_Cache(plan.hw.store)
+    key = cache.get_key(plan)
+    times = np.array(tc.compute_historical(plan)['time'])
+
+    assert cache.is_rank_index_valid(key)
+    for x in np.r_[times, times.min() - 1, times.max() + 1, times.mean()]:
+        assert cache.percentile_rank(key, 'time', x) == 100*np.sum(times < x)/len(times)
+
+
+def test_cache_is_read_without_pandas():
+    # the cached lookup of the command line does not import pandas
+    import characteristics_cache
+
+    code = ("import sys; sys.path.insert(0, %r);"
+            "import characteristics_cache, weather_store;"
+            "print('pandas' in sys.modules or 'numpy' in sys.modules)"
+            % os.path.dirname(characteristics_cache.__file__))
+
+    res = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE,
+                         check=True, universal_newlines=True)
+
+    assert "False" == res.stdout.strip()
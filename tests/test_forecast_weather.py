@@ -0,0 +1,96 @@
+import datetime, threading, time
+
+from synthetic import generate_gpx
+
+from route import Route
+from weather_store import Weather_Store
+from historical_weather import Historical_Weather
+from forecast_weather import Forecast_Weather
+from weather_provider import Recorded_Response
+from physical_models import Plan_With_Constant_Power
+
+
+class Changing_Provider(object):
+    """Hourly forecast of today and tomorrow, the wind from 8 o'clock
+    tomorrow is set by wind_speed
+
+    """
+
+    def __init__(self):
+        self.wind_speed = 3
+
+    def forecast(self, key, latitude, longitude, time=None, units="si"):
+        midnight = datetime.datetime.combine(datetime.date.today(), datetime.time())
+        midnight = int(midnight.timestamp())
+
+        data = [{'time': midnight + 3600*h,
+                 'summary': "Clear",
+                 'precipIntensity': 0,
+                 'precipProbability': 0,
+                 'temperature': 15,
+                 'humidity': 0.6,
+                 'pressure': 1013,
+                 'windSpeed': 3 if h < 32 else self.wind_speed,
+                 'windBearing': 270}
+                for h in range(48)]
+
+        return Recorded_Response({'hourly': {'data': data}, 'daily': {'data': []}}, {})
+
+
+def test_refreshed_forecast_replans_from_the_changed_weather(tmp_path):
+    route = Route(generate_gpx(str(tmp_path / "route.gpx"), length=30000, spacing=300))
+    coordinates = route.get_short_coordinates()
+    store = Weather_Store(str(tmp_path / "weather.db"))
+    provider = Changing_Provider()
+
+    hw = Historical_Weather(coordinates, None, store=store, sample_size=1)
+    wf = Forecast_Weather(coordinates, None, store=store, weather_provider=provider)
+    plan = Plan_With_Constant_Power(7, route, hw, wf)
+
+    assert plan.update_plan(1)[1] is None
+
+    # a newer forecast with stronger wind from 8 o'clock
+    now = wf._get_current_time()
+    provider.wind_speed = 8
+    wf._get_current_time = lambda: now + 3600
+    wf.query_darksky_weather()
+
+    weather = wf.forecast(1)
+    assert 24*len(coordinates) == len(weather)
+    assert (weather['forecast_time'] == now + 3600).all()
+
+    _, changes = plan.update_plan(1)
+    state = plan._forecast_states[1]
+    assert 1 < state['start'] < len(state['times'])
+    assert len(changes) > 0
+    assert (changes['point_no'] >= state['start']).all()
+
+    # old forecasts are purged
+    wf._get_current_time = lambda: now + 3600*300
+    wf.query_darksky_weather()
+    assert 2*24*len(coordinates) == len(wf.query_local_weather())
+
+
+def test_database_is_initialised_before_it_is_used(tmp_path, route):
+    store = Weather_Store(str(tmp_path / "weather.db"))
+    wf = Forecast_Weather(route.get_short_coordinates(), None, store=store)
+
+    res = []
+    init_database = wf._init_database
+
+    def slow_init_database():
+        res.append(wf._connection)
+        time.sleep(0.1)
+        init_database()
+
+    wf._init_database = slow_init_database
+
+    threads = [threading.Thread(target=lambda: wf._dbconn) for i in range(2)]
+    for x in threads:
+        x.start()
+    for x in threads:
+        x.join()
+
+    # the connection is published once the table exists
+    assert [None] == res
+    assert store.connection is wf._connection
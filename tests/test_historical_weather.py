@@ -0,0 +1,45 @@
+import datetime
+
+from synthetic import generate_gpx, Synthetic_Provider
+
+from route import Route
+from historical_weather import Historical_Weather
+from iterators import Iter_Historical_Weather
+
+
+class Failing_Provider(Synthetic_Provider):
+    """Synthetic weather failing after a number of queries
+
+    """
+
+    def __init__(self, calls):
+        super(Failing_Provider, self).__init__(seed=0)
+        self.calls = calls
+
+    def forecast(self, **kwargs):
+        if 0 == self.calls:
+            raise RuntimeError("Service unavailable")
+        self.calls -= 1
+
+        return super(Failing_Provider, self).forecast(**kwargs)
+
+
+def test_interrupted_fetch_completes_days_one_by_one(tmp_path):
+    route = Route(generate_gpx(str(tmp_path / "route.gpx"), length=12000, spacing=200))
+    coordinates = route.get_short_coordinates()
+    n = len(coordinates)
+    assert n > 1
+
+    hw = Historical_Weather(coordinates, None, filename=str(tmp_path / "weather.db"),
+                            sample_size=6, sample_seed=0,
+                            sample_current_date=datetime.datetime(2019, 6, 1, 12),
+                            weather_provider=Failing_Provider(2*n + 1))
+
+    assert not hw.query_darksky_weather()
+    assert len(hw.complete_days()) == 2
+    assert Iter_Historical_Weather(hw).n == 2
+
+    # the partially queried day is finished before a new one is started
+    hw._weather_provider = Failing_Provider(n - 1)
+    assert not hw.query_darksky_weather()
+    assert len(hw.complete_days()) == 3
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from synthetic import generate_gpx, generate_weather_db
+
+from route import Route
+from iterators import Iter_Historical_Weather
+from physical_models import Plan_With_Constant_Power
+from power_profiles import Power_Profile, Fatigue_Profile, Climb_Profile, \
+    Rest_Stops_Profile, Combined_Profile
+
+pytest.importorskip("numba")
+
+
+@pytest.mark.parametrize("profile", [
+    Power_Profile(),
+    Combined_Profile(Fatigue_Profile(time_constant=4), Climb_Profile(),
+                     Rest_Stops_Profile(interval=0.25, duration=10))])
+def test_numba_and_numpy_plans_are_identical(tmp_path, profile):
+    route = Route(generate_gpx(str(tmp_path / "route.gpx"), length=30000, spacing=300))
+    hw = generate_weather_db(str(tmp_path / "weather.db"),
+                             route.get_short_coordinates(), n_days=2)
+    ihw = Iter_Historical_Weather(hw)
+
+    for date in ihw.get_dates():
+        weather = ihw.query_date(date)
+        x = Plan_With_Constant_Power(7, route, hw, None, backend="numpy",
+                                     power_profile=profile)._compute_plan(weather)
+        y = Plan_With_Constant_Power(7, route, hw, None, backend="numba",
+                                     power_profile=profile)._compute_plan(weather)
+
+        # the vectorised arctan2 and arccos of numpy may differ from
+        # the ones of the compiled code in the last bit
+        assert np.array_equal(x.weather_index, y.weather_index)
+        np.testing.assert_allclose(x.time, y.time, rtol=1e-12, atol=0)
+        np.testing.assert_allclose(x.speed, y.speed, rtol=1e-12, atol=0)
@@ -0,0 +1,43 @@
+import datetime
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+from synthetic import generate_weather_db
+
+from local_time import Local_Time, EPOCH_ORDINAL
+from historical_weather import Historical_Weather
+
+
+def _get_keys(time, timezone):
+    """Day and hour keys computed row by row
+
+    """
+    res = [datetime.datetime.fromtimestamp(x, ZoneInfo(timezone)) for x in time]
+
+    return ([x.toordinal() - EPOCH_ORDINAL for x in res], [x.hour for x in res])
+
+
+def test_keys_follow_daylight_saving_time():
+    # hours around the change to summer time in Berlin
+    time = int(datetime.datetime(2021, 3, 27, tzinfo=datetime.timezone.utc).timestamp())
+    time = time + 3600*np.arange(72)
+
+    day, hour = Local_Time("Europe/Berlin").time_keys(time)
+
+    assert (day.tolist(), hour.tolist()) == _get_keys(time, "Europe/Berlin")
+    assert 2 not in hour[(day == Local_Time().day((2021, 3, 28)))]
+
+
+def test_keys_are_recomputed_for_another_timezone(tmp_path, route):
+    coordinates = route.get_short_coordinates()
+    filename = str(tmp_path / "weather.db")
+    generate_weather_db(filename, coordinates, n_days=3).store.close()
+
+    for timezone in ["Pacific/Auckland", "America/New_York"]:
+        hw = Historical_Weather(coordinates, None, filename=filename,
+                                timezone=timezone)
+        time, day, hour = zip(*hw.store.fetch('''SELECT time, day, hour FROM weather'''))
+        hw.store.close()
+
+        assert (list(day), list(hour)) == _get_keys(time, timezone)
@@ -0,0 +1,44 @@
+import logging
+
+import numpy as np
+
+from synthetic import generate_gpx, generate_weather_db
+
+from route import Route
+from physical_models import Plan_With_Constant_Power
+from weather_archive import Weather_Archive
+from monte_carlo import Monte_Carlo_Trip_Time
+
+
+def _get_simulation(tmp_path, length, block_hours):
+    route = Route(generate_gpx(str(tmp_path / "route.gpx"), length=length, spacing=500))
+    hw = generate_weather_db(str(tmp_path / "weather.db"),
+                             route.get_short_coordinates(), n_days=6)
+    archive = Weather_Archive(str(tmp_path / "archive")).write(hw)
+    plan = Plan_With_Constant_Power(7, route, hw, None)
+
+    return Monte_Carlo_Trip_Time(plan, archive, block_hours=block_hours, seed=0)
+
+
+def test_blocks_start_at_the_departure_hour(tmp_path):
+    simulation = _get_simulation(tmp_path, 12000, 3)
+    weather = simulation._weather['windSpeed']
+    sample = simulation.sample_weather(20)['windSpeed']
+
+    for x in sample:
+        for hours in [slice(7, 10), slice(10, 13), slice(4, 7)]:
+            assert any(np.array_equal(x[hours], y[hours]) for y in weather)
+
+
+def test_short_trips_are_warned(tmp_path, caplog):
+    with caplog.at_level(logging.WARNING):
+        simulation = _get_simulation(tmp_path, 12000, 3)
+        simulation.simulate(10)
+    assert any("shorter than a block" in x.getMessage() for x in caplog.records)
+
+    caplog.clear()
+    with caplog.at_level(logging.WARNING):
+        simulation = _get_simulation(tmp_path, 60000, 1)
+        times = simulation.simulate(10)
+    assert (times > 3600).all()
+    assert not any("shorter than a block" in x.getMessage() for x in caplog.records)
@@ -0,0 +1,43 @@
+import numpy as np
+
+from iterators import Iter_Historical_Weather
+
+
+def _get_weather(plan):
+    ihw = Iter_Historical_Weather(plan.hw)
+    return ihw.query_date(ihw.get_dates()[0])
+
+
+def test_plan_frame_has_speed(plan):
+    res = plan._compute_plan(_get_weather(plan))
+    x = res.to_pandas()
+
+    assert "speed" in x
+    assert np.isnan(x['speed'].iloc[0])
+    assert np.allclose(x['speed'].values[1:], res.speed[1:])
+    assert (x['speed'].values[1:] > 0).all()
+
+
+def test_drag_depends_on_the_apparent_wind(plan):
+    v = np.array([8.0])
+
+    # without wind the apparent wind is the bike speed at zero yaw
+    force, _ = plan._compute_drag(v, 1.2, np.zeros(1), np.zeros(1))
+    assert np.allclose(force, 1.2/2*plan._C_D*v*v)
+
+    cross, _ = plan._compute_drag(v, 1.2, np.zeros(1), np.full(1, 4.0))
+    assert (cross > force).all()
+
+    # the derivative by the speed matches the finite difference
+    _, derivative = plan._compute_drag(v, 1.2, np.full(1, 2.0), np.full(1, 4.0))
+    h = 1e-6
+    x = (plan._compute_drag(v + h, 1.2, np.full(1, 2.0), np.full(1, 4.0))[0] -
+         plan._compute_drag(v - h, 1.2, np.full(1, 2.0), np.full(1, 4.0))[0])/(2*h)
+    assert np.allclose(derivative, x, rtol=1e-5)
+
+
+def test_humid_air_is_lighter(plan):
+
+    dry, humid = plan._compute_air_density(101325, 293.15, np.array([0, 0.9]))
+    assert abs(dry - 1.204) < 0.001
+    assert humid < dry
@@ -0,0 +1,25 @@
+import logging
+
+import numpy as np
+
+from iterators import Iter_Historical_Weather
+from plan_archive import Plan_Archive
+
+
+def test_archive_stores_plans_of_every_day(tmp_path, plan, caplog, capsys):
+
+    with caplog.at_level(logging.INFO):
+        archive = Plan_Archive(str(tmp_path / "archive")).write(plan)
+
+    # progress is logged, not printed
+    assert "" == capsys.readouterr().out
+    assert any("progress" in x.getMessage() for x in caplog.records)
+
+    ihw = Iter_Historical_Weather(plan.hw)
+    assert (8, len(plan.route.get_join_coordinates())) == archive.time.shape
+    assert archive.days['valid'].all()
+
+    for i, date in enumerate(ihw.get_dates()):
+        x = plan._compute_plan(ihw.query_date(date))
+        assert np.array_equal(archive.time[i], x.time)
+        assert np.allclose(archive.days['trip_time'][i], x.time[-1] - x.time[0])
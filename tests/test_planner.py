@@ -0,0 +1,50 @@
+import datetime
+
+import numpy as np
+
+from synthetic import generate_gpx, Synthetic_Provider, _weather_at_day
+from weather_provider import Recorded_Response
+
+from planner import Planner
+
+
+class Uniform_Provider(Synthetic_Provider):
+    """Synthetic weather that is the same at all coordinates
+
+    """
+
+    def forecast(self, key, latitude, longitude, time=None, units="si"):
+        rng = np.random.RandomState(int(time) % 2**31)
+        return Recorded_Response(
+            {'hourly': {'data': _weather_at_day((0, 0), int(time), rng)},
+             'daily': {'data': []}},
+            {})
+
+
+def _get_planner(filename):
+    return Planner(filename, None, weather_provider=Uniform_Provider(),
+                   sample_size=5, sample_seed=0,
+                   sample_current_date=datetime.datetime(2019, 6, 1, 12))
+
+
+def test_merged_clusters_are_kept_after_reload(tmp_path):
+    filename = generate_gpx(str(tmp_path / "route.gpx"), length=12000, spacing=200)
+
+    planner = _get_planner(filename)
+    n = len(planner.route.get_short_coordinates())
+    per_coordinate = planner.weather_forecast.daily_calls()//n
+    assert n > 1
+
+    planner.historical_weather.query_darksky_weather()
+    removed = planner.merge_identical_weather(min_days=5)
+
+    assert len(removed) == n - 1
+    assert len(planner.route.get_short_coordinates()) == 1
+    assert planner.quota_ledger.forecast_reserve == per_coordinate
+
+    # the merges are read from the weather database
+    planner = _get_planner(filename)
+    assert len(planner.route.get_short_coordinates()) == 1
+    assert len(planner.historical_weather.coordinates) == 1
+    assert len(planner.weather_forecast.coordinates) == 1
+    assert planner.quota_ledger.forecast_reserve == per_coordinate
@@ -0,0 +1,33 @@
+import numpy as np
+
+from iterators import Iter_Historical_Weather
+from physical_models import Plan_With_Constant_Power
+from power_profiles import Fatigue_Profile, Rest_Stops_Profile, Combined_Profile
+
+
+def test_time_table_matches_the_profile(route, historical_weather):
+    profile = Combined_Profile(Fatigue_Profile(time_constant=4),
+                               Rest_Stops_Profile(interval=0.5, duration=10))
+    plan = Plan_With_Constant_Power(7, route, historical_weather, None,
+                                    backend="numpy", power_profile=profile)
+
+    riding = np.linspace(0, 20*3600, 1001)
+    factor, rest = plan._lookup_time_table(riding)
+
+    assert np.allclose(factor, profile.time_factor(riding), rtol=1e-6, atol=0)
+    assert np.array_equal(rest, profile.rest_time(riding))
+
+    # scalars are looked up as well
+    assert rest[500] == plan._lookup_time_table(riding[500])[1]
+
+
+def test_rest_stops_add_their_duration(route, historical_weather):
+    plan = Plan_With_Constant_Power(7, route, historical_weather, None, backend="numpy",
+                                    power_profile=Rest_Stops_Profile(interval=0.25, duration=10))
+    ihw = Iter_Historical_Weather(plan.hw)
+    state = plan._compute_plan_state(ihw.query_date(ihw.get_dates()[0]))
+    riding = state['riding'][-1]
+
+    assert riding > 900
+    assert np.isclose(state['times'][-1] - state['times'][0],
+                      riding + 600*np.floor(riding/900))
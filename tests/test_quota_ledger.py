@@ -0,0 +1,63 @@
+import datetime
+
+from synthetic import generate_gpx
+
+from route import Route
+from quota_ledger import DAILY_LIMIT, Quota_Ledger, Backfill_Scheduler
+from weather_store import Weather_Store
+from historical_weather import Historical_Weather
+from forecast_weather import Forecast_Weather
+from planner import Planner
+from cli import get_parser
+
+
+def test_daily_limit_defaults_agree(tmp_path):
+    filename = generate_gpx(str(tmp_path / "route.gpx"), length=12000, spacing=300)
+    coordinates = Route(filename).get_short_coordinates()
+
+    hw = Historical_Weather(coordinates, None, filename=str(tmp_path / "weather.db"),
+                            sample_size=5,
+                            sample_current_date=datetime.datetime(2019, 6, 1, 12))
+    wf = Forecast_Weather(coordinates, None, filename=str(tmp_path / "weather.db"))
+    planner = Planner(filename, None, sample_size=5,
+                      sample_current_date=datetime.datetime(2019, 6, 1, 12))
+    args = get_parser().parse_args(["fetch", filename])
+
+    assert DAILY_LIMIT == hw.quota_ledger.daily_limit
+    assert DAILY_LIMIT == wf.quota_ledger.daily_limit
+    assert DAILY_LIMIT == planner.quota_ledger.daily_limit
+    assert DAILY_LIMIT == args.daily_limit
+
+
+def test_ledgers_share_the_daily_limit(tmp_path):
+    ledgers = [Quota_Ledger(Weather_Store(str(tmp_path / "quota.db")), "key",
+                            daily_limit=10, forecast_reserve=4) for i in range(2)]
+
+    # historical weather leaves the calls reserved for the forecasts
+    assert ledgers[0].reserve("historical", 5)
+    assert not ledgers[1].reserve("historical", 2)
+    assert ledgers[1].reserve("historical", 1)
+
+    assert ledgers[1].reserve("forecast", 4)
+    assert not ledgers[0].reserve("forecast")
+    assert {'historical': 6, 'forecast': 4, 'reported': 0} == ledgers[0].usage()
+
+    # the usage reported by the API counts as well
+    other = Quota_Ledger(Weather_Store(str(tmp_path / "quota.db")), "other",
+                         daily_limit=10)
+    other.report(10)
+    assert not other.reserve("forecast")
+    assert 0 == other.available("historical")
+
+
+def test_scheduled_days_fit_into_the_allowance(tmp_path):
+    ledger = Quota_Ledger(Weather_Store(str(tmp_path / "quota.db")), "key",
+                          daily_limit=20, forecast_reserve=5)
+    ledger.reserve("historical", 3)
+    scheduler = Backfill_Scheduler(ledger)
+
+    # 12 calls are left, days are taken whole in the order given
+    assert [1, 3] == scheduler.schedule([(1, 8), (2, 6), (3, 4)])
+    assert 0 == scheduler.days_to_complete(0)
+    assert 1 == scheduler.days_to_complete(12)
+    assert 3 == scheduler.days_to_complete(12 + 16)
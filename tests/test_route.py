@@ -0,0 +1,77 @@
+import numpy as np
+
+from synthetic import generate_gpx
+
+from route import Route
+
+
+def _project_brute_force(index, latitude, longitude):
+    """Distance from a position to the closest segment of the route
+
+    """
+    x, y = index._to_planar(latitude, longitude)
+
+    return index._project_segments(x, y, np.arange(len(index._length2)))[1].min()
+
+
+def test_projection_finds_the_closest_segment(tmp_path):
+    route = Route(generate_gpx(str(tmp_path / "route.gpx"), length=20000, spacing=200))
+    index = route.get_projection_index(cell_size=100)
+    segments = route.get_segments()
+
+    # positions near the route and far away from it
+    rng = np.random.RandomState(0)
+    for scale in [0.0005, 0.005, 0.05]:
+        for i in rng.randint(0, len(segments), 20):
+            latitude = segments['latitude'][i] + rng.normal(0, scale)
+            longitude = segments['longitude'][i] + rng.normal(0, scale)
+
+            res = index.project(latitude, longitude)
+            assert np.isclose(res['distance'],
+                              _project_brute_force(index, latitude, longitude))
+
+            # the projected position lies at the returned distance
+            x, y = index._to_planar([latitude, res['latitude']],
+                                    [longitude, res['longitude']])
+            assert np.isclose(np.hypot(*np.diff([x, y])), res['distance'], atol=0.01)
+
+
+def test_projection_follows_the_previous_position(tmp_path):
+    route = Route(generate_gpx(str(tmp_path / "route.gpx"), length=12000, spacing=200))
+    view = route.get_view("out_and_back")
+    index = view.get_projection_index()
+    segments = route.get_segments()
+    length = index.length()
+
+    latitude, longitude = segments['latitude'][20], segments['longitude'][20]
+
+    # the way out and the way back pass the same place
+    out = index.project(latitude, longitude, previous_offset=0)
+    back = index.project(latitude, longitude, previous_offset=length/2)
+
+    assert out['offset'] < length/2 < back['offset']
+    assert np.isclose(out['offset'] + back['offset'], length)
+
+
+def test_reversed_view_matches_the_reversed_gpx(tmp_path):
+    route = Route(generate_gpx(str(tmp_path / "route.gpx"), length=12000, spacing=200))
+    x = route.get_coordinates().sort_values('point_no').iloc[::-1]
+
+    with open(str(tmp_path / "reversed.gpx"), "w") as f:
+        f.write('<?xml version="1.0"?>\n'
+                '<gpx xmlns="http://www.topografix.com/GPX/1/1"><rte>\n')
+        for y in zip(x['latitude'], x['longitude'], x['elevation'].astype(float)):
+            f.write('<rtept lat="%.6f" lon="%.6f"><ele>%.1f</ele></rtept>\n' % y)
+        f.write('</rte></gpx>\n')
+
+    view = route.get_view("reversed").get_segments()
+    reversed_route = Route(str(tmp_path / "reversed.gpx")).get_segments()
+
+    for c in ['latitude','longitude','distance','slope']:
+        assert np.allclose(view[c], reversed_route[c])
+
+    assert (view['slope'][1:] == -route.get_segments()['slope'][:0:-1].values).all()
+
+    # bearings are flipped, up to the curvature of the short segments
+    difference = (view['bearing'] - reversed_route['bearing'] + 180) % 360 - 180
+    assert np.abs(difference).max() < 0.01
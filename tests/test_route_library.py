@@ -0,0 +1,55 @@
+import datetime
+
+import numpy as np
+
+from synthetic import generate_gpx, Synthetic_Provider
+
+from route_library import Route_Library
+from power_profiles import Fatigue_Profile
+from trip_characteristics import Trip_Characteristics
+
+
+def _get_library(tmp_path):
+    # the first 12 km of the routes are identical
+    routes = [generate_gpx(str(tmp_path / "a.gpx"), length=12000, spacing=300),
+              generate_gpx(str(tmp_path / "b.gpx"), length=18000, spacing=300)]
+
+    return Route_Library(routes, None, filename=str(tmp_path / "weather.db"),
+                         weather_provider=Synthetic_Provider(),
+                         sample_size=4, sample_seed=0,
+                         sample_current_date=datetime.datetime(2019, 6, 1, 12))
+
+
+def test_routes_share_weather_cells(tmp_path):
+    library = _get_library(tmp_path)
+    cells = library.cells.get_short_coordinates()
+    assert len(cells) < sum(len(x.get_short_coordinates()) for x in library.routes.values())
+
+    library.historical_weather.query_darksky_weather()
+    assert 4 == len(library.historical_weather.complete_days())
+
+    plans = library.get_plans([6, 9])
+    res = library.compute_historical(plans, use_cache=False, workers=1)
+
+    assert 4 == len(res)
+    for plan, x in zip(plans, res):
+        expected = Trip_Characteristics().compute_historical(plan, use_cache=False)
+        assert list(expected['date']) == list(x['date'])
+        assert np.allclose(expected['time'], x['time'])
+
+
+def test_workers_keep_the_power_profile(tmp_path):
+    library = _get_library(tmp_path)
+    library.historical_weather.query_darksky_weather()
+
+    plans = library.get_plans([7], power_profile=Fatigue_Profile(time_constant=0.1,
+                                                                 min_fraction=0.2))
+    res = library.compute_historical(plans, workers=1)
+
+    for plan, x in zip(plans, res):
+        expected = Trip_Characteristics().compute_historical(plan, use_cache=False)
+        assert np.allclose(expected['time'], x['time'])
+
+        # the cached characteristics are the ones of the profile
+        cached = Trip_Characteristics().compute_historical(plan)
+        assert np.allclose(expected['time'], cached['time'])
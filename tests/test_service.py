@@ -0,0 +1,108 @@
+import datetime, threading
+
+from synthetic import generate_gpx
+
+from service import Planning_Service
+from weather_provider import Recorded_Response
+
+
+class Changing_Provider(object):
+    """Hourly forecast of today and tomorrow with a given wind
+
+    """
+
+    def __init__(self):
+        self.wind_speed = 3
+
+    def forecast(self, key, latitude, longitude, time=None, units="si"):
+        midnight = datetime.datetime.combine(datetime.date.today(), datetime.time())
+        midnight = int(midnight.timestamp())
+
+        data = [{'time': midnight + 3600*h,
+                 'summary': "Clear",
+                 'precipIntensity': 0,
+                 'precipProbability': 0,
+                 'temperature': 15,
+                 'humidity': 0.6,
+                 'pressure': 1013,
+                 'windSpeed': self.wind_speed,
+                 'windBearing': 270}
+                for h in range(48)]
+
+        return Recorded_Response({'hourly': {'data': data}, 'daily': {'data': []}}, {})
+
+
+def test_reads_run_in_parallel():
+    service = Planning_Service(None, workers=2)
+    barrier = threading.Barrier(2, timeout=10)
+
+    def wait():
+        return barrier.wait()
+
+    res = []
+    threads = [threading.Thread(target=lambda: res.append(service.submit(wait)))
+               for i in range(2)]
+    for x in threads:
+        x.start()
+    for x in threads:
+        x.join()
+    service.stop()
+
+    # the barrier is passed only in case both reads run at once
+    assert [0, 1] == sorted(res)
+
+
+def test_refresh_drops_plans_of_the_old_forecast(tmp_path):
+    route_file = generate_gpx(str(tmp_path / "route.gpx"), length=12000, spacing=300)
+    provider = Changing_Provider()
+    service = Planning_Service(None, weather_provider=provider)
+
+    try:
+        service.submit(service.load, route_file)
+        before = service.submit(service.plan, route_file, departure_hour=7)
+        assert before == service.submit(service.plan, route_file, departure_hour=7)
+
+        provider.wind_speed = 10
+        assert [service._get_route_key(route_file)] == \
+            service.submit(service.refresh, force=True)
+
+        after = service.submit(service.plan, route_file, departure_hour=7)
+        assert before != after
+    finally:
+        service.stop()
+
+
+def test_responses_computed_during_a_refresh_are_not_kept(tmp_path):
+    route_file = generate_gpx(str(tmp_path / "route.gpx"), length=12000, spacing=300)
+    service = Planning_Service(None, weather_provider=Changing_Provider())
+
+    try:
+        service.submit(service.load, route_file)
+        key = service._get_route_key(route_file)
+
+        def refreshed():
+            service._drop_results(key)
+            return 1
+
+        assert 1 == service._cached(route_file, 'test', (), refreshed)
+        assert 2 == service._cached(route_file, 'test', (), lambda: 2)
+        assert [2] == list(service._results.values())
+        assert list(service._results) == list(service._result_locks)
+    finally:
+        service.stop()
+
+
+def test_responses_of_an_old_day_are_dropped(tmp_path):
+    route_file = generate_gpx(str(tmp_path / "route.gpx"), length=12000, spacing=300)
+    service = Planning_Service(None)
+
+    try:
+        key = service._get_route_key(route_file)
+        today = service.submit(service._get_planner, route_file)\
+                       .weather_forecast.local_time.today()
+        service._results[(key, 'test', (), 0, today - 1)] = 1
+
+        assert 2 == service.submit(service._cached, route_file, 'test', (), lambda: 2)
+        assert [2] == list(service._results.values())
+    finally:
+        service.stop()
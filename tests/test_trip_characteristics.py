@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+from iterators import Iter_Historical_Weather
+from trip_characteristics import Trip_Characteristics
+
+
+def _get_characteristics(plan):
+    """Characteristics of a single plan computed column by column
+
+    """
+    x = plan[['w_time','w_precipProbability','w_precipIntensity']]\
+        .drop_duplicates(subset="w_time")
+
+    res = {'time': plan['time'].max() - plan['time'].min(),
+           'w_precipProbability': 1 - (1 - x.w_precipProbability).prod(min_count=1),
+           'w_precipIntensity': x.w_precipIntensity.sum(min_count=1),
+           'summary': plan.w_summary.value_counts().idxmax()}
+
+    for column in Trip_Characteristics._column_quantities:
+        res[column + "_Min"] = plan[column].min()
+        res[column + "_Max"] = plan[column].max()
+        res[column + "_Average"] = plan[column].mean()
+
+    return res
+
+
+def test_aggregate_matches_characteristics_of_every_plan(plan):
+    ihw = Iter_Historical_Weather(plan.hw)
+    tc = Trip_Characteristics()
+
+    plans = [plan._compute_plan(ihw.query_date(x)).to_pandas() for x in ihw.get_dates()]
+    res = tc.aggregate(pd.concat([x.assign(day=i) for i, x in enumerate(plans)],
+                                 ignore_index=True))
+
+    assert len(plans) == len(res)
+    for i, x in enumerate(plans):
+        expected = _get_characteristics(x)
+        assert res.loc[i, 'date'] == tc._compute_journey_date(x)
+        assert res.loc[i, 'summary'] == expected.pop('summary')
+        assert np.allclose(res.loc[i, list(expected)].astype(float),
+                           list(expected.values()))
+
+
+class Interrupted_Plan(object):
+    """Plan computation failing after a number of days
+
+    """
+
+    def __init__(self, compute_plan, days):
+        self.compute_plan = compute_plan
+        self.days = days
+        self.computed = 0
+
+    def __call__(self, weather):
+        if self.computed == self.days:
+            raise RuntimeError("interrupted")
+        self.computed += 1
+
+        return self.compute_plan(weather)
+
+
+def test_interrupted_output_is_resumed(tmp_path, plan):
+    compute_plan = plan._compute_plan
+    output = str(tmp_path / "output")
+    tc = Trip_Characteristics()
+
+    # the first batch is written before the interruption
+    plan._compute_plan = Interrupted_Plan(compute_plan, 4)
+    try:
+        tc.compute_historical(plan, use_cache=False, output=output, batch_size=3)
+    except RuntimeError:
+        pass
+
+    plan._compute_plan = Interrupted_Plan(compute_plan, 5)
+    res = tc.compute_historical(plan, use_cache=False, output=output, batch_size=3)
+
+    plan._compute_plan = compute_plan
+    expected = tc.compute_historical(plan, use_cache=False)
+
+    assert list(expected['date']) == list(res['date'])
+    assert np.allclose(expected['time'], res['time'])
@@ -0,0 +1,23 @@
+import numpy as np
+
+from iterators import Iter_Historical_Weather
+from weather_archive import Weather_Archive, NUMERIC_VARIABLES, TEXT_VARIABLES
+
+
+def test_archived_weather_is_within_the_quantization_step(tmp_path, historical_weather):
+    archive = Weather_Archive(str(tmp_path / "archive")).write(historical_weather)
+
+    ihw = Iter_Historical_Weather(historical_weather)
+    for i, date in enumerate(ihw.get_dates()):
+        expected = ihw.query_date(date)
+        x = archive.get_weather(i).merge(expected, on=['latitude','longitude','time'],
+                                         suffixes=('', '_db'))
+
+        assert len(expected) == len(x)
+        for variable, (scale, offset) in NUMERIC_VARIABLES.items():
+            db = x[variable + '_db'].astype(float).values
+            assert np.array_equal(np.isnan(x[variable].values), np.isnan(db))
+            assert np.nanmax(np.abs(x[variable].values - db)) <= scale/2 + 1e-9
+
+        for variable in TEXT_VARIABLES:
+            assert (x[variable].fillna('') == x[variable + '_db'].fillna('')).all()
@@ -0,0 +1,37 @@
+import datetime
+
+import pytest
+
+from synthetic import Synthetic_Provider
+
+from historical_weather import Historical_Weather
+from weather_provider import Recording_Provider, Replay_Provider
+
+
+def _fetch(tmp_path, route, name, provider):
+    hw = Historical_Weather(route.get_short_coordinates(), None,
+                            filename=str(tmp_path / name),
+                            sample_size=4, sample_seed=0,
+                            sample_current_date=datetime.datetime(2019, 6, 1, 12),
+                            weather_provider=provider)
+    hw.query_darksky_weather()
+
+    return hw.query_local_weather().drop(columns=['id'])
+
+
+def test_replay_stores_the_recorded_weather(tmp_path, route):
+    recordings = str(tmp_path / "recordings")
+
+    recorded = _fetch(tmp_path, route, "recorded.db",
+                      Recording_Provider(recordings, Synthetic_Provider()))
+    replayed = _fetch(tmp_path, route, "replayed.db", Replay_Provider(recordings))
+
+    assert 4*24 <= len(recorded)
+    assert recorded.equals(replayed)
+
+
+def test_replay_injects_errors(tmp_path):
+    provider = Replay_Provider(str(tmp_path), error_rate=1)
+
+    with pytest.raises(RuntimeError):
+        provider.forecast(None, 50.0, 6.0, 1559390400)
@@ -0,0 +1,70 @@
+import datetime, sqlite3, threading
+
+from synthetic import generate_gpx, Synthetic_Provider
+
+from planner import Planner
+from characteristics_cache import Characteristics_Cache
+from trip_characteristics import Trip_Characteristics
+
+
+def _get_planner(tmp_path):
+    return Planner(generate_gpx(str(tmp_path / "route.gpx"), length=12000, spacing=300),
+                   None, weather_provider=Synthetic_Provider(seed=0), sample_size=3,
+                   sample_current_date=datetime.datetime(2019, 6, 1, 12))
+
+
+def test_database_has_a_single_writer(tmp_path, monkeypatch):
+    connections = []
+    connect = sqlite3.connect
+
+    def counting_connect(*args, **kwargs):
+        connections.append(args[0])
+        return connect(*args, **kwargs)
+
+    monkeypatch.setattr(sqlite3, "connect", counting_connect)
+
+    planner = _get_planner(tmp_path)
+    planner.historical_weather.query_darksky_weather()
+    planner.weather_forecast.query_darksky_weather()
+
+    plan = planner.get_plan("with_constant_power", starting_time=7)
+    Trip_Characteristics().update_rank_index(plan)
+    planner.quota_ledger.usage()
+
+    # the writer and the read connections of the store
+    store = planner.weather_store
+    assert 3 == len(planner.historical_weather.complete_days())
+    assert 1 + store._n_readers == len(connections)
+
+
+def test_reads_do_not_wait_for_writes(tmp_path):
+    planner = _get_planner(tmp_path)
+    planner.historical_weather.query_darksky_weather()
+    plan = planner.get_plan("with_constant_power", starting_time=7)
+    Trip_Characteristics().update_rank_index(plan)
+
+    store = planner.weather_store
+    cache = Characteristics_Cache(store)
+    key = cache.get_key(plan)
+
+    res = []
+    def read():
+        res.append((planner.historical_weather.complete_days(),
+                    planner.quota_ledger.usage(),
+                    cache.is_rank_index_valid(key)))
+
+    with store.write_lock:
+        store.connection.execute('''BEGIN IMMEDIATE''')
+        store.connection.execute('''DELETE FROM query_dates''')
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        reader.join(timeout=10)
+
+        store.connection.rollback()
+
+    # the reader sees the last committed state
+    assert 1 == len(res)
+    assert 3 == len(res[0][0])
+    assert 3*len(planner.route.get_short_coordinates()) == res[0][1]['historical']
+    assert res[0][2]